@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Compare KATch configurations on the same benchmarks, using per-statement traces.
+
+Every variant is a name and the extra command-line options it passes to
+`katch run`. Each benchmark file is run once per variant in its own JVM with
+`--trace`, and the traces are rolled up (by family by default) to compare the
+number of explored states, iterations, SPP nodes created and wall time against
+the first variant. Statements that pass in one variant and fail in another are reported.
+
+    python3 scripts/ab-trace.py --variant classic="--bisim classic" --variant uf="--bisim uf" \\
+        nkpl/fig11/inc nkpl/fig11/flip nkpl/fig11/nondet nkpl/fig10
+
+usage: ab-trace.py --variant NAME=OPTIONS [--variant ...] [--by family|input|stmt|line] [--timeout S] [--no-build] benchmarks...
+"""
+import argparse
+import glob
+import os
+import shlex
+import subprocess
+import sys
+
+from katch.jvm import ROOT, build, katch_command, scratch_dir
+from katch.trace import KEYS, load, rollup
+
+OUT = os.path.join(ROOT, 'results', 'ab')
+COMPARED = ['states', 'iterations', 'spp_nodes', 'wall']
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('benchmarks', nargs='+', help='.nkpl files or directories')
+    p.add_argument('--variant', action='append', required=True, metavar='NAME=OPTIONS', help='a configuration to compare')
+    p.add_argument('--by', choices=sorted(KEYS), default='family', help='what to group statements by')
+    p.add_argument('--timeout', type=float, help='per-file timeout in seconds')
+    p.add_argument('--mem', default='128g', help='maximum heap size')
+    p.add_argument('--no-build', action='store_true', help='use the existing assembly jar')
+    return p.parse_args()
+
+
+def benchmark_files(inputs):
+    files = []
+    for i in inputs:
+        files += [i] if i.endswith('.nkpl') else glob.glob(os.path.join(i, '**', '*.nkpl'), recursive=True)
+    return sorted(set(files))
+
+
+def run_variant(name, options, files, args):
+    trace = os.path.join(OUT, f'{name}.jsonl')
+    if os.path.exists(trace):
+        os.remove(trace)
+    for path in files:
+        cmd = katch_command(['run', '--trace', trace, *options, os.path.relpath(os.path.abspath(path), ROOT)], mem=args.mem)
+        try:
+            subprocess.run(cmd, cwd=scratch_dir('ab'), timeout=args.timeout, check=False,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except subprocess.TimeoutExpired:
+            print(f'  {name}: {path} timed out')
+    return load(trace) if os.path.exists(trace) else []
+
+
+def main():
+    args = parse_args()
+    variants = [v.split('=', 1) if '=' in v else (v, '') for v in args.variant]
+    if not args.no_build:
+        build()
+    os.makedirs(OUT, exist_ok=True)
+    files = benchmark_files(args.benchmarks)
+    traces = {}
+    for name, options in variants:
+        print(f'Running {len(files)} files with {name} ({options or "default options"})')
+        traces[name] = run_variant(name, shlex.split(options), files, args)
+
+    # Statements whose outcome differs between variants
+    outcomes = {}
+    for name, records in traces.items():
+        for r in records:
+            outcomes.setdefault((r['file'], r['line'], r['run']), {})[name] = r['ok']
+    differing = [k for k, v in outcomes.items() if len(set(v.values())) > 1]
+    for k in differing:
+        print(f'Outcome differs at {k[0]}:{k[1]}: {outcomes[k]}')
+
+    base = variants[0][0]
+    rows = {name: {row['group']: row for row in rollup(records, args.by)} for name, records in traces.items()}
+    groups = sorted(rows[base], key=lambda g: -rows[base][g]['wall'])
+    header = ['group'] + [f'{c} {name}' for c in COMPARED for name, _ in variants] + \
+             [f'{c} {name}/{base}' for c in COMPARED for name, _ in variants[1:]]
+    table = [header]
+    for g in groups:
+        line = [g]
+        for c in COMPARED:
+            line += [f'{rows[name][g][c]:.3f}' if c == 'wall' and g in rows[name] else
+                     f'{rows[name][g][c]:.0f}' if g in rows[name] else '-' for name, _ in variants]
+        for c in COMPARED:
+            for name, _ in variants[1:]:
+                a, b = rows[base][g][c], rows[name].get(g, {}).get(c)
+                line.append(f'{b / a:.2f}' if b is not None and a else '-')
+        table.append(line)
+    widths = [max(len(r[i]) for r in table) for i in range(len(header))]
+    for r in table:
+        print('  '.join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(r, widths))))
+    print(f'\nTraces in {OUT}')
+    if differing:
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,6 @@
 #!/bin/bash
-for i in nkpl/fig09/naive-reachability/*; do ./katch compare 60s $i; done && \
-./katch run nkpl/fig09/linear-reachability && \
-./katch compare 48h nkpl/fig10-less-cogentco && \
-./katch compare 48h nkpl/fig11/flip-first11 && \
-./katch compare 48h nkpl/fig11/inc-first10 && \
-./katch compare 48h nkpl/fig11/nondet-first15 && \
+# The suites are listed in benchmarks.toml
+python3 scripts/run-suites.py --suite full-reachability --timeout full-reachability=60 --suite linear-reachability \
+  --suite topology-zoo-less-cogentco --suite flip --suite inc --suite nondet && \
 mkdir -p results/plots
 python3 scripts/genplots.py
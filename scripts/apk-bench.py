@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Compare KATch with and without `--quotient` against the APKeep times in `results/apk`.
+
+Runs the linear reachability benchmark of every network in
+`results/apk/apk_results.txt` (`nkpl/fig09/linear-reachability/<network>.nkpl`,
+the same queries as APKeep's) in one `katch serve` process per variant, with
+the caches cleared before every run, and reports the median time of the runs
+after `--warmup` warm-up runs next to APKeep's reachability time. A network
+whose run fails or takes longer than `--timeout` seconds is reported as such,
+and its variant is not run on larger networks. Exits with status 1 if the
+variants disagree on whether a network's checks pass.
+
+    python3 scripts/apk-bench.py --networks Airtel,Cogentco,Kdl
+
+usage: apk-bench.py [--networks N,...] [--variants name=OPTIONS ...] [--warmup N] [--runs N] [--timeout S]
+                    [--csv out.csv] [--no-build]
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import threading
+
+from katch import Client, KatchError
+from katch.jvm import ROOT, build, katch_command
+
+APK_RESULTS = os.path.join(ROOT, 'results', 'apk', 'apk_results.txt')
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--networks', help='comma-separated networks (default: all networks of results/apk/apk_results.txt)')
+    p.add_argument('--variants', nargs='*', default=['katch=', 'quotient=--quotient'],
+                   help='name=OPTIONS pairs, where OPTIONS are global KATch options')
+    p.add_argument('--warmup', type=int, default=3, help='runs per network that are not measured')
+    p.add_argument('--runs', type=int, default=5, help='measured runs per network')
+    p.add_argument('--timeout', type=float, default=600, help='seconds after which a run is cut off')
+    p.add_argument('--mem', default='16g', help='maximum heap size')
+    p.add_argument('--csv', default=os.path.join(ROOT, 'results', 'apk', 'quotient.csv'), help='where to write the measurements')
+    p.add_argument('--no-build', action='store_true', help='use the existing assembly jar')
+    return p.parse_args()
+
+
+def apkeep_times():
+    """APKeep's reachability time in milliseconds per network, in the order of the file."""
+    times = {}
+    with open(APK_RESULTS) as f:
+        for line in f:
+            m = re.match(r'\s*(\S+)\s*&\s*([\d.]+)\s*&\s*([\d.]+)', line)
+            if m:
+                times[m.group(1)] = float(m.group(3))
+    return times
+
+
+def measure(variant, options, paths, warmup, runs, timeout, mem):
+    """Median milliseconds per network of `paths`, or 'fail' or 'timeout'. Networks after a timeout are skipped."""
+    results = {}
+    client = Client(command=katch_command(['serve', *options, '--stdio'], mem=mem), cwd=ROOT)
+    try:
+        for name, path in paths.items():
+            times = []
+            timer = threading.Timer(timeout, client.proc.kill)
+            timer.start()
+            try:
+                for i in range(warmup + runs):
+                    client.request('clear')
+                    client.request('reset')
+                    t = client.load(path)['time']
+                    if i >= warmup:
+                        times.append(t * 1000)
+            except KatchError:
+                results[name] = 'fail'
+            except (EOFError, OSError, ValueError):
+                results[name] = 'timeout'
+            finally:
+                timer.cancel()
+            if name not in results:
+                results[name] = statistics.median(times)
+            print(f'{variant:10} {name:16} {results[name]:>12}' if isinstance(results[name], str) else f'{variant:10} {name:16} {results[name]:12.2f} ms')
+            if results[name] == 'timeout':
+                break
+    finally:
+        client.close()
+    return results
+
+
+def main():
+    args = parse_args()
+    apkeep = apkeep_times()
+    names = args.networks.split(',') if args.networks else list(apkeep)
+    paths = {}
+    for name in names:
+        path = os.path.join('nkpl', 'fig09', 'linear-reachability', f'{name}.nkpl')
+        if not os.path.exists(os.path.join(ROOT, path)):
+            print(f'Skipping {name}: {path} not found')
+        else:
+            paths[name] = path
+    variants = dict(v.partition('=')[::2] for v in args.variants)
+    if not args.no_build:
+        build()
+
+    results = {v: measure(v, opts.split(), paths, args.warmup, args.runs, args.timeout, args.mem) for v, opts in variants.items()}
+
+    def fmt(x):
+        return f'{x:10.2f}' if isinstance(x, float) else f'{x or "-":>10}'
+
+    print(f'{"network":16} {"apkeep":>10} ' + ' '.join(f'{v:>10}' for v in variants))
+    disagree = []
+    os.makedirs(os.path.dirname(args.csv), exist_ok=True)
+    with open(args.csv, 'w') as f:
+        f.write('network,variant,ms\n')
+        for name in paths:
+            row = [results[v].get(name) for v in variants]
+            print(f'{name:16} {fmt(apkeep.get(name))} ' + ' '.join(fmt(x) for x in row))
+            f.write(f'{name},apkeep,{apkeep.get(name, "")}\n')
+            for v, x in zip(variants, row):
+                f.write(f'{name},{v},{"" if x is None else x}\n')
+            verdicts = {x == 'fail' for x in row if x not in (None, 'timeout')}
+            if len(verdicts) > 1:
+                disagree.append(name)
+    for name in disagree:
+        print(f'The variants disagree on {name}')
+    sys.exit(1 if disagree else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+#!/bin/bash
+# Compares the field orders of FieldOrder.scala (--order, --reorder) on the fig11
+# families and the Topology Zoo networks of fig10, by SPP nodes, states and time.
+# Usage: scripts/bench-orderings.sh [timeout in seconds] [extra ab-trace.py options]
+TIMEOUT=${1:-600}
+shift
+python3 scripts/ab-trace.py --timeout "$TIMEOUT" "$@" \
+  --variant first-seen= \
+  --variant frequency="--order frequency" \
+  --variant tests-first="--order tests-first" \
+  --variant reverse="--order reverse" \
+  --variant sifting="--reorder 1000000" \
+  --variant frequency+sifting="--order frequency --reorder 1000000" \
+  nkpl/fig11/inc-first10 nkpl/fig11/flip-first11 nkpl/fig11/nondet-first15 \
+  nkpl/fig10
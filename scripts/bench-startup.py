@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Compare the startup latency and steady-state speed of KATch on the JVM, the JVM with CDS and the native binary.
+
+Every runtime runs `--file` `--reps` times in a fresh process, measuring the
+time until KATch starts running the file (`startup`), until its first check
+passes (`first_check`), and until the process exits (`total`). Steady-state
+speed is measured in one `katch serve` process per runtime, which runs
+`--steady-file` with the caches cleared before every run, and reports the
+median time of the runs after `--warmup` warm-up runs.
+
+The `cds` runtime needs JDK 13 or later; its archive is built on first use, and
+rebuilt whenever the jar is newer than it.
+The `native` runtime needs the binary of `scripts/native-image.sh` and is
+skipped without it. Exits with status 1 if a runtime's steady-state time is
+more than `--max-slowdown` times that of the JVM.
+
+    python3 scripts/bench-startup.py --reps 20
+
+usage: bench-startup.py [--runtimes jvm,cds,native] [--reps N] [--file F] [--steady-file F] [--warmup N] [--runs N]
+                        [--max-slowdown X] [--csv out.csv] [--no-build]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from katch import Client
+from katch.jvm import NATIVE, ROOT, RUNTIMES, build, build_cds, cds_stale, katch_command, scratch_dir
+
+STARTUP = ['startup', 'first_check', 'total']
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--runtimes', default=','.join(RUNTIMES), help='comma-separated runtimes to compare')
+    p.add_argument('--reps', type=int, default=10, help='fresh processes per runtime')
+    p.add_argument('--file', default='nkpl/fig10/Airtel_reachability.nkpl', help='file whose first check is timed')
+    p.add_argument('--steady-file', default='nkpl/fig10/Airtel_slicing.nkpl', help='file that is run repeatedly for the steady state')
+    p.add_argument('--warmup', type=int, default=10, help='steady-state runs that are not measured')
+    p.add_argument('--runs', type=int, default=10, help='measured steady-state runs')
+    p.add_argument('--max-slowdown', type=float, default=1.5, help='acceptable steady-state time relative to the JVM')
+    p.add_argument('--mem', default='16g', help='maximum heap size')
+    p.add_argument('--csv', default=os.path.join(ROOT, 'results', 'startup.csv'), help='where to write the measurements')
+    p.add_argument('--no-build', action='store_true', help='use the existing assembly jar')
+    return p.parse_args()
+
+
+def time_startup(runtime, path, mem):
+    """Runs `path` in a fresh process and returns the seconds until it starts running, until its first check passes, and until it exits."""
+    marks = {}
+    start = time.perf_counter()
+    proc = subprocess.Popen(katch_command(['run', '--no-cache', path], mem=mem, runtime=runtime), cwd=scratch_dir('startup'),
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    for line in proc.stdout:
+        now = time.perf_counter() - start
+        if line.startswith('Running '):
+            marks.setdefault('startup', now)
+        elif 'Check passed' in line:
+            marks.setdefault('first_check', now)
+    proc.wait()
+    marks['total'] = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f'{runtime} failed on {path} with exit code {proc.returncode}')
+    return marks
+
+
+def time_steady(runtime, path, warmup, runs, mem):
+    """The server-side times of running `path` `runs` times after `warmup` runs, in one process, with cold caches each time."""
+    times = []
+    with Client(command=katch_command(['serve', '--stdio'], mem=mem, runtime=runtime), cwd=ROOT) as k:
+        for i in range(warmup + runs):
+            k.request('clear')
+            k.request('reset')
+            t = k.load(path)['time']
+            if i >= warmup:
+                times.append(t)
+    return times
+
+
+def main():
+    args = parse_args()
+    runtimes = args.runtimes.split(',')
+    for r in runtimes:
+        if r not in RUNTIMES:
+            sys.exit(f'Unknown runtime {r}, expected one of {", ".join(RUNTIMES)}')
+    if not args.no_build:
+        build()
+    if 'cds' in runtimes and cds_stale():
+        print('Building the CDS archive')
+        build_cds(args.file)
+    if 'native' in runtimes and not os.path.exists(os.path.join(ROOT, NATIVE)):
+        print(f'Skipping native: {NATIVE} not found, build it with scripts/native-image.sh')
+        runtimes.remove('native')
+
+    rows = []
+    for r in runtimes:
+        print(f'Measuring {r}')
+        samples = [time_startup(r, args.file, args.mem) for _ in range(args.reps)]
+        for m in STARTUP:
+            values = [s[m] for s in samples if m in s]
+            if values:
+                rows.append((r, m, statistics.median(values), min(values), max(values)))
+        steady = time_steady(r, args.steady_file, args.warmup, args.runs, args.mem)
+        rows.append((r, 'steady', statistics.median(steady), min(steady), max(steady)))
+
+    print(f'{"runtime":8} {"metric":12} {"median":>9} {"min":>9} {"max":>9}')
+    for r, m, med, lo, hi in rows:
+        print(f'{r:8} {m:12} {med:9.3f} {lo:9.3f} {hi:9.3f}')
+    os.makedirs(os.path.dirname(args.csv), exist_ok=True)
+    with open(args.csv, 'w') as f:
+        f.write('runtime,metric,median,min,max\n')
+        for row in rows:
+            f.write(','.join(map(str, row)) + '\n')
+
+    steady = {r: med for r, m, med, _, _ in rows if m == 'steady'}
+    slow = [r for r in steady if 'jvm' in steady and steady[r] > args.max_slowdown * steady['jvm']]
+    for r in slow:
+        print(f'{r} is {steady[r] / steady["jvm"]:.2f}x slower than the JVM in the steady state (limit {args.max_slowdown}x)')
+    sys.exit(1 if slow else 0)
+
+
+if __name__ == '__main__':
+    main()
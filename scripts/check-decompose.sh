@@ -0,0 +1,13 @@
+#!/bin/bash
+# Checks that --decompose (Slicing.scala) gives the same verdict for every statement
+# of nkpl/tests (which has passing and failing slicing checks in slicing.nkpl) and of
+# the Topology Zoo slicing benchmarks of fig10 as the undecomposed checks.
+# ab-trace.py exits with status 2 if any differ.
+# Usage: scripts/check-decompose.sh [timeout in seconds] [extra ab-trace.py options]
+TIMEOUT=${1:-600}
+shift
+python3 scripts/ab-trace.py --timeout "$TIMEOUT" "$@" \
+  --variant base= \
+  --variant decompose="--decompose" \
+  --variant decompose-threads="--decompose --threads 4" \
+  nkpl/tests nkpl/fig10
@@ -0,0 +1,15 @@
+#!/bin/bash
+# Checks that the alternative engines give the same verdict for every statement of
+# nkpl/tests as the classic bisimulation: Hopcroft-Karp up to equivalence
+# (--bisim uf), the materialized automaton (--materialize, with either algorithm)
+# and the query optimizer (--optimize all). ab-trace.py exits with status 2 if any differ.
+# Usage: scripts/check-engines.sh [timeout in seconds] [extra ab-trace.py options]
+TIMEOUT=${1:-600}
+shift
+python3 scripts/ab-trace.py --timeout "$TIMEOUT" "$@" \
+  --variant base= \
+  --variant uf="--bisim uf" \
+  --variant materialize="--materialize" \
+  --variant materialize-uf="--materialize --bisim uf" \
+  --variant optimize="--optimize all" \
+  nkpl/tests
@@ -0,0 +1,12 @@
+#!/bin/bash
+# Checks that collecting with a tiny --gc threshold, which collects at nearly every
+# statement and every iteration of a check or query, gives the same verdict for
+# every statement of nkpl/tests and the fig11 families as running without it.
+# ab-trace.py exits with status 2 if any differ.
+# Usage: scripts/check-gc.sh [timeout in seconds] [extra ab-trace.py options]
+TIMEOUT=${1:-600}
+shift
+python3 scripts/ab-trace.py --timeout "$TIMEOUT" "$@" \
+  --variant base= \
+  --variant gc="--gc 1" \
+  nkpl/tests nkpl/fig11
@@ -0,0 +1,16 @@
+#!/bin/bash
+# Checks that --quotient (Quotient.scala) gives the same verdict for every statement
+# and the same result for every forward and backward query of nkpl/tests (where
+# quotient.nkpl merges values into classes) and of the fig09 linear-reachability
+# benchmarks as the plain engine. Exits with status 2 if any differ.
+# Usage: scripts/check-quotient.sh [timeout in seconds] [extra ab-trace.py options]
+TIMEOUT=${1:-600}
+shift
+python3 scripts/ab-trace.py --timeout "$TIMEOUT" "$@" \
+  --variant base= \
+  --variant quotient="--quotient" \
+  nkpl/tests nkpl/fig09/linear-reachability || exit
+python3 scripts/compare-queries.py --no-build \
+  --variant base= \
+  --variant quotient="--quotient" \
+  nkpl/tests nkpl/fig09/linear-reachability
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Compare the results of forward and backward queries between KATch configurations.
+
+`ab-trace.py` compares verdicts; this compares the packet sets that queries
+return. Every variant is a name and the extra options it passes to
+`katch serve`. Each benchmark file is loaded on one server per variant, and
+every `forward (...)` and `backward (...)` in it, with the variable of an
+enclosing `for` loop replaced by each of its values, is sent to all of them as
+a `forward` or `backward` request. The resulting SPs are reduced to a
+canonical form and must be the same as those of the first variant; so must
+the outcome of loading the file. Only queries whose argument is in
+parentheses on one line are compared.
+
+    python3 scripts/compare-queries.py --variant base= --variant quotient="--quotient" \\
+        nkpl/tests nkpl/fig09/linear-reachability
+
+Exits with status 2 if any result or load outcome differs.
+
+usage: compare-queries.py --variant NAME=OPTIONS [--variant ...] [--mem SIZE] [--no-build] benchmarks...
+"""
+import argparse
+import glob
+import os
+import re
+import shlex
+import sys
+
+from katch import Client, KatchError
+from katch.jvm import ROOT, build, katch_command
+
+QUERY = re.compile(r'\b(forward|backward)\s*\(')
+FOR = re.compile(r'^\s*for\s+(\w+)\s*∈\s*(-?\d+)\s*\.\.\s*(-?\d+)\s+do\b')
+TEST = re.compile(r'var (x\d+) = Test\((-?\d+), Map\((.*?)\), (\w+)\)$')
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('benchmarks', nargs='+', help='.nkpl files or directories')
+    p.add_argument('--variant', action='append', required=True, metavar='NAME=OPTIONS', help='a configuration to compare')
+    p.add_argument('--mem', default='16g', help='maximum heap size of each server')
+    p.add_argument('--no-build', action='store_true', help='use the existing assembly jar')
+    return p.parse_args()
+
+
+def benchmark_files(inputs):
+    files = []
+    for i in inputs:
+        files += [i] if i.endswith('.nkpl') else glob.glob(os.path.join(i, '**', '*.nkpl'), recursive=True)
+    return sorted(set(files))
+
+
+def queries(text):
+    """The `(op, expr)` queries of an NKPL file, with loop variables replaced by their values."""
+    for line in text.split('\n'):
+        line = line.split('--')[0]
+        loop = FOR.match(line)
+        for m in QUERY.finditer(line):
+            # The argument runs to the matching parenthesis
+            depth, end = 1, m.end()
+            while end < len(line) and depth:
+                depth += {'(': 1, ')': -1}.get(line[end], 0)
+                end += 1
+            if depth:
+                continue
+            expr = line[m.end():end - 1]
+            if loop:
+                x, lo, hi = loop.group(1), int(loop.group(2)), int(loop.group(3))
+                for i in range(lo, hi + 1):
+                    yield m.group(1), re.sub(rf'\b{re.escape(x)}\b', str(i), expr)
+            else:
+                yield m.group(1), expr
+
+
+class Canon:
+    """Canonical numbers for SPs, shared by all variants so that equal packet sets get equal numbers.
+
+    The text of `SP.pretty` depends on the order of hash maps and may keep
+    branches that equal the default; `number` drops those and hash-conses the
+    rest, which makes the numbers canonical for a fixed field order.
+    """
+
+    def __init__(self):
+        self.ids = {'False': 0, 'True': 1}
+
+    def number(self, pretty):
+        *defs, root = [s.strip() for s in pretty.split('; ')]
+        names = {'False': 0, 'True': 1}
+        for d in defs:
+            m = TEST.match(d)
+            if m is None:
+                raise ValueError(f'Unexpected SP: {d}')
+            name, x, branches, default = m.groups()
+            default = names[default]
+            ys = []
+            for b in filter(None, branches.split(', ')):
+                v, child = b.split(' -> ')
+                if names[child] != default:
+                    ys.append((int(v), names[child]))
+            key = (int(x), tuple(sorted(ys)), default)
+            names[name] = self.ids.setdefault(key, len(self.ids)) if ys else default
+        return names[root]
+
+
+def main():
+    args = parse_args()
+    if not args.no_build:
+        build()
+    variants = [v.split('=', 1) for v in args.variant]
+    clients = {name: Client(command=katch_command(['serve', *shlex.split(options), '--stdio'], mem=args.mem), cwd=ROOT)
+               for name, options in variants}
+    base = variants[0][0]
+    canon = Canon()
+    differences = compared = 0
+    try:
+        for path in benchmark_files(args.benchmarks):
+            rel = os.path.relpath(os.path.abspath(path), ROOT)
+            loaded = {}
+            for name, client in clients.items():
+                client.request('clear')
+                client.request('reset')
+                try:
+                    client.request('load', path=rel)
+                    loaded[name] = 'ok'
+                except KatchError as e:
+                    loaded[name] = f'fails: {str(e).splitlines()[0]}'
+            for name in clients:
+                if loaded[name] != loaded[base]:
+                    differences += 1
+                    print(f'{rel}: load {loaded[name]} in {name}, {loaded[base]} in {base}')
+            with open(path) as f:
+                text = f.read()
+            for op, expr in queries(text):
+                results = {}
+                for name, client in clients.items():
+                    try:
+                        results[name] = canon.number(client.request(op, expr=expr)['result'])
+                    except KatchError as e:
+                        results[name] = f'error: {str(e).splitlines()[0]}'
+                compared += 1
+                for name in clients:
+                    if results[name] != results[base]:
+                        differences += 1
+                        print(f'{rel}: {op} ({expr}) differs in {name}')
+    finally:
+        for client in clients.values():
+            client.close()
+    print(f'{compared} queries compared, {differences} differences')
+    sys.exit(2 if differences else 0)
+
+
+if __name__ == '__main__':
+    main()
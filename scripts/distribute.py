@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Run NKPL files with the iterations of their `for` loops spread over several KATch processes.
+
+Starts `--workers` local `katch serve --stdio` processes (and connects to any
+servers given with `--connect`), loads each file's imports on all of them, and
+hands out loop iterations by work stealing, using the iteration times of the
+previous run as costs (see `scripts/katch/distribute.py`). Prints the outcome
+of every file, with its wall time against the total time of its statements.
+
+    python3 scripts/distribute.py --workers 8 nkpl/fig09/linear-reachability/Cogentco.nkpl
+
+usage: distribute.py [--workers N] [--connect HOST:PORT ...] [--options OPTS] [--mem M] [--csv out.csv] [--no-build] files...
+"""
+import argparse
+import os
+import shlex
+import sys
+import time
+
+from katch.distribute import run_file, start_workers
+from katch.jvm import ROOT, build
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('files', nargs='+', help='.nkpl files')
+    p.add_argument('--workers', type=int, default=os.cpu_count(), help='number of local worker processes')
+    p.add_argument('--connect', action='append', default=[], metavar='HOST:PORT', help='also use the server at this address')
+    p.add_argument('--options', default='', help='global options for the local workers, e.g. "--bisim uf"')
+    p.add_argument('--mem', default='16g', help='maximum heap size of each local worker')
+    p.add_argument('--csv', help='also write the per-statement results to this csv file')
+    p.add_argument('--no-build', action='store_true', help='use the existing assembly jar')
+    return p.parse_args()
+
+
+def main():
+    import pandas as pd
+    args = parse_args()
+    if not args.no_build and args.workers > 0:
+        build()
+    addresses = [(a.rsplit(':', 1)[0], int(a.rsplit(':', 1)[1])) for a in args.connect]
+    workers = start_workers(args.workers, addresses, args.mem, shlex.split(args.options))
+    print(f'{len(workers)} workers')
+    frames = []
+    failed = False
+    try:
+        for path in args.files:
+            rel = os.path.relpath(os.path.abspath(path), ROOT)
+            busy = {w.name: w.busy for w in workers}
+            start = time.perf_counter()
+            df = run_file(rel, workers)
+            wall = time.perf_counter() - start
+            df.insert(0, 'file', rel)
+            frames.append(df)
+            bad = df[df['ok'] == False]
+            status = 'ok' if bad.empty else 'FAILED'
+            print(f'{rel}: {status} in {wall:.2f} s, {df["time"].sum():.2f} s of statements '
+                  f'({df["time"].sum() / wall:.1f}x), busy ' +
+                  ', '.join(f'{w.name} {w.busy - busy[w.name]:.1f} s' for w in workers))
+            for _, r in bad.iterrows():
+                where = f'statement {r["stmt"] + 1}' + ('' if pd.isna(r['i']) else f', iteration {int(r["i"])}')
+                print(f'  {where}: {r["error"]}')
+            failed |= not bad.empty
+    finally:
+        for w in workers:
+            w.client.close()
+    if args.csv and frames:
+        pd.concat(frames).to_csv(args.csv, index=False)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
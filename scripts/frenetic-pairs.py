@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Run Frenetic on the KAT pairs exported by `./katch convert`, one pair at a time.
+
+`scripts/runfrenetic.sh` runs every pair of one index file in sequence under a
+single timeout. This harness instead collects the pairs of all index files,
+runs each distinct pair once on a pool of workers with its own timeout, and
+records per-pair times and verdicts in the results store. Every verdict is
+cross-checked against the one KATch wrote into the index file.
+
+A pair is run again if its stored row is an error, timed out under a shorter
+timeout, or was recorded with another KATch verdict or another KATch version
+(the commit of the working tree), so the table never mixes stale verdicts with
+current ones. `--rerun` runs every pair again.
+
+usage: frenetic-pairs.py [--timeout 300] [--jobs N] [--csv results/comparison.csv] [index files or dirs...]
+"""
+import argparse
+import glob
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from katch.jvm import ROOT
+from katch.results import DEFAULT_PATH, open_store
+
+RED = '\033[31m'
+GREEN = '\033[32m'
+RESET = '\033[0m'
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('inputs', nargs='*', default=['kat'], help='KAT index files, or directories containing them')
+    p.add_argument('--timeout', type=float, default=300, help='per-pair timeout in seconds')
+    p.add_argument('--jobs', type=int, default=os.cpu_count(), help='number of pairs to run at once')
+    p.add_argument('--frenetic', default='frenetic', help='frenetic executable')
+    p.add_argument('--db', default=DEFAULT_PATH, help='results store')
+    p.add_argument('--rerun', action='store_true', help='rerun pairs that already have a result in the store')
+    p.add_argument('--csv', help='also append per-file totals to this comparison csv')
+    return p.parse_args()
+
+
+def index_files(inputs):
+    files = []
+    for i in inputs:
+        if os.path.isdir(i):
+            files += sorted(glob.glob(os.path.join(i, '*_index.txt')))
+        else:
+            files.append(i)
+    return files
+
+
+def read_index(path):
+    """Returns the (lhs, rhs, katch verdict) triples of an index file, in order."""
+    pairs = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 3:
+                pairs.append((fields[0], fields[1], fields[2].lower()))
+    return pairs
+
+
+def unpacked(katdir, name):
+    """Path of a plain-text copy of an exported file, decompressing `.kat.gz` files (`katch convert --gzip`) once."""
+    if not name.endswith('.gz'):
+        return os.path.join(katdir, name)
+    path = os.path.join(katdir, 'unpacked', name[:-len('.gz')])
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(os.path.join(katdir, name), 'rb') as src, open(path + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def run_pair(frenetic, katdir, lhs, rhs, timeout):
+    """Returns (verdict, seconds) for one `frenetic dump bisim` call."""
+    files = [unpacked(katdir, lhs), unpacked(katdir, rhs)]
+    start = time.monotonic()
+    try:
+        out = subprocess.run([frenetic, 'dump', 'bisim', *files],
+                             capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return 'timeout', timeout
+    elapsed = time.monotonic() - start
+    words = out.stdout.split()
+    if out.returncode != 0 or not words or words[0] not in ('true', 'false'):
+        return 'error', elapsed
+    return words[0], elapsed
+
+
+def version():
+    """The commit of the working tree, marked dirty if it has changes."""
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=ROOT, check=True, capture_output=True, text=True).stdout.strip()
+    return git('rev-parse', '--short', 'HEAD') + ('-dirty' if git('status', '--porcelain', '--untracked-files=no') else '')
+
+
+def is_current(db, lhs, rhs, katch, current, timeout):
+    """Whether the stored row of a pair can be kept: a verdict or a timeout at least as long as `timeout`, recorded for the same KATch verdict and version."""
+    row = db.execute('SELECT * FROM frenetic_pairs WHERE lhs = ? AND rhs = ?', (lhs, rhs)).fetchone()
+    if row is None or row['katch'] != katch or row['version'] != current:
+        return False
+    if row['frenetic'] == 'error':
+        return False
+    return row['frenetic'] != 'timeout' or row['timeout'] >= timeout
+
+
+def nkpl_for_index(index):
+    """Recovers the .nkpl path an index file was written for (see `Options.katIndex`)."""
+    name = os.path.basename(index)[:-len('_index.txt')]
+    for path in glob.glob('nkpl/**/*.nkpl', recursive=True):
+        if path.replace('/', '_') == name:
+            return path
+    return None
+
+
+def main():
+    args = parse_args()
+    db = open_store(args.db)
+
+    # Collect the distinct pairs across all index files
+    expected = {}
+    katdirs = {}
+    for idx in index_files(args.inputs):
+        db.execute('DELETE FROM frenetic_index WHERE idx = ?', (idx,))
+        for line, (lhs, rhs, verdict) in enumerate(read_index(idx)):
+            db.execute('INSERT INTO frenetic_index VALUES (?, ?, ?, ?)', (idx, line, lhs, rhs))
+            katdirs.setdefault((lhs, rhs), os.path.dirname(idx))
+            if expected.setdefault((lhs, rhs), verdict) != verdict:
+                print(f'{RED}Conflicting KATch verdicts for {lhs} {rhs} in {idx}{RESET}')
+    db.commit()
+
+    current = version()
+    todo = [pair for pair in expected if args.rerun or not is_current(db, *pair, expected[pair], current, args.timeout)]
+    print(f'{len(expected)} distinct pairs, {len(todo)} to run on {args.jobs} workers')
+
+    mismatches = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(run_pair, args.frenetic, katdirs[(lhs, rhs)], lhs, rhs, args.timeout): (lhs, rhs) for lhs, rhs in todo}
+        for n, future in enumerate(as_completed(futures), 1):
+            lhs, rhs = futures[future]
+            verdict, elapsed = future.result()
+            katch = expected[(lhs, rhs)]
+            db.execute('INSERT OR REPLACE INTO frenetic_pairs (lhs, rhs, katch, frenetic, time, timeout, version) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       (lhs, rhs, katch, verdict, elapsed, args.timeout, current))
+            db.commit()
+            if verdict in ('true', 'false') and verdict != katch:
+                mismatches += 1
+                print(f'{RED}[{n}/{len(todo)}] mismatch for {lhs} {rhs}: KATch {katch}, Frenetic {verdict}{RESET}')
+            else:
+                color = GREEN if verdict == katch else RED
+                print(f'{color}[{n}/{len(todo)}] {lhs} {rhs}: {verdict} in {elapsed:.2f} s{RESET}')
+
+    if args.csv:
+        totals = db.execute('''SELECT i.idx, SUM(p.time), SUM(p.frenetic = 'timeout'), MAX(p.timeout)
+                               FROM frenetic_index i JOIN frenetic_pairs p ON i.lhs = p.lhs AND i.rhs = p.rhs
+                               GROUP BY i.idx''').fetchall()
+        with open(args.csv, 'a') as f:
+            for idx, total, timeouts, timeout in totals:
+                path = nkpl_for_index(idx)
+                if path is None:
+                    print(f'{RED}No .nkpl file for {idx}{RESET}')
+                    continue
+                time_field = f'timeout ({int(timeout)}s)' if timeouts else f'{total:.2f}'
+                f.write(f'frenetic,{path},{time_field}\n')
+
+    if mismatches:
+        print(f'{RED}{mismatches} verdicts differ between KATch and Frenetic{RESET}')
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,3 @@
 #!/bin/bash
-./katch run nkpl/fig09/naive-reachability && \
-./katch run nkpl/fig09/linear-reachability && \
-./katch run nkpl/fig10 && \
-./katch run nkpl/fig11/flip-first11 && \
-./katch run nkpl/fig11/inc-first10 && \
-./katch run nkpl/fig11/nondet-first15
+# The suites are listed in benchmarks.toml
+python3 scripts/run-suites.py --expensive --katch-only
@@ -0,0 +1,6 @@
+"""Python tooling for KATch.
+
+Scripts in `scripts/` can `import katch` to drive a warm KATch process through
+`katch serve` instead of launching one JVM per query.
+"""
+from .client import AsyncClient, Client, KatchError, results_frame
@@ -0,0 +1,269 @@
+"""Clients for `katch serve`.
+
+Both clients speak the newline-delimited JSON protocol described in
+`src/main/scala/Server.scala`. By default they start a private KATch process
+with `./katch serve --stdio`; pass `address=(host, port)` to connect to a
+server that is already running instead.
+
+    from katch import Client
+    with Client() as k:
+        k.load('nkpl/fig09/linear-reachability/Airtel.nkpl')
+        df = k.check_many([(f'exists @pt (exists @dst (forward (@sw={i} ⋅ net)))', 'all')
+                           for i in range(16)])
+
+`AsyncClient` offers the same operations as coroutines, so many checks can be
+in flight at once (up to `max_in_flight`, after which submitting blocks).
+"""
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SERVE_COMMAND = ['./katch', 'serve', '--stdio']
+
+
+class KatchError(Exception):
+    """A request that the server answered with `ok: false`."""
+
+    def __init__(self, response):
+        super().__init__(response.get('error', 'unknown error'))
+        self.response = response
+
+
+def _check(response):
+    if not response.get('ok'):
+        raise KatchError(response)
+    return response
+
+
+def results_frame(requests, responses):
+    """Combine requests and their responses into a pandas DataFrame, one row per request."""
+    import pandas as pd
+    rows = []
+    for req, resp in zip(requests, responses):
+        row = {k: v for k, v in req.items() if k != 'id'}
+        row.update({k: v for k, v in resp.items() if k != 'id'})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def _check_requests(pairs):
+    return [{'op': 'check', 'lhs': lhs, 'rhs': rhs} for lhs, rhs in pairs]
+
+
+class Client:
+    """Synchronous client. Requests may be pipelined with `submit_many`."""
+
+    def __init__(self, address=None, command=SERVE_COMMAND, cwd=ROOT):
+        self.proc = None
+        self.sock = None
+        if address is None:
+            self.proc = subprocess.Popen(command, cwd=cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.wfile, self.rfile = self.proc.stdin, self.proc.stdout
+        else:
+            self.sock = socket.create_connection(address)
+            self.wfile = self.sock.makefile('wb')
+            self.rfile = self.sock.makefile('rb')
+        self.ids = itertools.count()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _send(self, req):
+        req = dict(req, id=next(self.ids))
+        self.wfile.write(json.dumps(req, ensure_ascii=False).encode('utf-8') + b'\n')
+        return req
+
+    def _receive(self):
+        line = self.rfile.readline()
+        if not line:
+            raise EOFError('KATch server closed the connection')
+        return json.loads(line)
+
+    def submit_many(self, requests, window=64):
+        """Send `requests` with at most `window` outstanding, and return the responses in order.
+
+        Keep the window small enough that the pending requests fit in a pipe
+        buffer, otherwise client and server can block writing to each other.
+        """
+        responses = []
+        pending = 0
+        for req in requests:
+            self._send(req)
+            pending += 1
+            if pending == window:
+                self.wfile.flush()
+                responses.append(self._receive())
+                pending -= 1
+        self.wfile.flush()
+        for _ in range(pending):
+            responses.append(self._receive())
+        return responses
+
+    def request(self, op, **fields):
+        """Send one request and wait for its response. Raises `KatchError` if it failed."""
+        return _check(self.submit_many([dict(fields, op=op)])[0])
+
+    def load(self, path):
+        return self.request('load', path=path)
+
+    def run(self, stmt):
+        return self.request('run', stmt=stmt)
+
+    def check(self, lhs, rhs):
+        return self.request('check', lhs=lhs, rhs=rhs)['result']
+
+    def forward(self, expr):
+        return self.request('forward', expr=expr)['result']
+
+    def backward(self, expr):
+        return self.request('backward', expr=expr)['result']
+
+    def stats(self):
+        return self.request('stats')
+
+    def count(self, expr, domains):
+        """The number of packets in the test `expr` (or pairs in a dup-free policy) over `domains`, which maps field names to a number of values or a list of values."""
+        return int(self.request('count', expr=expr, domains=domains)['result'])
+
+    def sample(self, expr, domains, n=1, seed=None):
+        """`n` packets drawn uniformly at random from the test `expr`, as dicts from field names to values."""
+        fields = {} if seed is None else {'seed': seed}
+        return self.request('sample', expr=expr, domains=domains, n=n, **fields)['result']
+
+    def member(self, expr, packets):
+        """Which of the `packets` (field name -> NumPy array) satisfy the test `expr`; see `katch.simulate`."""
+        from . import simulate
+        return simulate.member(self, expr, packets)
+
+    def simulate(self, expr, packets, max_hops=None):
+        """Run `packets` (field name -> NumPy array) through `expr`; see `katch.simulate`."""
+        from . import simulate
+        return simulate.simulate(self, expr, packets, max_hops)
+
+    def check_many(self, pairs, window=64):
+        """Check many `(lhs, rhs)` pairs and return a DataFrame of results and timings."""
+        requests = _check_requests(pairs)
+        return results_frame(requests, self.submit_many(requests, window))
+
+    def close(self):
+        if self.proc is not None:
+            if self.proc.poll() is None:
+                self.proc.stdin.close()
+                self.proc.wait()
+            self.proc.stdout.close()
+            self.proc = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class AsyncClient:
+    """`asyncio` client. Use `await AsyncClient.start()` to create one."""
+
+    def __init__(self, reader, writer, proc=None, max_in_flight=64):
+        self.reader = reader
+        self.writer = writer
+        self.proc = proc
+        self.ids = itertools.count()
+        self.waiting = {}
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.dispatcher = asyncio.ensure_future(self._dispatch())
+
+    @classmethod
+    async def start(cls, address=None, command=SERVE_COMMAND, cwd=ROOT, max_in_flight=64):
+        if address is None:
+            proc = await asyncio.create_subprocess_exec(*command, cwd=cwd, stdin=subprocess.PIPE,
+                                                        stdout=subprocess.PIPE, limit=2 ** 26)
+            return cls(proc.stdout, proc.stdin, proc, max_in_flight)
+        reader, writer = await asyncio.open_connection(*address, limit=2 ** 26)
+        return cls(reader, writer, None, max_in_flight)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _dispatch(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            if 'id' in response:
+                future = self.waiting.pop(response['id'], None)
+            elif self.waiting:
+                # The server couldn't read the request's id, e.g. from an unparsable line. Responses come in
+                # request order, so it belongs to the oldest outstanding request, which gets the error.
+                future = self.waiting.pop(next(iter(self.waiting)))
+            else:
+                future = None
+            if future is not None and not future.done():
+                future.set_result(response)
+        for future in self.waiting.values():
+            if not future.done():
+                future.set_exception(EOFError('KATch server closed the connection'))
+
+    async def submit(self, req):
+        """Send a request and return its response (which may have `ok: false`).
+
+        Waits for a free slot first, so at most `max_in_flight` requests are outstanding.
+        """
+        async with self.slots:
+            req = dict(req, id=next(self.ids))
+            future = asyncio.get_running_loop().create_future()
+            self.waiting[req['id']] = future
+            self.writer.write(json.dumps(req, ensure_ascii=False).encode('utf-8') + b'\n')
+            await self.writer.drain()
+            return await future
+
+    async def request(self, op, **fields):
+        return _check(await self.submit(dict(fields, op=op)))
+
+    async def load(self, path):
+        return await self.request('load', path=path)
+
+    async def run(self, stmt):
+        return await self.request('run', stmt=stmt)
+
+    async def check(self, lhs, rhs):
+        return (await self.request('check', lhs=lhs, rhs=rhs))['result']
+
+    async def forward(self, expr):
+        return (await self.request('forward', expr=expr))['result']
+
+    async def backward(self, expr):
+        return (await self.request('backward', expr=expr))['result']
+
+    async def stats(self):
+        return await self.request('stats')
+
+    async def count(self, expr, domains):
+        return int((await self.request('count', expr=expr, domains=domains))['result'])
+
+    async def sample(self, expr, domains, n=1, seed=None):
+        fields = {} if seed is None else {'seed': seed}
+        return (await self.request('sample', expr=expr, domains=domains, n=n, **fields))['result']
+
+    async def submit_many(self, requests):
+        return await asyncio.gather(*(self.submit(req) for req in requests))
+
+    async def check_many(self, pairs):
+        """Check many `(lhs, rhs)` pairs concurrently and return a DataFrame of results and timings."""
+        requests = _check_requests(pairs)
+        return results_frame(requests, await self.submit_many(requests))
+
+    async def close(self):
+        self.writer.close()
+        if self.proc is not None:
+            await self.proc.wait()
+        else:
+            await self.writer.wait_closed()
+        await self.dispatcher
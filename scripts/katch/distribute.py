@@ -0,0 +1,266 @@
+"""Running the iterations of `for` loops on several `katch serve` processes.
+
+In files like the linear-reachability benchmarks, one `for i ∈ 0..n do check …`
+loop after a few imports takes the whole running time. `run_file` runs such a
+file on several workers: each worker is a `katch serve --stdio` process, or a
+server started with `katch serve --port` (possibly on another machine) that
+is given as an address.
+
+  - Setup statements (imports, bindings and loops over them) run on every
+    worker, so each worker loads the shared imports once.
+  - The iterations of a loop over checks or queries are handed out in ranges.
+    Every worker starts with a contiguous share of about equal predicted cost
+    and runs it chunk by chunk from the front. A worker whose share is used up
+    steals the back half of the most expensive remaining share.
+  - Predicted costs are the iteration times of the previous run of the file,
+    kept in the results store (`results.loop_costs`). Iterations without a
+    history are predicted at the mean of those with one, or all cost the same.
+  - Other statements run on the first worker.
+
+Results are merged back in file order, and the file stops at the first failing
+statement or iteration, as it does when it runs in a single process. If a
+worker dies, the rest of its range goes back to the others.
+
+    from katch.distribute import run_file
+    df = run_file('nkpl/fig09/linear-reachability/Cogentco.nkpl', n=8)
+"""
+import os
+import threading
+import time
+
+from .client import Client, KatchError
+from .jvm import ROOT, katch_command
+from .results import DEFAULT_PATH, loop_costs, open_store, record_loop_costs
+
+SETUP = {'import', 'let'}
+CHUNKS_PER_WORKER = 8
+
+
+class Worker:
+    """One KATch server and the connection to it."""
+
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.busy = 0.0
+        self.alive = True
+
+    def request(self, op, **fields):
+        start = time.perf_counter()
+        try:
+            return self.client.request(op, **fields)
+        except (EOFError, OSError):
+            self.alive = False
+            raise
+        finally:
+            self.busy += time.perf_counter() - start
+
+
+def start_workers(n=0, addresses=(), mem='16g', options=()):
+    """`n` local workers running the assembly jar with the global `options`, plus one for every `(host, port)` in `addresses`."""
+    workers = [Worker(f'local{k}', Client(command=katch_command(['serve', *options, '--stdio'], mem=mem), cwd=ROOT))
+               for k in range(n)]
+    workers += [Worker(f'{host}:{port}', Client(address=(host, port))) for host, port in addresses]
+    if not workers:
+        raise ValueError('No workers')
+    return workers
+
+
+class Schedule:
+    """The iterations of one loop that are still to be run, split into one share per worker.
+
+    Shares are inclusive ranges `[lo, hi]`; `take` returns the next chunk for a
+    worker, stealing if its own share is used up, and `stop` drops everything
+    after a failing iteration. All methods are called with the lock held.
+    """
+
+    def __init__(self, lo, hi, costs, workers):
+        self.cost = costs
+        self.lock = threading.Lock()
+        self.stop_at = hi + 1
+        total = sum(costs[i] for i in range(lo, hi + 1))
+        self.chunk_cost = total / (CHUNKS_PER_WORKER * len(workers))
+        self.orphans = []
+        # Worker k's share starts where the cumulative cost passes k / len(workers) of the total
+        starts, acc, i = [lo], 0.0, lo
+        for k in range(1, len(workers)):
+            while i <= hi and acc + costs[i] / 2 < total * k / len(workers):
+                acc += costs[i]
+                i += 1
+            starts.append(i)
+        ends = [s - 1 for s in starts[1:]] + [hi]
+        self.shares = {w.name: [s, e] for w, s, e in zip(workers, starts, ends)}
+
+    def _range_cost(self, lo, hi):
+        return sum(self.cost[i] for i in range(lo, min(hi, self.stop_at - 1) + 1))
+
+    def take(self, worker):
+        """The next chunk `(lo, hi)` for `worker`, or `None` if there is nothing left."""
+        share = self.shares[worker.name]
+        if share[0] > min(share[1], self.stop_at - 1):
+            if self.orphans:
+                share[:] = self.orphans.pop()
+            else:
+                # Steal the back half of the most expensive share
+                victim = max(self.shares.values(), key=lambda s: self._range_cost(*s))
+                lo, hi = victim[0], min(victim[1], self.stop_at - 1)
+                if lo > hi:
+                    return None
+                half, acc, mid = self._range_cost(lo, hi) / 2, 0.0, hi
+                while mid > lo and acc + self.cost[mid] <= half:
+                    acc += self.cost[mid]
+                    mid -= 1
+                # A share of one iteration is stolen whole; otherwise the victim keeps at least one
+                start = lo if lo == hi else min(max(mid + 1, lo + 1), hi)
+                share[:] = [start, hi]
+                victim[1] = start - 1
+        lo, hi = share[0], min(share[1], self.stop_at - 1)
+        if lo > hi:
+            return None
+        end, acc = lo, self.cost[lo]
+        while end < hi and acc + self.cost[end + 1] <= self.chunk_cost:
+            end += 1
+            acc += self.cost[end]
+        share[0] = end + 1
+        return lo, end
+
+    def give_back(self, lo, hi):
+        """Returns a chunk that a dead worker did not finish."""
+        self.orphans.append([lo, hi])
+
+    def stop(self, i):
+        """Iteration `i` failed: the iterations after it are not run."""
+        self.stop_at = min(self.stop_at, i)
+
+
+def predicted_costs(history, lo, hi):
+    """The predicted cost of every iteration in `lo..hi`, from the times of an earlier run."""
+    known = [history[i] for i in range(lo, hi + 1) if i in history]
+    default = sum(known) / len(known) if known else 1.0
+    return {i: history.get(i, default) for i in range(lo, hi + 1)}
+
+
+def run_loop(workers, path, k, loop, history):
+    """Runs loop statement `k` on the workers, and returns the iteration results in order, up to the first failure."""
+    lo, hi = loop['from'], loop['to']
+    if lo > hi:
+        return []
+    schedule = Schedule(lo, hi, predicted_costs(history, lo, hi), workers)
+    results = {}
+
+    def work(worker):
+        while worker.alive:
+            with schedule.lock:
+                chunk = schedule.take(worker)
+            if chunk is None:
+                return
+            try:
+                response = worker.request('loop', path=path, stmt=k, **{'from': chunk[0], 'to': chunk[1]})
+            except (EOFError, OSError):
+                with schedule.lock:
+                    schedule.give_back(*chunk)
+                return
+            except KatchError as e:
+                # The request failed as a whole (e.g. the statement is not a loop): the worker is alive, but the chunk fails
+                with schedule.lock:
+                    results[chunk[0]] = {'i': chunk[0], 'ok': False, 'error': str(e), 'worker': worker.name}
+                    schedule.stop(chunk[0])
+                continue
+            with schedule.lock:
+                for r in response['iterations']:
+                    results[r['i']] = dict(r, worker=worker.name)
+                    if not r['ok']:
+                        schedule.stop(r['i'])
+
+    # Chunks of workers that died may be given back after the others have finished
+    while any(w.alive for w in workers):
+        threads = [threading.Thread(target=work, args=(w,)) for w in workers if w.alive]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if not any(o[0] < schedule.stop_at for o in schedule.orphans):
+            break
+    merged = []
+    for i in range(lo, hi + 1):
+        if i not in results:
+            raise RuntimeError(f'Iteration {i} of {path}:{k + 1} was not run: all workers died')
+        merged.append(results[i])
+        if not results[i]['ok']:
+            break
+    return merged
+
+
+def _on_all(workers, op, **fields):
+    """Sends the same request to every live worker at once, and returns the slowest time."""
+    times, errors = [], []
+
+    def send(worker):
+        try:
+            times.append(worker.request(op, **fields)['time'])
+        except (KatchError, EOFError, OSError) as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=send, args=(w,)) for w in workers if w.alive]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return max(times, default=0.0)
+
+
+def run_file(path, workers=None, n=os.cpu_count(), store=DEFAULT_PATH):
+    """Runs the NKPL file at `path` (relative to the repository root) on `workers` (by default `n` new local ones).
+
+    Returns a DataFrame with one row per statement and per loop iteration, in
+    order: `stmt` (the statement index), `kind`, `i` (the loop iteration, if
+    any), `ok`, `time`, `worker` and `error`. Rows stop at the first failure.
+    Workers that this function starts are shut down when it returns.
+    """
+    import pandas as pd
+    own = workers is None
+    workers = workers if workers is not None else start_workers(n)
+    db = open_store(os.path.join(ROOT, store))
+    rows = []
+    try:
+        statements = workers[0].request('statements', path=path)['statements']
+        k = 0
+        while k < len(statements):
+            s = statements[k]
+            if s['kind'] in SETUP or (s['kind'] == 'for' and s['body'] in SETUP):
+                # Consecutive setup statements are loaded on every worker in one request
+                end = k
+                while end < len(statements) and (statements[end]['kind'] in SETUP or
+                                                 (statements[end]['kind'] == 'for' and statements[end]['body'] in SETUP)):
+                    end += 1
+                try:
+                    t = _on_all(workers, 'load', path=path, **{'from': k, 'until': end})
+                    rows.append({'stmt': k, 'kind': 'setup', 'ok': True, 'time': t, 'worker': 'all'})
+                except KatchError as e:
+                    rows.append({'stmt': k, 'kind': 'setup', 'ok': False, 'worker': 'all', 'error': str(e)})
+                    break
+                k = end
+            elif s['kind'] == 'for':
+                iterations = run_loop(workers, path, k, s, loop_costs(db, path, k))
+                record_loop_costs(db, path, k, {r['i']: r['time'] for r in iterations if 'time' in r})
+                rows += [dict(r, stmt=k, kind=s['body']) for r in iterations]
+                if iterations and not iterations[-1]['ok']:
+                    break
+                k += 1
+            else:
+                first = next(w for w in workers if w.alive)
+                try:
+                    t = first.request('load', path=path, **{'from': k, 'until': k + 1})['time']
+                    rows.append({'stmt': k, 'kind': s['kind'], 'ok': True, 'time': t, 'worker': first.name})
+                except KatchError as e:
+                    rows.append({'stmt': k, 'kind': s['kind'], 'ok': False, 'worker': first.name, 'error': str(e)})
+                    break
+                k += 1
+    finally:
+        db.close()
+        if own:
+            for w in workers:
+                w.client.close()
+    return pd.DataFrame(rows, columns=['stmt', 'kind', 'i', 'ok', 'time', 'worker', 'error'])
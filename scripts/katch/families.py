@@ -0,0 +1,108 @@
+"""Generators for parametric benchmark families: one NKPL file for any size `n`.
+
+`inc`, `flip` and `nondet` produce the files in `nkpl/fig11`, and `falsetrue`
+and `flipall` the other combinatorial benchmarks of
+`src/main/scala/BenchGen.worksheet.sc`. `chain`, `ring` and `nested_star` are
+families whose size grows the topology or the nesting of stars instead:
+
+  - `chain`: reachability from the first to the last of n+1 switches in a line, with a δ per hop.
+  - `ring`: the switches that n switches in a ring reach from switch 0.
+  - `nested_star`: n stars nested inside each other, each adding a bit flip.
+
+Every file holds one check that passes.
+
+    from katch.families import FAMILIES, write
+    path = write('ring', 50, 'results/scaling/files')
+"""
+import os
+
+
+def _flip_x(i):
+    return f'flip_x{i} = (@x{i}=0 ⋅ @x{i}←1) ∪ (@x{i}=1 ⋅ @x{i}←0) ∪ (@x{i}≠0 ⋅ @x{i}≠1 ⋅ ε)'
+
+
+def flip(n):
+    """Flipping n bits twice is the identity."""
+    defs = '\n'.join(_flip_x(i) for i in range(1, n + 1))
+    flips = ' ⋅ '.join(f'flip_x{i}' for i in range(1, n + 1))
+    return f'{defs}\n\nflip = {flips}\n\ncheck flip ⋅ flip ≡ ε'
+
+
+def inc(n):
+    """Incrementing an n-bit counter from zero eventually reaches the maximum."""
+    lines = [f'inc_x{i} = (@carry=1 ⋅ @x{i}=0 ⋅ @x{i}←1 ⋅ @carry←0) ∪ (@carry=1 ⋅ @x{i}=1 ⋅ @x{i}←0 ⋅ @carry←1) ∪ @carry=0 '
+             for i in range(1, n + 1)]
+    lines.append(f'inc = @carry←1 ⋅ {" ⋅ ".join(f"inc_x{i}" for i in range(1, n + 1))} ⋅ @carry←0')
+    zero = ' ⋅ '.join(f'@x{i}=0' for i in range(1, n + 1))
+    top = ' ⋅ '.join(f'@x{i}=1' for i in range(1, n + 1))
+    return '\n'.join(lines) + f'\n\nzero = {zero}\nmax = {top}\n\ncheck zero ⋅ (inc)⋆ ⋅ max ≢  ∅\n'
+
+
+def nondet(n):
+    """Setting three fields to any of n+1 values twice is the same as doing it once."""
+    fields = ['sw', 'pt', 'dst']
+    lines = [f'{v}E = {" ∪ ".join(f"@{v}←{i}" for i in range(n + 1))}' for v in fields]
+    lines.append(f'all = {" ⋅ ".join(f"{v}E" for v in fields)}')
+    return '\n'.join(lines) + '\ncheck all ⋅ all ≡ all\n'
+
+
+def falsetrue(n):
+    """Setting any of n bits from 0 to 1, repeatedly, is the same as setting each at most once."""
+    lhs = ' + '.join(f'@x{i}=0⋅@x{i}←1' for i in range(1, n + 1))
+    rhs = ' ⋅ '.join(f'(@x{i}=0⋅@x{i}←1 + ε)' for i in range(1, n + 1))
+    return f'check ({lhs})⋆ ≡ {rhs}\n'
+
+
+def flipall(n):
+    """Repeatedly flipping any of n bits is the same as flipping each of them any number of times."""
+    defs = '\n'.join(f'flip_x{i} = @x{i}=0 ⋅ @x{i}←1 + @x{i}=1 ⋅ @x{i}←0' for i in range(1, n + 1))
+    lhs = ' + '.join(f'flip_x{i}' for i in range(1, n + 1))
+    rhs = '⋅'.join(f'(flip_x{i})⋆' for i in range(1, n + 1))
+    return f'{defs}\ncheck ({lhs})⋆ ≡ {rhs}\n'
+
+
+def chain(n):
+    """The last of n+1 switches in a line is reachable from the first."""
+    links = ' ∪ '.join(f'(@sw={i} ⋅ @sw←{i + 1})' for i in range(n))
+    return f'net = {links}\n\ncheck @sw=0 ⋅ (net ⋅ δ)⋆ ⋅ @sw={n} ≢ ∅\n'
+
+
+def ring(n):
+    """Switch 0 of a ring of n switches reaches all of them."""
+    links = ' ∪ '.join(f'(@sw={i} ⋅ @sw←{(i + 1) % n})' for i in range(n))
+    everywhere = ' ∪ '.join(f'@sw←{i}' for i in range(n))
+    return f'net = {links}\n\ncheck @sw=0 ⋅ (net)⋆ ≡ @sw=0 ⋅ ({everywhere})\n'
+
+
+def nested_star(n):
+    """A star nested n deep is idempotent under composition."""
+    lines = [f'flip_x{i} = @x{i}=0 ⋅ @x{i}←1 ∪ @x{i}=1 ⋅ @x{i}←0' for i in range(1, n + 1)]
+    lines.append('star1 = (flip_x1)⋆')
+    lines += [f'star{i} = (star{i - 1} ⋅ flip_x{i})⋆' for i in range(2, n + 1)]
+    return '\n'.join(lines) + f'\n\ncheck star{n} ⋅ star{n} ≡ star{n}\n'
+
+
+FAMILIES = {
+    'inc': inc,
+    'flip': flip,
+    'nondet': nondet,
+    'falsetrue': falsetrue,
+    'flipall': flipall,
+    'chain': chain,
+    'ring': ring,
+    'nested_star': nested_star,
+}
+
+
+def file_name(family, n):
+    """The file name of size `n` of `family`, as in `nkpl/fig11`."""
+    return f'nondet{n}-swptdst.nkpl' if family == 'nondet' else f'{family}{n}.nkpl'
+
+
+def write(family, n, directory):
+    """Writes the file of size `n` of `family` to `directory` and returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, file_name(family, n))
+    with open(path, 'w') as f:
+        f.write(FAMILIES[family](n))
+    return path
@@ -0,0 +1,267 @@
+"""Random NetKAT terms for performance fuzzing, and their minimization.
+
+Terms are nested tuples: `('test', f, v)`, `('testne', f, v)`, `('mut', f, v)`,
+`('dup',)`, `('zero',)`, `('one',)`, `('star', e)` and the binary
+`('seq', a, b)`, `('sum', a, b)`, `('and', a, b)`, `('xor', a, b)` and
+`('diff', a, b)`. Fields are numbers, written `@x0`, `@x1`, ... in NKPL and
+as the Frenetic fields of `src/main/scala/Export.scala` in KAT. The last three
+operators are not NetKAT, and only generated with `Config.extended`.
+
+`random_pair` draws the two operands of a check: either two independent
+terms, or a term and a small mutation of it. The second kind is the one that
+makes checks slow: the operands are often equivalent, or differ only on a few
+packets, so the bisimulation has to explore most of both automata.
+
+`shrink` minimizes a pair for a predicate, like hierarchical delta debugging:
+it tries to replace every subterm, largest first, by `∅`, `ε` or one of its
+children, and to renumber values downwards, keeping every change that
+preserves the predicate, until no change does.
+
+    import random
+    from katch.fuzz import Config, random_pair, nkpl
+    rng = random.Random(1)
+    lhs, rhs = random_pair(rng, Config(size=30, fields=3, values=4))
+    print(f'check {nkpl(lhs)} ≡ {nkpl(rhs)}')
+"""
+import itertools
+import os
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass
+
+# The fields that Frenetic knows, in the order of `KatExport.freneticVars`
+FRENETIC_FIELDS = ['switch', 'port', 'vswitch', 'vport', 'vfabric', 'ethSrc', 'ethDst', 'vlanId', 'vlanPcp', 'ethTyp',
+                   'ipProto', 'ip4Src', 'ip4Dst', 'tcpSrcPort', 'tcpDstPort']
+
+LEAVES = ['test', 'testne', 'mut', 'dup', 'zero', 'one']
+NETKAT_OPS = ['seq', 'sum', 'star']
+EXTENDED_OPS = ['and', 'xor', 'diff']
+
+
+@dataclass
+class Config:
+    """The shape of random terms.
+
+    `size` is the number of nodes of a term. Fields and values are drawn from
+    `fields` and `values` numbers, with Zipf weights `1/(i+1)^skew` (0 draws
+    them uniformly, larger values make low numbers more common, so that tests
+    and assignments hit the same fields and values more often). `weights`
+    gives the relative frequencies of leaves and operators.
+    """
+    size: int = 20
+    fields: int = 3
+    values: int = 3
+    skew: float = 1.0
+    extended: bool = False
+    weights: dict = None
+
+    def __post_init__(self):
+        if self.weights is None:
+            self.weights = {'test': 4, 'testne': 1, 'mut': 3, 'dup': 1, 'zero': 0.2, 'one': 0.5,
+                            'seq': 4, 'sum': 3, 'star': 1.5, 'and': 0.5, 'xor': 0.5, 'diff': 0.5}
+        self.field_weights = [1 / (i + 1) ** self.skew for i in range(self.fields)]
+        self.value_weights = [1 / (i + 1) ** self.skew for i in range(self.values)]
+
+    def ops(self):
+        return NETKAT_OPS + (EXTENDED_OPS if self.extended else [])
+
+
+def _choose(rng, names, weights):
+    return rng.choices(names, [weights.get(n, 0) for n in names])[0]
+
+
+def random_leaf(rng, cfg):
+    kind = _choose(rng, LEAVES, cfg.weights)
+    if kind in ('test', 'testne', 'mut'):
+        f = rng.choices(range(cfg.fields), cfg.field_weights)[0]
+        v = rng.choices(range(cfg.values), cfg.value_weights)[0]
+        return (kind, f, v)
+    return (kind,)
+
+
+def random_term(rng, cfg, size=None):
+    """A random term of about `size` nodes (default `cfg.size`)."""
+    size = cfg.size if size is None else size
+    if size <= 1:
+        return random_leaf(rng, cfg)
+    op = _choose(rng, cfg.ops() if size > 2 else ['star'], cfg.weights)
+    if op == 'star':
+        return ('star', random_term(rng, cfg, size - 1))
+    left = rng.randint(1, size - 2)
+    return (op, random_term(rng, cfg, left), random_term(rng, cfg, size - 1 - left))
+
+
+def size(t):
+    return 1 + sum(size(c) for c in t[1:] if isinstance(c, tuple))
+
+
+def children(t):
+    return [c for c in t[1:] if isinstance(c, tuple)]
+
+
+def paths(t, prefix=()):
+    """The paths of the subterms of `t`, in pre-order; a path is the list of child indices from the root."""
+    yield prefix
+    for i, c in enumerate(children(t)):
+        yield from paths(c, prefix + (i,))
+
+
+def subterm(t, path):
+    for i in path:
+        t = children(t)[i]
+    return t
+
+
+def replace(t, path, new):
+    """`t` with the subterm at `path` replaced by `new`."""
+    if not path:
+        return new
+    cs = children(t)
+    cs[path[0]] = replace(cs[path[0]], path[1:], new)
+    return (t[0], *cs)
+
+
+def mutate(rng, cfg, t, max_size=None):
+    """A small random change of `t`: a subterm is replaced by a fresh term of about its size, starred, or has its operands swapped. Changes that grow `t` beyond `max_size` nodes are retried."""
+    for _ in range(100):
+        path = rng.choice(list(paths(t)))
+        old = subterm(t, path)
+        how = rng.choice(['fresh', 'fresh', 'leaf', 'star', 'swap', 'wrap'])
+        if how == 'fresh':
+            new = random_term(rng, cfg, max(1, size(old) + rng.randint(-2, 2)))
+        elif how == 'leaf':
+            new = random_leaf(rng, cfg)
+        elif how == 'star':
+            new = old[1] if old[0] == 'star' else ('star', old)
+        elif how == 'swap' and len(children(old)) == 2:
+            new = (old[0], old[2], old[1])
+        elif how == 'wrap':
+            new = (_choose(rng, [o for o in cfg.ops() if o != 'star'], cfg.weights), old, random_term(rng, cfg, rng.randint(1, 3)))
+            if rng.random() < 0.5:
+                new = (new[0], new[2], new[1])
+        else:
+            continue
+        result = replace(t, path, new)
+        if result != t and (max_size is None or size(result) <= max_size):
+            return result
+    return t
+
+
+def random_pair(rng, cfg, mutations=None):
+    """The operands of a random check: two independent terms, or (more often) a term and `mutations` (default 1 to 3) mutations of it."""
+    lhs = random_term(rng, cfg)
+    if rng.random() < 0.25:
+        return lhs, random_term(rng, cfg)
+    rhs = lhs
+    for _ in range(mutations or rng.randint(1, 3)):
+        rhs = mutate(rng, cfg, rhs, max_size=2 * cfg.size)
+    return (lhs, rhs) if rng.random() < 0.5 else (rhs, lhs)
+
+
+def nkpl(t):
+    """The NKPL text of `t`."""
+    kind = t[0]
+    if kind == 'test':
+        return f'@x{t[1]}={t[2]}'
+    if kind == 'testne':
+        return f'@x{t[1]}≠{t[2]}'
+    if kind == 'mut':
+        return f'@x{t[1]}←{t[2]}'
+    if kind == 'dup':
+        return 'δ'
+    if kind == 'zero':
+        return '∅'
+    if kind == 'one':
+        return 'ε'
+    if kind == 'star':
+        return f'({nkpl(t[1])})⋆'
+    op = {'seq': '⋅', 'sum': '∪', 'and': '∩', 'xor': '⊕', 'diff': '∖'}[kind]
+    return f'({nkpl(t[1])} {op} {nkpl(t[2])})'
+
+
+def kat(t):
+    """The text of `t` in Frenetic's KAT format, as `katch convert` writes it. Raises `ValueError` for operators that Frenetic doesn't support."""
+    kind = t[0]
+    if kind == 'test':
+        return f'(filter {FRENETIC_FIELDS[t[1]]} = {t[2]})'
+    if kind == 'testne':
+        return f'(filter (not {FRENETIC_FIELDS[t[1]]} = {t[2]}))'
+    if kind == 'mut':
+        return f'({FRENETIC_FIELDS[t[1]]} := {t[2]})'
+    if kind == 'dup':
+        return '(dup)'
+    if kind == 'zero':
+        return '(drop)'
+    if kind == 'one':
+        return '(id)'
+    if kind == 'star':
+        return f'({kat(t[1])}*)'
+    if kind == 'seq':
+        return f'({kat(t[1])};{kat(t[2])})'
+    if kind == 'sum':
+        return f'({kat(t[1])}+{kat(t[2])})'
+    raise ValueError(f'Frenetic does not support {kind}')
+
+
+def frenetic_check(lhs, rhs, timeout, frenetic='frenetic'):
+    """Frenetic's verdict on `lhs ≡ rhs` (`'true'`, `'false'`, `'timeout'` or `'error'`) and the seconds it took."""
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for name, t in [('lhs', lhs), ('rhs', rhs)]:
+            files.append(os.path.join(tmp, f'{name}.kat'))
+            with open(files[-1], 'w') as f:
+                f.write(kat(t))
+        start = time.monotonic()
+        try:
+            out = subprocess.run([frenetic, 'dump', 'bisim', *files], capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return 'timeout', timeout
+        elapsed = time.monotonic() - start
+    words = out.stdout.split()
+    if out.returncode != 0 or not words or words[0] not in ('true', 'false'):
+        return 'error', elapsed
+    return words[0], elapsed
+
+
+def _candidates(t):
+    """Smaller replacements for the subterm `t`: its children, `∅`, `ε`, and lower values."""
+    yield from children(t)
+    if t[0] not in ('zero', 'one'):
+        yield ('zero',)
+        yield ('one',)
+    if t[0] in ('test', 'testne', 'mut'):
+        for v in range(t[2]):
+            yield (t[0], t[1], v)
+        for f in range(t[1]):
+            yield (t[0], f, t[2])
+
+
+def shrink(pair, interesting, max_tries=None):
+    """A minimal variant of `pair` for which `interesting(lhs, rhs)` holds (it must hold for `pair`). Returns the pair and the number of predicate calls."""
+    tries = 0
+    lhs, rhs = pair
+    changed = True
+    while changed and (max_tries is None or tries < max_tries):
+        changed = False
+        for side in (0, 1):
+            # Largest subterms first, so that big parts are cut before small ones are fiddled with
+            current = (lhs, rhs)[side]
+            for path in sorted(paths(current), key=lambda p: -size(subterm(current, p))):
+                current = (lhs, rhs)[side]
+                try:
+                    old = subterm(current, path)
+                except IndexError:
+                    # The path went away with an earlier change
+                    continue
+                for new in itertools.islice(_candidates(old), 16):
+                    if max_tries is not None and tries >= max_tries:
+                        return (lhs, rhs), tries
+                    candidate = replace(current, path, new)
+                    pair2 = (candidate, rhs) if side == 0 else (lhs, candidate)
+                    tries += 1
+                    if interesting(*pair2):
+                        lhs, rhs = pair2
+                        changed = True
+                        break
+    return (lhs, rhs), tries
@@ -0,0 +1,55 @@
+"""Running the KATch assembly jar directly, outside of the `./katch` launcher.
+
+Benchmark tooling runs KATch in a scratch working directory, so that the
+results it appends (results/comparison.csv, results/memory.csv, ...) don't mix
+with those of the paper experiments.
+
+KATch can run on three runtimes: `jvm`, `cds` (the JVM with a class-data
+sharing archive, see `build_cds`) and `native` (the ahead-of-time compiled
+binary built by `scripts/native-image.sh`).
+"""
+import os
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+JAR = 'target/scala-3.3.1/KATch-assembly-0.1.0-SNAPSHOT.jar'
+NATIVE = 'target/native/katch'
+CDS_ARCHIVE = 'target/katch.jsa'
+RUNTIMES = ['jvm', 'cds', 'native']
+
+
+def scratch_dir(name):
+    """A working directory under results/<name>/.work with the `nkpl` benchmarks linked in."""
+    work = os.path.join(ROOT, 'results', name, '.work')
+    os.makedirs(os.path.join(work, 'results'), exist_ok=True)
+    if not os.path.exists(os.path.join(work, 'nkpl')):
+        os.symlink(os.path.join(ROOT, 'nkpl'), os.path.join(work, 'nkpl'))
+    return work
+
+
+def katch_command(args, jar=None, jvm_args=(), mem='128g', runtime='jvm'):
+    """The command line that runs KATch with `args` on `runtime`, with the same options as `./katch`."""
+    if runtime == 'native':
+        # A native binary's main thread gets the stack size of its parent, not -Xss
+        return ['bash', '-c', 'ulimit -s 1048576 2> /dev/null; exec "$0" "$@"',
+                os.path.join(ROOT, NATIVE), '-Xss10m', f'-Xmx{mem}', *args]
+    if runtime == 'cds':
+        jvm_args = (f'-XX:SharedArchiveFile={os.path.join(ROOT, CDS_ARCHIVE)}', *jvm_args)
+    return ['java', *jvm_args, '-Xss10m', f'-Xmx{mem}', '-jar', jar or os.path.join(ROOT, JAR), *args]
+
+
+def build():
+    """Build the assembly jar of the working tree."""
+    subprocess.run(['sbt', 'assembly'], cwd=ROOT, check=True)
+
+
+def cds_stale(jar=None):
+    """Whether the class-data sharing archive is missing or older than the jar: the JVM rejects an archive of another jar, and silently starts without it."""
+    archive = os.path.join(ROOT, CDS_ARCHIVE)
+    return not os.path.exists(archive) or os.path.getmtime(archive) < os.path.getmtime(jar or os.path.join(ROOT, JAR))
+
+
+def build_cds(workload='nkpl/fig10/Airtel_reachability.nkpl'):
+    """Build the class-data sharing archive of the `cds` runtime from the classes that running `workload` loads (JDK 13 or later)."""
+    subprocess.run(katch_command(['run', '--no-cache', workload], jvm_args=[f'-XX:ArchiveClassesAtExit={os.path.join(ROOT, CDS_ARCHIVE)}']),
+                   cwd=scratch_dir('cds'), check=True, stdout=subprocess.DEVNULL)
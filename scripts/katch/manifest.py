@@ -0,0 +1,168 @@
+"""The benchmark manifest (`benchmarks.toml`): which files make up each suite, and how they are run and grouped.
+
+    from katch.manifest import load_manifest
+    manifest = load_manifest()
+    b = manifest.lookup('nkpl/fig10/Airtel_slicing.nkpl')
+    b.family, b.name, b.query, b.size   # 'Topology Zoo', 'Airtel', 'slicing', ...
+
+Files that no suite lists have no benchmark (`lookup` returns `None`), so new
+suites only need an entry in the manifest.
+"""
+import fnmatch
+import glob
+import os
+import re
+from dataclasses import dataclass, field
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+from .jvm import ROOT
+
+DEFAULT_PATH = os.path.join(ROOT, 'benchmarks.toml')
+SIZE_METRICS = ['imports', 'file+imports']
+VERDICTS = ['pass', 'fail']
+
+
+@dataclass
+class Suite:
+    """One `[[suite]]` entry of the manifest; see `benchmarks.toml` for the fields."""
+    name: str
+    family: str
+    files: list
+    query: object
+    alg: str = 'naive'
+    systems: list = field(default_factory=lambda: ['katch'])
+    timeout: float = None
+    expected: object = 'pass'
+    reps: int = 1
+    warmup: bool = False
+    size: str = 'imports'
+    paper: bool = False
+    expensive: bool = False
+
+    def paths(self):
+        """The files of the suite that exist, relative to the repository root, sorted by file name as `katch run` does."""
+        found = {os.path.relpath(p, ROOT) for pattern in self.files for p in glob.glob(os.path.join(ROOT, pattern))}
+        return sorted(found, key=lambda p: (os.path.basename(p), p))
+
+    def matches(self, path):
+        return any(fnmatch.fnmatch(path, pattern) for pattern in self.files)
+
+
+@dataclass
+class Benchmark:
+    """One file of a suite."""
+    path: str
+    suite: Suite
+    name: str
+    query: str
+    expected: str
+
+    @property
+    def family(self):
+        return self.suite.family
+
+    @property
+    def alg(self):
+        return self.suite.alg
+
+    @property
+    def size(self):
+        return network_size(self.path, self.suite.size)
+
+
+def _by_pattern(value, path, what):
+    """`value` itself if it is a string, otherwise the value of the first pattern in the table `value` that matches the file name."""
+    if isinstance(value, str):
+        return value
+    for pattern, v in value.items():
+        if fnmatch.fnmatch(os.path.basename(path), pattern):
+            return v
+    raise ValueError(f'No {what} for {path} in the manifest')
+
+
+class Manifest:
+    def __init__(self, suites):
+        self.suites = suites
+        self._lookups = {}
+
+    def suite(self, name):
+        for s in self.suites:
+            if s.name == name:
+                return s
+        raise KeyError(f'No suite {name!r} in the manifest; the suites are {", ".join(s.name for s in self.suites)}')
+
+    def lookup(self, path):
+        """The benchmark of the file at `path` (relative to the repository root or absolute), or `None` if no suite lists it."""
+        if path not in self._lookups:
+            rel = os.path.normpath(os.path.relpath(path, ROOT) if os.path.isabs(path) else path)
+            suite = next((s for s in self.suites if s.matches(rel)), None)
+            self._lookups[path] = suite and Benchmark(
+                rel, suite, re.split(r'[-_]', os.path.basename(rel))[0].split('.')[0],
+                _by_pattern(suite.query, rel, 'query type'), _by_pattern(suite.expected, rel, 'expected verdict'))
+        return self._lookups[path]
+
+    def family(self, path, default=None):
+        b = self.lookup(path)
+        return b.family if b else default
+
+    def select(self, names=(), exclude=(), expensive=False, paper=True):
+        """The suites named in `names` (all of them if empty, restricted to the paper's if `paper`, without expensive ones unless `expensive`), minus those in `exclude`."""
+        for n in [*names, *exclude]:
+            self.suite(n)
+        if names:
+            chosen = [s for s in self.suites if s.name in names]
+        else:
+            chosen = [s for s in self.suites if (s.paper or not paper) and (expensive or not s.expensive)]
+        return [s for s in chosen if s.name not in exclude]
+
+
+def load_manifest(path=DEFAULT_PATH):
+    """Reads and checks the manifest at `path`."""
+    with open(path, 'rb') as f:
+        entries = tomllib.load(f).get('suite', [])
+    suites = []
+    for entry in entries:
+        try:
+            s = Suite(**entry)
+        except TypeError as e:
+            raise ValueError(f'Bad suite {entry.get("name")!r} in {path}: {e}')
+        if s.size not in SIZE_METRICS:
+            raise ValueError(f'Suite {s.name!r} has size {s.size!r}, expected one of {", ".join(SIZE_METRICS)}')
+        verdicts = [s.expected] if isinstance(s.expected, str) else list(s.expected.values())
+        if any(v not in VERDICTS for v in verdicts):
+            raise ValueError(f'Suite {s.name!r} expects {s.expected!r}, expected one of {", ".join(VERDICTS)}')
+        if 'frenetic' in s.systems and s.timeout is None:
+            raise ValueError(f'Suite {s.name!r} runs Frenetic without a timeout')
+        suites.append(s)
+    names = [s.name for s in suites]
+    if len(set(names)) != len(names):
+        raise ValueError(f'Duplicate suite names in {path}')
+    return Manifest(suites)
+
+
+def atoms(path):
+    """The number of atoms (=, ≠, δ, ←) in the file at `path`."""
+    with open(path) as f:
+        contents = f.read()
+    return contents.count('≠') + contents.count('=') + contents.count('δ') + contents.count('←')
+
+
+def network_size(path, metric='imports'):
+    """The size of a benchmark by `metric`: the atoms in the files it imports, plus those in the file itself for `file+imports`. Files that don't exist count as size 0."""
+    full = os.path.join(ROOT, path)
+    try:
+        with open(full) as f:
+            contents = f.read()
+        total = atoms(full) if metric == 'file+imports' else 0
+        for line in contents.split('\n'):
+            match = re.match(r'import "(.+?)"', line)
+            if match:
+                total += atoms(os.path.join(os.path.dirname(full), match.group(1)))
+        return total
+    except IOError as e:
+        print(f"\033[91mError reading file: {e.filename}\033[0m")
+        return 0
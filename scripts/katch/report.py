@@ -0,0 +1,210 @@
+"""Building the figures and tables of a report incrementally, with a static HTML dashboard.
+
+Every figure or table is a `Target`: a function that writes its output files
+from a slice of one of the report's frames. The slice is declared by the
+target, as the rows it reads (a dict from column to the allowed values) and
+the columns it reads. `Report.build` fingerprints every target's slice,
+parameters and code, and rebuilds only the targets whose fingerprint differs
+from the last build (kept in `<output_dir>/.<name>-state.json`) or whose
+outputs are missing. `<name>.html` in the output directory shows every target,
+with its figures (from their `.svg` outputs) and tables (from their `.html`
+outputs) inline and links to the other outputs.
+
+The functions below turn a `comparison.csv` file into frames with vectorized
+pandas operations: benchmark columns come from the manifest once per distinct
+path, and times, timeouts and system labels are computed per column, so
+tens of thousands of rows take well under a second.
+
+    report = Report('results/plots', {'results': df, 'merged': merged})
+    report.add(Target('Fig10a', ['Fig10a.pdf', 'Fig10a.svg'], plot_fn, frame='merged', rows={'group': 'Topology Zoo'}))
+    report.build()
+"""
+import hashlib
+import html
+import inspect
+import json
+import os
+import time
+from dataclasses import dataclass, field
+
+KEYS = ['name', 'type', 'group', 'size']
+
+
+@dataclass
+class Target:
+    """A figure or table. `build(df, paths, **params)` writes `outputs` (paths relative to the output directory, passed as absolute paths) from the slice `df` of `frame`."""
+    name: str
+    outputs: list
+    build: object
+    frame: str = 'results'
+    rows: dict = field(default_factory=dict)
+    columns: list = None
+    params: dict = field(default_factory=dict)
+    title: str = None
+
+
+def _code(fn):
+    try:
+        return inspect.getsource(fn)
+    except (OSError, TypeError):
+        return fn.__code__.co_code.hex()
+
+
+class Report:
+    def __init__(self, output_dir, frames, title='KATch results', name='index'):
+        self.output_dir = output_dir
+        self.name = name
+        self.frames = frames
+        self.title = title
+        self.targets = []
+        self.state_path = os.path.join(output_dir, f'.{name}-state.json')
+
+    def add(self, target):
+        self.targets.append(target)
+        return target
+
+    def select(self, target):
+        """The rows and columns of its frame that `target` reads."""
+        df = self.frames[target.frame]
+        for column, values in target.rows.items():
+            df = df[df[column].isin(values if isinstance(values, (list, tuple, set)) else [values])]
+        return df if target.columns is None else df[target.columns]
+
+    def fingerprint(self, target, df):
+        import pandas as pd
+        h = hashlib.sha256()
+        h.update(json.dumps([target.outputs, target.params, list(map(str, df.columns))], sort_keys=True, default=str).encode())
+        h.update(_code(target.build).encode())
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        return h.hexdigest()
+
+    def build(self, force=False):
+        """Rebuilds the targets whose inputs changed (all of them if `force`) and the dashboard, and returns the names of the rebuilt targets."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            state = {}
+        rebuilt = []
+        for t in self.targets:
+            df = self.select(t)
+            fp = self.fingerprint(t, df)
+            paths = [os.path.join(self.output_dir, o) for o in t.outputs]
+            if not force and state.get(t.name) == fp and all(os.path.exists(p) for p in paths):
+                continue
+            if df.empty:
+                print(f'{t.name}: no data, skipping')
+                state.pop(t.name, None)
+                continue
+            start = time.perf_counter()
+            t.build(df, paths, **t.params)
+            print(f'{t.name}: built in {time.perf_counter() - start:.2f} s')
+            state[t.name] = fp
+            rebuilt.append(t.name)
+            self._save(state)
+        self._save(state)
+        index = os.path.join(self.output_dir, f'{self.name}.html')
+        if rebuilt or not os.path.exists(index):
+            self.dashboard(index, state)
+        return rebuilt
+
+    def _save(self, state):
+        with open(self.state_path, 'w') as f:
+            json.dump(state, f, indent=1)
+
+    def dashboard(self, path, state):
+        """Writes the dashboard of the targets that have been built."""
+        sections = []
+        for t in self.targets:
+            if t.name not in state:
+                continue
+            parts = [f'<h2 id="{html.escape(t.name)}">{html.escape(t.title or t.name)}</h2>']
+            for o in t.outputs:
+                if o.endswith('.svg'):
+                    parts.append(f'<img src="{html.escape(o)}" alt="{html.escape(t.name)}">')
+                elif o.endswith('.html'):
+                    with open(os.path.join(self.output_dir, o)) as f:
+                        parts.append(f.read())
+            links = ' '.join(f'<a href="{html.escape(o)}">{html.escape(o)}</a>' for o in t.outputs if not o.endswith(('.svg', '.html')))
+            if links:
+                parts.append(f'<p class="links">{links}</p>')
+            sections.append('<section>\n' + '\n'.join(parts) + '\n</section>')
+        toc = ' · '.join(f'<a href="#{html.escape(t.name)}">{html.escape(t.title or t.name)}</a>' for t in self.targets if t.name in state)
+        with open(path, 'w') as f:
+            f.write(f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(self.title)}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+section {{ display: inline-block; vertical-align: top; margin: 0 2em 2em 0; }}
+img {{ max-width: 48em; }}
+table {{ border-collapse: collapse; }}
+td, th {{ border: 1px solid #ccc; padding: 0.2em 0.5em; text-align: right; }}
+</style></head>
+<body>
+<h1>{html.escape(self.title)}</h1>
+<p>Updated {time.strftime('%Y-%m-%d %H:%M')}. {toc}</p>
+{chr(10).join(sections)}
+</body></html>
+''')
+
+
+def load_comparison(path, manifest):
+    """The rows of a `comparison.csv` file (`system,path,time`) with the columns `group`, `name`, `type`, `size` and `alg` of each file's benchmark, and `time` in seconds (the limit for a timeout) and `timeout`. Files that no suite lists are dropped."""
+    import numpy as np
+    import pandas as pd
+    df = pd.read_csv(path, names=['system', 'path', 'time'], dtype=str)
+    benchmarks = {p: manifest.lookup(p) for p in df['path'].unique()}
+    for p, b in benchmarks.items():
+        if b is None:
+            print(f'{p} is in no suite of benchmarks.toml, skipping')
+    info = pd.DataFrame([(p, b.family, b.name, b.query, b.size, b.alg) for p, b in benchmarks.items() if b],
+                        columns=['path', 'group', 'name', 'type', 'size', 'alg'])
+    df = df.merge(info, on='path')
+    df['timeout'] = df['time'].str.contains('timeout', regex=False)
+    limit = df['time'].str.extract(r'\((\d+)s\)', expand=False).astype(float)
+    df['time'] = np.where(df['timeout'], limit, pd.to_numeric(df['time'], errors='coerce'))
+    return df
+
+
+def timeout_used(df):
+    """The Frenetic timeout of the rows that timed out, or `None`. Raises `ValueError` if they used different timeouts."""
+    limits = df.loc[df['timeout'], 'time'].unique()
+    if len(limits) > 1:
+        raise ValueError('Inconsistent timeouts! Restart with clean comparison.csv.')
+    return limits[0] if len(limits) else None
+
+
+def merge_systems(df, systems):
+    """One row per benchmark that all `systems` ran, with the mean `time_<system>` and the `alg_<system>` of each."""
+    avg = df.groupby(['system', *KEYS, 'alg'])['time'].mean().reset_index()
+    merged = None
+    for s in systems:
+        part = avg[avg['system'] == s].drop(columns='system').rename(columns={'time': f'time_{s}', 'alg': f'alg_{s}'})
+        merged = part if merged is None else merged.merge(part, on=KEYS)
+    return merged
+
+
+def long_times(merged, systems):
+    """`merged` with one row per benchmark and system: `group`, `size`, `system`, `time` and `alg`."""
+    import pandas as pd
+    return pd.concat([merged[['group', 'size']].assign(system=s, time=merged[f'time_{s}'], alg=merged[f'alg_{s}']) for s in systems],
+                     ignore_index=True)
+
+
+def save_figure(fig, paths):
+    """Saves `fig` to every path, in the format of its extension, and closes it."""
+    import matplotlib.pyplot as plt
+    for p in paths:
+        fig.savefig(p, bbox_inches='tight', format=os.path.splitext(p)[1][1:])
+    plt.close(fig)
+
+
+def write_table(df, paths):
+    """Writes `df` as a LaTeX table to the `.tex` paths and as an HTML table to the `.html` paths."""
+    for p in paths:
+        with open(p, 'w') as f:
+            if p.endswith('.tex'):
+                f.write(df.to_latex(index=False, na_rep='n/a', float_format='%.2f'))
+            else:
+                f.write(df.to_html(index=False, na_rep='n/a', float_format='%.2f'))
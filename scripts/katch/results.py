@@ -0,0 +1,128 @@
+"""The results store: a SQLite database that benchmark tooling records measurements in.
+
+`results/comparison.csv` keeps one whole-file time per system. The store keeps
+finer-grained measurements that don't fit that format, keyed so that re-runs
+update rows instead of appending duplicates.
+"""
+import os
+import sqlite3
+import time
+
+DEFAULT_PATH = 'results/results.db'
+
+SCHEMA = [
+    # One row per distinct pair of .kat files exported by `katch convert`.
+    # `katch` is KATch's verdict, `frenetic` is 'true', 'false', 'timeout' or 'error',
+    # and `version` is the commit of KATch when the row was recorded.
+    '''CREATE TABLE IF NOT EXISTS frenetic_pairs (
+        lhs TEXT, rhs TEXT, katch TEXT, frenetic TEXT, time REAL, timeout REAL, version TEXT,
+        PRIMARY KEY (lhs, rhs))''',
+    # Which pairs each KAT index file (one per .nkpl file) refers to.
+    '''CREATE TABLE IF NOT EXISTS frenetic_index (
+        idx TEXT, line INTEGER, lhs TEXT, rhs TEXT,
+        PRIMARY KEY (idx, line))''',
+    # Memory use per benchmark file, imported from results/memory.csv (see `Memory.scala`).
+    # `source` is the csv file name, so cold and warm (hotmemory.csv) runs are kept apart.
+    '''CREATE TABLE IF NOT EXISTS memory (
+        source TEXT, system TEXT, path TEXT, peak_heap INTEGER, allocated INTEGER, alloc_rate REAL,
+        gc_time REAL, gc_count REAL, sp_nodes INTEGER, spp_nodes INTEGER,
+        PRIMARY KEY (source, system, path))''',
+    # The time of every iteration of a `for` loop in the latest run that measured it (see `distribute.py`).
+    # `stmt` is the index of the loop among the statements of `path`.
+    '''CREATE TABLE IF NOT EXISTS loop_costs (
+        path TEXT, stmt INTEGER, i INTEGER, time REAL,
+        PRIMARY KEY (path, stmt, i))''',
+    # The benchmark files of the manifest (`benchmarks.toml`), so that measurements can be joined with their suite and family.
+    '''CREATE TABLE IF NOT EXISTS benchmarks (
+        path TEXT PRIMARY KEY, suite TEXT, family TEXT, name TEXT, query TEXT, alg TEXT, size INTEGER, expected TEXT)''',
+    # The verdict of the latest run of every benchmark file by `scripts/run-suites.py`: 'pass', 'fail' or 'error'.
+    '''CREATE TABLE IF NOT EXISTS verdicts (
+        path TEXT, system TEXT, verdict TEXT, expected TEXT, wall REAL,
+        PRIMARY KEY (path, system))''',
+    # The time and node counts of every size of a benchmark family (see `katch.families`), per engine version.
+    # `version` is the commit that was measured; `timeout` is 1 for a size that was cut off.
+    '''CREATE TABLE IF NOT EXISTS scaling (
+        family TEXT, version TEXT, n INTEGER, time REAL, sp_nodes INTEGER, spp_nodes INTEGER, timeout INTEGER,
+        PRIMARY KEY (family, version, n))''',
+    # The model fitted to each metric of a family by `katch.scaling.fit`, per engine version.
+    '''CREATE TABLE IF NOT EXISTS scaling_fits (
+        family TEXT, metric TEXT, version TEXT, model TEXT, exponent REAL, a REAL, r2 REAL, points INTEGER, recorded REAL,
+        PRIMARY KEY (family, metric, version))''',
+]
+
+MIGRATIONS = [('frenetic_pairs', 'version', 'TEXT')]
+
+MEMORY_COLUMNS = ['system', 'path', 'peak_heap', 'allocated', 'alloc_rate', 'gc_time', 'gc_count', 'sp_nodes', 'spp_nodes']
+
+
+def open_store(path=DEFAULT_PATH):
+    """Open (creating if necessary) the results store at `path`."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    for stmt in SCHEMA:
+        db.execute(stmt)
+    # Columns added since a table was first created
+    for table, column, type_ in MIGRATIONS:
+        if column not in [row['name'] for row in db.execute(f'PRAGMA table_info({table})')]:
+            db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {type_}')
+    db.commit()
+    return db
+
+
+def import_memory(db, csv_path):
+    """Import the memory measurements of a `memory.csv` file into the store. Later lines win, as in re-runs."""
+    source = os.path.basename(csv_path)
+    with open(csv_path) as f:
+        for line in f:
+            fields = line.strip().split(',')
+            if len(fields) == len(MEMORY_COLUMNS):
+                db.execute(f'INSERT OR REPLACE INTO memory VALUES ({", ".join("?" * (len(fields) + 1))})', (source, *fields))
+    db.commit()
+
+
+def loop_costs(db, path, stmt):
+    """The iteration times of loop `stmt` of `path` recorded by earlier runs, as a dict from iteration to seconds."""
+    rows = db.execute('SELECT i, time FROM loop_costs WHERE path = ? AND stmt = ?', (path, stmt))
+    return {row['i']: row['time'] for row in rows}
+
+
+def record_loop_costs(db, path, stmt, times):
+    """Record the iteration times (a dict from iteration to seconds) of loop `stmt` of `path`, replacing older ones."""
+    db.executemany('INSERT OR REPLACE INTO loop_costs VALUES (?, ?, ?, ?)',
+                   [(path, stmt, i, t) for i, t in times.items()])
+    db.commit()
+
+
+def record_benchmarks(db, benchmarks):
+    """Record the suite, family, name, query type, algorithm, size and expected verdict of `benchmarks` (see `katch.manifest`)."""
+    db.executemany('INSERT OR REPLACE INTO benchmarks VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                   [(b.path, b.suite.name, b.family, b.name, b.query, b.alg, b.size, b.expected) for b in benchmarks])
+    db.commit()
+
+
+def record_verdict(db, path, system, verdict, expected, wall):
+    """Record the verdict and wall-clock time of a run of the benchmark at `path`, replacing the older one."""
+    db.execute('INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?)', (path, system, verdict, expected, wall))
+    db.commit()
+
+
+def record_scaling(db, family, version, rows, fits):
+    """Record the measurements (dicts with `n` and the metrics) and fitted models (a dict from metric to `fit` result or `None`) of a sweep of `family`."""
+    db.executemany('INSERT OR REPLACE INTO scaling VALUES (?, ?, ?, ?, ?, ?, ?)',
+                   [(family, version, r['n'], r.get('time'), r.get('sp_nodes'), r.get('spp_nodes'), int(r.get('timeout', False)))
+                    for r in rows])
+    db.executemany('INSERT OR REPLACE INTO scaling_fits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                   [(family, metric, version, f['model'], f['exponent'], f['a'], f['r2'], f['points'], time.time())
+                    for metric, f in fits.items() if f])
+    db.commit()
+
+
+def baseline_fit(db, family, metric, version=None, current=None):
+    """The fit of `metric` for `family` recorded for `version`, or by default the latest one recorded for a version other than `current` (`None` if there is none)."""
+    if version is not None:
+        return db.execute('SELECT * FROM scaling_fits WHERE family = ? AND metric = ? AND version = ?',
+                          (family, metric, version)).fetchone()
+    return db.execute('SELECT * FROM scaling_fits WHERE family = ? AND metric = ? AND version IS NOT ? ORDER BY recorded DESC LIMIT 1',
+                      (family, metric, current)).fetchone()
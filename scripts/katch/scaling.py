@@ -0,0 +1,110 @@
+"""Measuring how the running time and node counts of a benchmark family grow with its size.
+
+`sweep` runs the sizes of a family (see `katch.families`) in increasing order
+on a `katch serve` process, with cold caches for every size. It stops once
+the family's time budget is used up, or once the fitted model predicts that
+the next size would not fit in the rest of the budget. A size that runs past
+`max_run` seconds is cut off by killing the server.
+
+`fit` fits two models by least squares in log space, over the larger half of
+the sizes (where the asymptotic growth shows):
+
+  - polynomial, y = a·n^k: the exponent is k;
+  - exponential, y = a·2^(k·n): the exponent is k, the doublings per unit of n.
+
+The model with the smaller residual wins. Comparing the exponents of two
+engine versions catches complexity regressions, which a fixed-size benchmark
+only shows as a constant factor.
+"""
+import math
+import threading
+
+from .client import Client
+from .families import write
+from .jvm import ROOT, katch_command
+
+METRICS = ['time', 'sp_nodes', 'spp_nodes']
+
+
+def sizes(start=1, growth=1.25):
+    """The sizes `start`, then about `growth` times the previous size, and at least one more."""
+    n = start
+    while True:
+        yield n
+        n = max(n + 1, round(n * growth))
+
+
+def _least_squares(xs, ys):
+    """The intercept, slope and residual sum of squares of the line through `(xs, ys)`."""
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    sxx = sum((x - mx) ** 2 for x in xs)
+    slope = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sxx if sxx else 0.0
+    intercept = my - slope * mx
+    return intercept, slope, sum((y - intercept - slope * x) ** 2 for x, y in zip(xs, ys))
+
+
+def fit(ns, ys, min_points=3):
+    """The best of the polynomial and exponential models for `ys` at sizes `ns`, as a dict with `model`, `exponent`, `a`, `r2` and `points`, or `None` with fewer than `min_points` positive values."""
+    points = sorted((n, y) for n, y in zip(ns, ys) if y > 0)
+    points = points[len(points) // 2:] if len(points) >= 2 * min_points else points
+    if len(points) < min_points:
+        return None
+    logy = [math.log2(y) for _, y in points]
+    total = sum((v - sum(logy) / len(logy)) ** 2 for v in logy)
+    best = None
+    for model, xs in [('poly', [math.log2(n) for n, _ in points]), ('exp', [n for n, _ in points])]:
+        intercept, slope, residual = _least_squares(xs, logy)
+        if best is None or residual < best['residual']:
+            best = {'model': model, 'exponent': slope, 'a': 2 ** intercept, 'residual': residual,
+                    'r2': 1 - residual / total if total else 1.0, 'points': len(points)}
+    del best['residual']
+    return best
+
+
+def predict(f, n):
+    """The value of the fitted model `f` at size `n`."""
+    return f['a'] * (n ** f['exponent'] if f['model'] == 'poly' else 2 ** (f['exponent'] * n))
+
+
+def _measure(client, path, max_run):
+    """Runs `path` on a clean server and returns its time and the nodes it left in the unique tables, or `None` if it ran past `max_run` seconds."""
+    client.request('clear')
+    client.request('reset')
+    timer = threading.Timer(max_run, client.proc.kill)
+    timer.start()
+    try:
+        t = client.load(path)['time']
+        stats = client.stats()
+    except (EOFError, OSError, ValueError):
+        return None
+    finally:
+        timer.cancel()
+    return {'time': t, 'sp_nodes': stats['sp_nodes'], 'spp_nodes': stats['spp_nodes']}
+
+
+def sweep(family, budget, directory, max_run=None, max_n=1000, growth=1.25, warmup=3, mem='16g', options=()):
+    """Runs the sizes of `family` up to `max_n` until `budget` seconds are used up, and returns a list of dicts with `n` and the `METRICS`; the last one has `timeout` set if it was cut off."""
+    max_run = max_run or budget
+    rows, used = [], 0.0
+    client = Client(command=katch_command(['serve', *options, '--stdio'], mem=mem), cwd=ROOT)
+    try:
+        for n in range(1, warmup + 1):
+            _measure(client, write(family, n, directory), max_run)
+        for n in sizes(growth=growth):
+            if n > max_n:
+                break
+            if rows:
+                f = fit([r['n'] for r in rows], [r['time'] for r in rows])
+                if f and used + predict(f, n) > budget:
+                    break
+            m = _measure(client, write(family, n, directory), min(max_run, budget - used))
+            if m is None:
+                rows.append({'n': n, 'timeout': True})
+                break
+            rows.append(dict(m, n=n))
+            used += m['time']
+            if used >= budget:
+                break
+    finally:
+        client.close()
+    return rows
@@ -0,0 +1,80 @@
+"""Reading and summarizing per-statement traces (`./katch run --trace <file>`).
+
+Each line of a trace is a JSON record for one statement; see
+`src/main/scala/Trace.scala` for the fields.
+"""
+import json
+import os
+
+from .manifest import load_manifest
+
+# Summed over the records of a group
+SUMMED = ['wall', 'eps', 'delta', 'spp', 'gc_time', 'iterations', 'states',
+          'sp_nodes', 'spp_nodes', 'memo_calls', 'memo_misses', 'gc_count']
+
+
+def load(path):
+    """Read the records of a trace file. A truncated last line (from a killed run) is skipped."""
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+    return records
+
+
+_manifest = None
+
+
+def family(path):
+    """The benchmark family of an input file in the manifest (`benchmarks.toml`), or its directory if no suite lists it."""
+    global _manifest
+    if _manifest is None:
+        _manifest = load_manifest()
+    b = _manifest.lookup(path)
+    if b is None:
+        return os.path.dirname(path) or 'misc'
+    # Variants such as linear reachability are summarized separately
+    return b.family if b.alg == 'naive' else f'{b.family} ({b.alg})'
+
+
+KEYS = {
+    'family': lambda r: family(r['input']),
+    'input': lambda r: r['input'],
+    'stmt': lambda r: r['stmt'],
+    'line': lambda r: f"{r['file']}:{r['line']}",
+}
+
+
+def last_runs(records):
+    """Keep only the records of the last run of every input file (warmup mode runs each file many times)."""
+    last = {}
+    for r in records:
+        last[r['input']] = max(last.get(r['input'], 0), r['run'])
+    return [r for r in records if r['run'] == last[r['input']]]
+
+
+def rollup(records, by='family'):
+    """Aggregate records into one row per group, sorted by decreasing wall time.
+
+    Every row has the sums of the `SUMMED` fields, the number of statements,
+    the largest peak queue, the time not accounted for by ε/δ/SPP (`other`; GC
+    pauses fall inside those timers, so `gc_time` is not subtracted again),
+    and the memo cache hit rate.
+    """
+    key = KEYS[by]
+    groups = {}
+    for r in records:
+        g = groups.setdefault(key(r), dict({f: 0 for f in SUMMED}, group=key(r), statements=0, failed=0, peak_queue=0))
+        for f in SUMMED:
+            g[f] += r[f]
+        g['statements'] += 1
+        g['failed'] += not r['ok']
+        g['peak_queue'] = max(g['peak_queue'], r['peak_queue'])
+    rows = sorted(groups.values(), key=lambda g: -g['wall'])
+    for g in rows:
+        g['other'] = g['wall'] - g['eps'] - g['delta'] - g['spp']
+        g['hit_rate'] = 1 - g['memo_misses'] / g['memo_calls'] if g['memo_calls'] else None
+    return rows
@@ -0,0 +1,68 @@
+#!/bin/bash
+# Builds target/native/katch, an ahead-of-time compiled KATch binary, with GraalVM's native-image.
+#
+#   1. Builds the assembly jar.
+#   2. Runs the training files on the JVM with the native-image agent, to record the reflection that
+#      the binary needs (Scala 3 lazy vals look up their fields reflectively).
+#   3. Builds an instrumented binary and runs the training files with it, collecting one profile per file.
+#   4. Builds the final binary with all profiles (profile-guided optimization).
+#
+# PGO needs Oracle GraalVM. With GraalVM Community Edition, pass --no-pgo to skip steps 3 and 4 and
+# build without profiles. Run the binary through `KATCH_RUNTIME=native ./katch`, and compare it with
+# the JVM using scripts/bench-startup.py.
+#
+# usage: scripts/native-image.sh [--no-pgo] [training .nkpl files...]
+set -e
+cd "$(dirname "$0")/.."
+
+JAR=target/scala-3.3.1/KATch-assembly-0.1.0-SNAPSHOT.jar
+OUT=target/native
+PGO=1
+if [ "$1" == "--no-pgo" ]; then
+  PGO=0
+  shift
+fi
+TRAINING=("$@")
+if [ ${#TRAINING[@]} -eq 0 ]; then
+  # Small files from each benchmark suite, so that the profile covers checks, forward queries and loops
+  TRAINING=(nkpl/fig10/Airtel_*.nkpl nkpl/fig10/Arpa_*.nkpl nkpl/fig11/inc/inc1[0-5].nkpl
+            nkpl/fig11/flip/flip1[0-5].nkpl nkpl/fig11/nondet/nondet1[0-5].nkpl
+            nkpl/fig09/linear-reachability/Abilene.nkpl)
+fi
+
+command -v native-image > /dev/null || { echo "native-image not found: install GraalVM and put its bin directory on PATH"; exit 1; }
+
+sbt assembly
+mkdir -p "$OUT/profiles"
+rm -rf "$OUT/config" "$OUT"/profiles/*
+
+# The training runs write results/*.csv, so they run in a scratch directory
+WORK=results/native/.work
+mkdir -p "$WORK/results"
+ln -sfn "$PWD/nkpl" "$WORK/nkpl"
+ROOT=$PWD
+
+echo "Recording reflection configuration"
+for f in "${TRAINING[@]}"; do
+  (cd "$WORK" && java -agentlib:native-image-agent=config-merge-dir="$ROOT/$OUT/config" -Xss10m \
+    -jar "$ROOT/$JAR" run --no-cache "$f" > /dev/null)
+done
+
+COMMON=(--no-fallback -H:ConfigurationFileDirectories="$OUT/config" -jar "$JAR")
+
+if [ $PGO -eq 1 ]; then
+  echo "Building the instrumented binary"
+  native-image --pgo-instrument "${COMMON[@]}" -o "$OUT/katch-instrumented"
+  echo "Collecting profiles"
+  i=0
+  for f in "${TRAINING[@]}"; do
+    (cd "$WORK" && ulimit -s 1048576 2> /dev/null; "$ROOT/$OUT/katch-instrumented" -Xss10m \
+      -XX:ProfilesDumpFile="$ROOT/$OUT/profiles/$i.iprof" run --no-cache "$f" > /dev/null)
+    i=$((i + 1))
+  done
+  echo "Building the optimized binary"
+  native-image --pgo="$(ls "$OUT"/profiles/*.iprof | paste -sd, -)" "${COMMON[@]}" -o "$OUT/katch"
+else
+  native-image -O3 "${COMMON[@]}" -o "$OUT/katch"
+fi
+echo "Built $OUT/katch"
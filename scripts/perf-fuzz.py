@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""Hunt for checks that make KATch slow, and minimize them into a performance regression suite.
+
+Generates random pairs of NetKAT terms (see `scripts/katch/fuzz.py`) and checks
+their equivalence on `--workers` `katch serve` processes in parallel, with
+cold caches for every check and a `--timeout` per check. Generation is
+steered towards expensive checks: a corpus keeps the `--corpus` pairs with the
+highest time (or SP/SPP node count, with `--objective nodes`), and most new
+pairs are mutations of one of them. With `--frenetic`, every pair is also
+checked by Frenetic, and pairs on which the verdicts differ are kept too.
+
+After `--budget` seconds, each finding is measured again, and the ones that
+are still slow (at least `--slow` seconds or `--nodes` nodes), time out, crash
+KATch or diverge from Frenetic are shrunk to a minimal pair with the same
+problem. Every reproducer is written to `--out` as a file with one check and
+a `-- fuzz:` line holding its kind and measurements; those whose verdict is
+known form the `perf-fuzz` suite of `benchmarks.toml`, and crashes and
+checks that time out even after `--verdict-timeout` seconds go to
+`--out`/open. Every measured pair is logged to `--csv`.
+
+`--replay` runs the reproducers in `--out` instead, and exits with status 1
+if a check now fails, or its node count grew by more than `--tolerance` (or
+its time by more than `--time-tolerance`) relative to its `-- fuzz:` line:
+
+    python3 scripts/perf-fuzz.py --budget 600 --workers 4 --size 25 --fields 3 --values 4
+    python3 scripts/perf-fuzz.py --frenetic --slow 2 --timeout 20
+    python3 scripts/perf-fuzz.py --replay
+
+usage: perf-fuzz.py [--budget S] [--workers N] [--timeout S] [--slow S] [--nodes N] [--objective time|nodes]
+                    [--size N] [--max-size N] [--fields N] [--values N] [--skew X] [--extended] [--seed N]
+                    [--corpus N] [--explore P] [--frenetic [EXE]] [--max-findings N] [--verdict-timeout S]
+                    [--out DIR] [--csv out.csv] [--no-build]
+       perf-fuzz.py --replay [--tolerance X] [--time-tolerance X] [--timeout S] [--out DIR] [--no-build]
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import os
+import queue
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from katch import Client, KatchError
+from katch.fuzz import Config, frenetic_check, mutate, nkpl, random_pair, shrink, size
+from katch.jvm import ROOT, build, katch_command
+
+RED = '\033[31m'
+GREEN = '\033[32m'
+RESET = '\033[0m'
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--budget', type=float, default=300, help='seconds of fuzzing before the findings are shrunk')
+    p.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2), help='KATch processes')
+    p.add_argument('--timeout', type=float, default=10, help='seconds after which a check is cut off')
+    p.add_argument('--slow', type=float, default=1, help='seconds from which a check is a finding')
+    p.add_argument('--nodes', type=int, help='SP+SPP nodes from which a check is a finding')
+    p.add_argument('--objective', choices=['time', 'nodes'], default='time', help='what generation is steered towards')
+    p.add_argument('--size', type=int, default=20, help='nodes per generated term')
+    p.add_argument('--max-size', type=int, help='nodes up to which mutations may grow a term (default: 4 times --size)')
+    p.add_argument('--fields', type=int, default=3, help='number of fields')
+    p.add_argument('--values', type=int, default=3, help='number of values per field')
+    p.add_argument('--skew', type=float, default=1.0, help='Zipf exponent of field and value choices (0 is uniform)')
+    p.add_argument('--extended', action='store_true', help='also generate ∩, ⊕ and ∖ (not with --frenetic)')
+    p.add_argument('--seed', type=int, help='random seed')
+    p.add_argument('--corpus', type=int, default=32, help='number of expensive pairs that mutations start from')
+    p.add_argument('--explore', type=float, default=0.3, help='fraction of fresh pairs instead of mutations')
+    p.add_argument('--frenetic', nargs='?', const='frenetic', help='also check every pair with this Frenetic executable')
+    p.add_argument('--max-findings', type=int, default=10, help='findings to shrink, most expensive first')
+    p.add_argument('--verdict-timeout', type=float, default=300, help='seconds to find the verdict of a reproducer that timed out')
+    p.add_argument('--replay', action='store_true', help='run the reproducers in --out and report regressions')
+    p.add_argument('--tolerance', type=float, default=0.1, help='node growth that counts as a regression with --replay')
+    p.add_argument('--time-tolerance', type=float, default=1.0, help='time growth that counts as a regression with --replay')
+    p.add_argument('--mem', default='16g', help='maximum heap size')
+    p.add_argument('--out', default=os.path.join(ROOT, 'nkpl', 'perf', 'fuzz'), help='directory of the reproducers')
+    p.add_argument('--csv', default=os.path.join(ROOT, 'results', 'fuzz', 'runs.csv'), help='where to log every measured pair')
+    p.add_argument('--no-build', action='store_true', help='use the existing assembly jar')
+    args = p.parse_args()
+    if args.frenetic and args.extended:
+        p.error('Frenetic does not support --extended')
+    return args
+
+
+def version():
+    """The commit of the working tree, marked dirty if it has changes."""
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=ROOT, check=True, capture_output=True, text=True).stdout.strip()
+    return git('rev-parse', '--short', 'HEAD') + ('-dirty' if git('status', '--porcelain', '--untracked-files=no') else '')
+
+
+class Worker:
+    """One `katch serve` process, restarted when a request is cut off."""
+
+    def __init__(self, mem):
+        self.mem = mem
+        self.client = None
+
+    def _run(self, timeout, f):
+        """Runs `f(client)` on clean caches, killing the server after `timeout` seconds. Returns its result and the node counts, or `None` on a timeout."""
+        if self.client is None:
+            self.client = Client(command=katch_command(['serve', '--stdio'], mem=self.mem), cwd=ROOT)
+        self.client.request('clear')
+        self.client.request('reset')
+        timer = threading.Timer(timeout, self.client.proc.kill)
+        timer.start()
+        try:
+            result = f(self.client)
+            stats = self.client.stats()
+        except (EOFError, OSError, ValueError):
+            self.close()
+            return None
+        finally:
+            timer.cancel()
+        return result, stats['sp_nodes'] + stats['spp_nodes']
+
+    def check(self, lhs, rhs, timeout):
+        """A dict with the `verdict` of `lhs ≡ rhs` (`'true'`, `'false'`, `'timeout'` or `'error'`), its `time` and `nodes`, and the `error` message."""
+        try:
+            r = self._run(timeout, lambda c: c.request('check', lhs=nkpl(lhs), rhs=nkpl(rhs)))
+        except KatchError as e:
+            return {'verdict': 'error', 'time': 0.0, 'nodes': 0, 'error': str(e).split('\n')[0]}
+        if r is None:
+            return {'verdict': 'timeout', 'time': timeout, 'nodes': 0}
+        response, nodes = r
+        return {'verdict': 'true' if response['result'] else 'false', 'time': response['time'], 'nodes': nodes}
+
+    def load(self, path, timeout):
+        """Like `check`, for the file `path`; the verdict is `'true'` if all its checks pass."""
+        try:
+            r = self._run(timeout, lambda c: c.load(path))
+        except KatchError as e:
+            return {'verdict': 'error', 'time': 0.0, 'nodes': 0, 'error': str(e).split('\n')[0]}
+        if r is None:
+            return {'verdict': 'timeout', 'time': timeout, 'nodes': 0}
+        response, nodes = r
+        return {'verdict': 'true', 'time': response['time'], 'nodes': nodes}
+
+    def close(self):
+        if self.client is not None:
+            try:
+                self.client.close()
+            except (EOFError, OSError, ValueError):
+                pass
+            self.client = None
+
+
+class Pool:
+    """The workers, handed out to one task at a time."""
+
+    def __init__(self, n, mem):
+        self.all = [Worker(mem) for _ in range(n)]
+        self.free = queue.Queue()
+        for w in self.all:
+            self.free.put(w)
+
+    def run(self, f, *args):
+        worker = self.free.get()
+        try:
+            return f(worker, *args)
+        finally:
+            self.free.put(worker)
+
+    def close(self):
+        for w in self.all:
+            w.close()
+
+
+def measure(worker, pair, args):
+    """Checks `pair` with KATch, and with Frenetic if enabled."""
+    m = worker.check(*pair, args.timeout)
+    if args.frenetic:
+        m['frenetic'], m['frenetic_time'] = frenetic_check(*pair, args.timeout, args.frenetic)
+    return m
+
+
+def score(m, objective):
+    if m['verdict'] == 'timeout':
+        return float('inf')
+    return m['time'] if objective == 'time' else m['nodes']
+
+
+def problem(m, args):
+    """The kind of problem that the measurement `m` shows, or `None`."""
+    if m['verdict'] in ('timeout', 'error'):
+        return m['verdict']
+    if m.get('frenetic') in ('true', 'false') and m['frenetic'] != m['verdict']:
+        return 'diverge'
+    if m['time'] >= args.slow or (args.nodes is not None and m['nodes'] >= args.nodes):
+        return 'slow'
+    return None
+
+
+def still(kind, m, args, error=None):
+    """Whether the measurement `m` still shows the problem `kind`."""
+    if kind == 'error':
+        return m['verdict'] == 'error' and m['error'] == error
+    if kind == 'diverge':
+        return problem(m, args) == 'diverge'
+    # A slow check may time out while shrinking, and vice versa
+    return problem(m, args) in ('slow', 'timeout')
+
+
+def fuzz(pool, args, rng, cfg, log):
+    """Runs random checks until the budget is used up, and returns the findings as `(score, kind, pair, measurement)`, most expensive first."""
+    corpus, findings = [], {}
+    max_size = args.max_size or 4 * args.size
+    start = time.monotonic()
+    count = 0
+
+    def candidate():
+        if corpus and rng.random() >= args.explore:
+            parent = max(rng.sample(corpus, min(3, len(corpus))), key=lambda c: c[0])[1]
+            lhs, rhs = parent
+            side = rng.random()
+            if side < 0.4:
+                lhs = mutate(rng, cfg, lhs, max_size)
+            elif side < 0.8:
+                rhs = mutate(rng, cfg, rhs, max_size)
+            else:
+                lhs, rhs = mutate(rng, cfg, lhs, max_size), mutate(rng, cfg, rhs, max_size)
+            return lhs, rhs
+        return random_pair(rng, cfg)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        pending = {}
+        while pending or time.monotonic() - start < args.budget:
+            while len(pending) < args.workers and time.monotonic() - start < args.budget:
+                pair = candidate()
+                pending[executor.submit(pool.run, measure, pair, args)] = pair
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pair = pending.pop(future)
+                m = future.result()
+                count += 1
+                log(pair, m)
+                s = score(m, args.objective)
+                # Timeouts and crashes are kept as findings, but not mutated further
+                if m['verdict'] in ('true', 'false'):
+                    corpus.append((s, pair))
+                    corpus.sort(key=lambda c: -c[0])
+                    del corpus[args.corpus:]
+                kind = problem(m, args)
+                if kind:
+                    key = (nkpl(pair[0]), nkpl(pair[1]))
+                    if key not in findings:
+                        print(f'{RED}[{count}] {kind}: {m["verdict"]} in {m["time"]:.2f} s, {m["nodes"]} nodes ({size(pair[0])}+{size(pair[1])} term nodes){RESET}')
+                    findings[key] = (s, kind, pair, m)
+                elif count % 100 == 0:
+                    print(f'[{count}] {time.monotonic() - start:.0f} s, best {corpus[0][0] if corpus else 0:.3g}')
+    print(f'{count} checks, {len(findings)} findings')
+    return sorted(findings.values(), key=lambda f: -f[0])
+
+
+def minimize(worker, finding, args):
+    """Confirms a finding on a warm worker and shrinks it. Returns `(kind, original pair, pair, measurement)`, or `None` if it doesn't reproduce."""
+    _, kind, pair, first = finding
+    error = first.get('error')
+    m = measure(worker, pair, args)
+    if not still(kind, m, args, error):
+        return None
+    pair2, tries = shrink(pair, lambda lhs, rhs: still(kind, measure(worker, (lhs, rhs), args), args, error))
+    m = measure(worker, pair2, args)
+    if kind == 'slow' and m['verdict'] == 'timeout':
+        kind = 'timeout'
+    if kind == 'timeout':
+        m = worker.check(*pair2, args.verdict_timeout)
+        if args.frenetic:
+            m['frenetic'], m['frenetic_time'] = frenetic_check(*pair2, args.timeout, args.frenetic)
+    print(f'Shrunk {kind} from {size(pair[0]) + size(pair[1])} to {size(pair2[0]) + size(pair2[1])} nodes in {tries} checks')
+    return kind, pair, pair2, m
+
+
+def save(kind, original, pair, m, out, current):
+    """Writes the reproducer `pair` to `out` (or `out`/open if its verdict is unknown) and returns its path."""
+    op = '≢' if m['verdict'] == 'false' else '≡'
+    text = f'check {nkpl(pair[0])} {op} {nkpl(pair[1])}\n'
+    name = f'{kind}{hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]}.nkpl'
+    directory = out if m['verdict'] in ('true', 'false') else os.path.join(out, 'open')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    fields = f'kind={kind} verdict={m["verdict"]} time={m["time"]:.3f} nodes={m["nodes"]}'
+    if 'frenetic' in m:
+        fields += f' frenetic={m["frenetic"]} frenetic_time={m["frenetic_time"]:.3f}'
+    with open(path, 'w') as f:
+        f.write(f'-- Found by scripts/perf-fuzz.py at {current}, shrunk from {size(original[0]) + size(original[1])} '
+                f'to {size(pair[0]) + size(pair[1])} term nodes.\n')
+        if 'error' in m:
+            f.write(f'-- Error: {m["error"]}\n')
+        f.write(f'-- fuzz: {fields}\n')
+        f.write(text)
+    return path
+
+
+def recorded(path):
+    """The fields of the `-- fuzz:` line of a reproducer."""
+    with open(path) as f:
+        for line in f:
+            if line.startswith('-- fuzz:'):
+                return dict(re.findall(r'(\w+)=(\S+)', line))
+    return {}
+
+
+def replay(args):
+    """Runs the reproducers of `--out` and returns the number of failures and regressions."""
+    paths = sorted(glob.glob(os.path.join(args.out, '*.nkpl')))
+    pool = Pool(args.workers, args.mem)
+    bad = 0
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(pool.run, lambda w, p: w.load(os.path.relpath(p, ROOT), args.timeout), p) for p in paths]
+            print(f'{"reproducer":24} {"time":>8} {"was":>8} {"nodes":>9} {"was":>9}')
+            for path, future in zip(paths, futures):
+                m, old = future.result(), recorded(path)
+                name = os.path.basename(path)
+                if m['verdict'] != 'true':
+                    bad += 1
+                    print(f'{RED}{name:24} {m["verdict"]} {m.get("error", "")}{RESET}')
+                    continue
+                was_time, was_nodes = float(old.get('time', 'inf')), int(old.get('nodes', 0))
+                why = []
+                if was_nodes and m['nodes'] > was_nodes * (1 + args.tolerance):
+                    why.append('nodes')
+                if m['time'] > was_time * (1 + args.time_tolerance):
+                    why.append('time')
+                bad += bool(why)
+                color = RED if why else GREEN
+                print(f'{color}{name:24} {m["time"]:8.3f} {was_time:8.3f} {m["nodes"]:9} {was_nodes:9}'
+                      + (f'  REGRESSION: {", ".join(why)}' if why else '') + RESET)
+    finally:
+        pool.close()
+    return bad
+
+
+def main():
+    args = parse_args()
+    if not args.no_build:
+        build()
+    if args.replay:
+        sys.exit(1 if replay(args) else 0)
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 32)
+    print(f'Fuzzing with seed {seed}')
+    rng = random.Random(seed)
+    cfg = Config(size=args.size, fields=args.fields, values=args.values, skew=args.skew, extended=args.extended)
+    current = version()
+    os.makedirs(os.path.dirname(args.csv), exist_ok=True)
+    columns = ['version', 'seed', 'lhs_size', 'rhs_size', 'verdict', 'time', 'nodes', 'frenetic', 'frenetic_time', 'error', 'lhs', 'rhs']
+    new = not os.path.exists(args.csv)
+    pool = Pool(args.workers, args.mem)
+    with open(args.csv, 'a', newline='') as f:
+        writer = csv.DictWriter(f, columns, extrasaction='ignore')
+        if new:
+            writer.writeheader()
+
+        def log(pair, m):
+            writer.writerow(dict(m, version=current, seed=seed, lhs_size=size(pair[0]), rhs_size=size(pair[1]),
+                                 lhs=nkpl(pair[0]), rhs=nkpl(pair[1])))
+            f.flush()
+
+        try:
+            findings = fuzz(pool, args, rng, cfg, log)[:args.max_findings]
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                results = list(executor.map(lambda finding: pool.run(minimize, finding, args), findings))
+        finally:
+            pool.close()
+    saved = [save(*r, args.out, current) for r in results if r is not None]
+    for path in saved:
+        print(f'Saved {os.path.relpath(path, ROOT)}')
+    print(f'{len(saved)} reproducers, {len(findings) - len(saved)} findings did not reproduce')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""Profile KATch benchmarks with async-profiler, and diff profiles between revisions.
+
+Every benchmark file is run in its own JVM with the async-profiler agent loaded
+from the start (no attaching to a running process), once per profiling mode.
+Collapsed stacks and HTML flamegraphs are saved as
+
+    results/profiles/<label>/<benchmark>/<event>.collapsed
+    results/profiles/<label>/<benchmark>/<event>.html
+
+where <label> is the short hash of the profiled revision. `diff` compares two
+labels: it writes differential flamegraphs (frames sized by the second profile
+and coloured by how much their share of samples grew or shrank) and prints the
+frames of SP/SPP/Bisim whose share changed most.
+
+usage:
+  profile.py run [--rev REV] [--events cpu,alloc,lock] [--no-build] [benchmark files or dirs...]
+  profile.py diff [--focus REGEX] [--top N] LABEL_A LABEL_B
+"""
+import argparse
+import glob
+import html
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+from katch.jvm import JAR, ROOT, build as build_working_tree, katch_command, scratch_dir
+
+PROFILES = os.path.join(ROOT, 'results', 'profiles')
+APROF = os.path.join(ROOT, 'aprof', 'build')
+AGENT = os.path.join(APROF, 'libasyncProfiler.dylib' if platform.system() == 'Darwin' else 'libasyncProfiler.so')
+EVENTS = ['cpu', 'alloc', 'lock']
+# Frames from SPP.scala (objects SP and SPP) and Bisim.scala (objects Bisim and SMap)
+FOCUS = r'^nkpl[/.](SPP?|Bisim|SMap)\b'
+
+
+def git(*args, cwd=ROOT):
+    return subprocess.run(['git', *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def benchmark_files(inputs):
+    """The .nkpl files to profile, found the same way as `katch run` does."""
+    files = []
+    for i in inputs:
+        if i.endswith('.nkpl'):
+            files.append(i)
+        else:
+            files += glob.glob(os.path.join(i, '**', '*.nkpl'), recursive=True)
+    return sorted(files, key=os.path.basename)
+
+
+def benchmark_name(path):
+    return os.path.normpath(path)[:-len('.nkpl')].replace('/', '_')
+
+
+def build(rev):
+    """Build the assembly jar of `rev` (or of the working tree if `rev` is None) and return (label, jar path)."""
+    if rev is None:
+        build_working_tree()
+        dirty = git('status', '--porcelain', '--untracked-files=no')
+        return git('rev-parse', '--short', 'HEAD') + ('-dirty' if dirty else ''), os.path.join(ROOT, JAR)
+    sha = git('rev-parse', '--short', rev)
+    jar = os.path.join(PROFILES, 'jars', f'{sha}.jar')
+    if not os.path.exists(jar):
+        tree = tempfile.mkdtemp(prefix='katch-')
+        try:
+            git('worktree', 'add', '--detach', tree, sha)
+            subprocess.run(['sbt', 'assembly'], cwd=tree, check=True)
+            os.makedirs(os.path.dirname(jar), exist_ok=True)
+            shutil.copy(os.path.join(tree, JAR), jar)
+        finally:
+            git('worktree', 'remove', '--force', tree)
+            shutil.rmtree(tree, ignore_errors=True)
+    return sha, jar
+
+
+def has_verdict_cache(jar):
+    """Whether `jar` has the verdict cache, and so takes `--no-cache`; jars of older revisions don't."""
+    with zipfile.ZipFile(jar) as z:
+        return 'nkpl/VerdictCache.class' in z.namelist()
+
+
+def profile(jar, bench, event, out, args):
+    """Run one benchmark under the agent, writing `<out>/<event>.collapsed` and `<event>.html`."""
+    collapsed = os.path.join(out, f'{event}.collapsed')
+    agent = f'{AGENT}=start,event={event},collapsed,file={collapsed}'
+    if event == 'cpu':
+        agent += f',interval={args.interval}'
+    else:
+        agent += ',total'  # weigh samples by bytes allocated or time blocked
+    cmd = katch_command(['run', *(['--no-cache'] if has_verdict_cache(jar) else []), os.path.relpath(bench, ROOT)], jar, [f'-agentpath:{agent}'], args.mem)
+    try:
+        subprocess.run(cmd, cwd=scratch_dir('profiles'), check=True, timeout=args.timeout, stdout=subprocess.DEVNULL)
+    except subprocess.TimeoutExpired:
+        print(f'  {event}: timed out after {args.timeout} s')
+        return
+    except subprocess.CalledProcessError as e:
+        print(f'  {event}: KATch exited with status {e.returncode}')
+        return
+    subprocess.run(['java', '-cp', os.path.join(APROF, 'converter.jar'), 'FlameGraph',
+                    '--title', f'{os.path.basename(bench)} ({event})', collapsed, os.path.join(out, f'{event}.html')],
+                   check=True)
+    print(f'  {event}: {collapsed}')
+
+
+def run(args):
+    label, jar = build(args.rev) if not args.no_build else (args.label or 'current', os.path.join(ROOT, JAR))
+    label = args.label or label
+    events = args.events.split(',')
+    for bench in benchmark_files([os.path.abspath(b) for b in args.benchmarks]):
+        print(f'Profiling {os.path.relpath(bench, ROOT)} at {label}')
+        out = os.path.join(PROFILES, label, benchmark_name(os.path.relpath(bench, ROOT)))
+        os.makedirs(out, exist_ok=True)
+        for event in events:
+            profile(jar, bench, event, out, args)
+    with open(os.path.join(PROFILES, label, 'meta.json'), 'w') as f:
+        json.dump({'rev': args.rev or 'working tree', 'jar': jar, 'events': events}, f)
+
+
+def read_collapsed(path):
+    stacks = {}
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                stacks[stack] = stacks.get(stack, 0) + int(count)
+    return stacks
+
+
+def frame_shares(stacks):
+    """Share of samples that each frame is on the stack for (inclusive)."""
+    total = sum(stacks.values()) or 1
+    shares = {}
+    for stack, count in stacks.items():
+        for frame in set(stack.split(';')):
+            shares[frame] = shares.get(frame, 0) + count / total
+    return shares
+
+
+def diff_tree(a, b):
+    """Merge two profiles into a tree of frames with their share of samples in each."""
+    root = {'a': 0.0, 'b': 0.0, 'children': {}}
+    for stacks, key in ((a, 'a'), (b, 'b')):
+        total = sum(stacks.values()) or 1
+        for stack, count in stacks.items():
+            node = root
+            node[key] += count / total
+            for frame in stack.split(';'):
+                node = node['children'].setdefault(frame, {'a': 0.0, 'b': 0.0, 'children': {}})
+                node[key] += count / total
+    return root
+
+
+def diff_html(tree, title, path, min_width=0.0005):
+    """Write a self-contained differential flamegraph: widths from the second profile, red for frames that grew, blue for frames that shrank."""
+    boxes = []
+
+    def walk(name, node, x, depth):
+        if node['b'] < min_width:
+            return
+        boxes.append((name, x, node['b'], depth, node['b'] - node['a']))
+        for child_name, child in sorted(node['children'].items()):
+            walk(child_name, child, x, depth + 1)
+            x += child['b']
+
+    x = 0
+    for name, node in sorted(tree['children'].items()):
+        walk(name, node, x, 0)
+        x += node['b']
+    scale = max((abs(d) for *_, d in boxes), default=0) or 1
+    height = 16
+    depth = max((b[3] for b in boxes), default=0) + 1
+    divs = []
+    for name, x, w, d, delta in boxes:
+        t = min(abs(delta) / scale, 1)
+        shade = int(255 * (1 - t))
+        color = f'rgb(255,{shade},{shade})' if delta > 0 else f'rgb({shade},{shade},255)'
+        tip = f'{name}\n{w:.2%} of samples ({delta:+.2%})'
+        divs.append(f'<div style="left:{x:.4%};width:{w:.4%};bottom:{d * height}px;background:{color}" '
+                    f'title="{html.escape(tip)}">{html.escape(name)}</div>')
+    with open(path, 'w') as f:
+        f.write(f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(title)}</title><style>
+body {{ font: 12px sans-serif; margin: 10px; }}
+#graph {{ position: relative; height: {depth * height}px; }}
+#graph div {{ position: absolute; height: {height - 1}px; overflow: hidden; white-space: nowrap; box-sizing: border-box;
+  border-right: 1px solid white; padding-left: 2px; line-height: {height - 1}px; }}
+</style></head><body>
+<h3>{html.escape(title)}</h3>
+<p>Widths are the share of samples in the second profile. Red frames take a larger share than in the first profile, blue frames a smaller one.</p>
+<div id="graph">
+{chr(10).join(divs)}
+</div></body></html>
+''')
+
+
+def diff(args):
+    dir_a, dir_b = (os.path.join(PROFILES, label) for label in (args.a, args.b))
+    out_root = os.path.join(PROFILES, f'diff-{args.a}-{args.b}')
+    focus = re.compile(args.focus)
+    rows = []
+    for path_b in sorted(glob.glob(os.path.join(dir_b, '*', '*.collapsed'))):
+        bench, name = os.path.basename(os.path.dirname(path_b)), os.path.basename(path_b)
+        path_a = os.path.join(dir_a, bench, name)
+        if not os.path.exists(path_a):
+            continue
+        event = name[:-len('.collapsed')]
+        a, b = read_collapsed(path_a), read_collapsed(path_b)
+        out = os.path.join(out_root, bench)
+        os.makedirs(out, exist_ok=True)
+        # The differential folded format of FlameGraph's difffolded.pl, for use with other tools
+        with open(os.path.join(out, f'{event}.diff.collapsed'), 'w') as f:
+            for stack in sorted(set(a) | set(b)):
+                f.write(f'{stack} {a.get(stack, 0)} {b.get(stack, 0)}\n')
+        diff_html(diff_tree(a, b), f'{bench} ({event}): {args.a} → {args.b}', os.path.join(out, f'{event}.diff.html'))
+        shares_a, shares_b = frame_shares(a), frame_shares(b)
+        for frame in set(shares_a) | set(shares_b):
+            if focus.search(frame):
+                sa, sb = shares_a.get(frame, 0), shares_b.get(frame, 0)
+                rows.append((bench, event, frame, sa, sb, sb - sa))
+    if not rows:
+        print(f'No profiles in common between {dir_a} and {dir_b}')
+        sys.exit(1)
+    rows.sort(key=lambda r: -abs(r[5]))
+    with open(os.path.join(out_root, 'frames.csv'), 'w') as f:
+        f.write('benchmark,event,frame,share_a,share_b,delta\n')
+        for row in rows:
+            f.write('{},{},"{}",{:.6f},{:.6f},{:.6f}\n'.format(*row))
+    print(f'Differential flamegraphs in {out_root}\n')
+    print(f'{"share A":>8} {"share B":>8} {"delta":>8}  frame (benchmark, event)')
+    for bench, event, frame, sa, sb, delta in rows[:args.top]:
+        print(f'{sa:8.2%} {sb:8.2%} {delta:+8.2%}  {frame} ({bench}, {event})')
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = p.add_subparsers(dest='command', required=True)
+    r = sub.add_parser('run', help='profile benchmarks')
+    r.add_argument('benchmarks', nargs='*', default=['nkpl/misc/scratch/bench.nkpl'], help='.nkpl files or directories')
+    r.add_argument('--rev', help='git revision to build and profile (default: the working tree)')
+    r.add_argument('--label', help='directory name for the profiles (default: short hash of the revision)')
+    r.add_argument('--no-build', action='store_true', help=f'use the existing {JAR}')
+    r.add_argument('--events', default=','.join(EVENTS), help='comma-separated async-profiler events')
+    r.add_argument('--interval', default='1ms', help='cpu sampling interval')
+    r.add_argument('--mem', default='128g', help='maximum heap size')
+    r.add_argument('--timeout', type=float, help='per-run timeout in seconds')
+    d = sub.add_parser('diff', help='compare the profiles of two labels')
+    d.add_argument('a', help='label of the baseline profiles')
+    d.add_argument('b', help='label of the new profiles')
+    d.add_argument('--focus', default=FOCUS, help='regex selecting the frames to report')
+    d.add_argument('--top', type=int, default=30, help='number of frames to print')
+    args = p.parse_args()
+    run(args) if args.command == 'run' else diff(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Run the benchmark suites of the manifest (`benchmarks.toml`).
+
+By default runs the suites of the paper that are not expensive. Every file of
+a suite runs in its own `./katch` process: `katch compare <timeout>` for
+suites that include Frenetic, `katch run` (or `run+warmup`) otherwise, `reps`
+times. Times go to `results/comparison.csv` as usual; the verdict of every
+file (pass if all its checks hold, fail if one doesn't, error otherwise) is
+compared with the expected one and recorded in the results store, together
+with the file's suite, family and size.
+
+Stops at the first unexpected verdict, unless `--keep-going` is given; the
+exit status is 1 if any verdict was unexpected.
+
+    python3 scripts/run-suites.py --expensive                # all of the paper's experiments
+    python3 scripts/run-suites.py --suite inc --suite flip   # just these suites
+    python3 scripts/run-suites.py --all --exclude full-reachability --katch-only
+
+usage: run-suites.py [--suite NAME ...] [--exclude NAME ...] [--expensive] [--all] [--katch-only]
+                     [--timeout SUITE=SECONDS ...] [--keep-going] [--list] [--dry-run]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from katch.jvm import ROOT
+from katch.manifest import load_manifest
+from katch.results import open_store, record_benchmarks, record_verdict
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--suite', action='append', default=[], help='run this suite (repeatable); overrides the default selection')
+    p.add_argument('--exclude', action='append', default=[], help='do not run this suite (repeatable)')
+    p.add_argument('--expensive', action='store_true', help='include the suites that take hours')
+    p.add_argument('--all', action='store_true', help='include the suites that are not in the paper')
+    p.add_argument('--katch-only', action='store_true', help='run only KATch, also for suites that include Frenetic')
+    p.add_argument('--timeout', action='append', default=[], metavar='SUITE=SECONDS', help="override a suite's Frenetic timeout")
+    p.add_argument('--keep-going', action='store_true', help='continue after unexpected verdicts')
+    p.add_argument('--list', action='store_true', help='list the selected suites and their files, without running them')
+    p.add_argument('--dry-run', action='store_true', help='print the commands instead of running them')
+    p.add_argument('--manifest', default=os.path.join(ROOT, 'benchmarks.toml'))
+    return p.parse_args()
+
+
+def command(suite, path, katch_only, timeout):
+    if 'frenetic' in suite.systems and not katch_only:
+        return ['./katch', 'compare', f'{timeout:g}s', path]
+    return ['./katch', 'run+warmup', path] if suite.warmup else ['./katch', 'run', '--no-cache', path]
+
+
+def run(cmd):
+    """Runs `cmd` in the repository root, echoing its output, and returns its verdict and wall-clock time."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    failed = False
+    for line in proc.stdout:
+        sys.stdout.write(line)
+        failed = failed or 'Check failed' in line
+    proc.wait()
+    wall = time.perf_counter() - start
+    if proc.returncode == 0:
+        return 'pass', wall
+    return ('fail' if failed else 'error'), wall
+
+
+def main():
+    args = parse_args()
+    manifest = load_manifest(args.manifest)
+    suites = manifest.select(args.suite, args.exclude, expensive=args.expensive, paper=not args.all)
+    timeouts = {}
+    for t in args.timeout:
+        name, _, seconds = t.partition('=')
+        manifest.suite(name)
+        timeouts[name] = float(seconds)
+
+    if args.list:
+        for s in suites:
+            paths = s.paths()
+            print(f'{s.name} ({s.family}, {len(paths)} files{", expensive" if s.expensive else ""})')
+            for p in paths:
+                print(f'  {p}')
+        return
+
+    db = None if args.dry_run else open_store(os.path.join(ROOT, 'results', 'results.db'))
+    unexpected = []
+    for s in suites:
+        benchmarks = [manifest.lookup(p) for p in s.paths()]
+        if not benchmarks:
+            print(f'Suite {s.name} has no files, skipping')
+            continue
+        if db:
+            record_benchmarks(db, benchmarks)
+        for b in benchmarks:
+            cmd = command(s, b.path, args.katch_only, timeouts.get(s.name, s.timeout))
+            for _ in range(s.reps):
+                if args.dry_run:
+                    print(' '.join(cmd))
+                    continue
+                verdict, wall = run(cmd)
+                record_verdict(db, b.path, 'katch', verdict, b.expected, wall)
+                if verdict != b.expected:
+                    print(f'\033[91m{b.path}: expected {b.expected}, got {verdict}\033[0m')
+                    unexpected.append(b.path)
+                    if not args.keep_going:
+                        sys.exit(1)
+    if unexpected:
+        print(f'{len(unexpected)} unexpected verdicts: {", ".join(unexpected)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Measure the empirical complexity of parametric benchmark families, and catch complexity regressions.
+
+For every family (see `scripts/katch/families.py`), runs sizes in increasing
+order until `--budget` seconds are used up, fits polynomial and exponential
+models to the time and the SP/SPP node counts, and prints the scaling
+exponent of each. Measurements and fits are recorded in the results store
+under the current commit. A fit is a regression if its model went from
+polynomial to exponential, or its exponent grew by more than `--tolerance`,
+compared with the fit of `--baseline` (by default the latest fit recorded for
+another commit); the exit status is then 1.
+
+`--emit DIR` only writes the files of sizes `--sizes` to `DIR`, which
+regenerates the fig11 benchmarks:
+
+    python3 scripts/scaling.py --families inc,ring,nested_star --budget 120
+    python3 scripts/scaling.py --families flip --emit nkpl/fig11/flip --sizes 1-100
+
+usage: scaling.py [--families F,...] [--budget S] [--max-run S] [--max-n N] [--growth X] [--tolerance T]
+                  [--baseline COMMIT] [--options "..."] [--csv out.csv] [--no-build] [--emit DIR --sizes A-B]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from katch.families import FAMILIES, write
+from katch.jvm import ROOT, build
+from katch.results import baseline_fit, open_store, record_scaling
+from katch.scaling import METRICS, fit, sweep
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--families', default=','.join(FAMILIES), help='comma-separated families')
+    p.add_argument('--budget', type=float, default=60, help='seconds of running time per family')
+    p.add_argument('--max-run', type=float, help='seconds after which a single size is cut off (default: the budget)')
+    p.add_argument('--max-n', type=int, default=1000, help='the largest size')
+    p.add_argument('--growth', type=float, default=1.25, help='factor between consecutive sizes')
+    p.add_argument('--tolerance', type=float, default=0.25, help='exponent increase that counts as a regression')
+    p.add_argument('--baseline', help='commit to compare with (default: the latest other commit measured)')
+    p.add_argument('--options', default='', help='global KATch options, e.g. "--bisim uf"')
+    p.add_argument('--mem', default='16g', help='maximum heap size')
+    p.add_argument('--csv', default=os.path.join(ROOT, 'results', 'scaling.csv'), help='where to write the measurements')
+    p.add_argument('--no-build', action='store_true', help='use the existing assembly jar')
+    p.add_argument('--emit', metavar='DIR', help='only write the files of `--sizes` to DIR')
+    p.add_argument('--sizes', default='1-100', help='sizes to write with --emit, as A-B')
+    return p.parse_args()
+
+
+def version():
+    """The commit of the working tree, marked dirty if it has changes."""
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=ROOT, check=True, capture_output=True, text=True).stdout.strip()
+    return git('rev-parse', '--short', 'HEAD') + ('-dirty' if git('status', '--porcelain', '--untracked-files=no') else '')
+
+
+def regression(f, base, tolerance):
+    """Why fit `f` is a regression compared with the baseline row `base`, or `None`."""
+    if base is None or f is None:
+        return None
+    if base['model'] == 'poly' and f['model'] == 'exp':
+        return f'polynomial at {base["version"]}, now exponential'
+    if base['model'] == f['model'] and f['exponent'] > base['exponent'] + tolerance:
+        return f'exponent {base["exponent"]:.2f} at {base["version"]}, now {f["exponent"]:.2f}'
+    return None
+
+
+def main():
+    args = parse_args()
+    families = args.families.split(',')
+    for family in families:
+        if family not in FAMILIES:
+            sys.exit(f'Unknown family {family}, expected one of {", ".join(FAMILIES)}')
+    if args.emit:
+        lo, _, hi = args.sizes.partition('-')
+        for family in families:
+            for n in range(int(lo), int(hi or lo) + 1):
+                write(family, n, args.emit)
+        return
+    if not args.no_build:
+        build()
+
+    import pandas as pd
+    current = version()
+    db = open_store(os.path.join(ROOT, 'results', 'results.db'))
+    frames, report, regressions = [], [], []
+    for family in families:
+        print(f'Measuring {family}')
+        rows = sweep(family, args.budget, os.path.join(ROOT, 'results', 'scaling', 'files'), max_run=args.max_run,
+                     max_n=args.max_n, growth=args.growth, mem=args.mem, options=args.options.split())
+        done = [r for r in rows if not r.get('timeout')]
+        fits = {m: fit([r['n'] for r in done], [r[m] for r in done]) for m in METRICS}
+        for m, f in fits.items():
+            why = regression(f, baseline_fit(db, family, m, args.baseline, current), args.tolerance)
+            report.append((family, m, f, max((r['n'] for r in done), default=0), why))
+            if why:
+                regressions.append(f'{family} {m}: {why}')
+        record_scaling(db, family, current, rows, fits)
+        frames.append(pd.DataFrame(rows).assign(family=family, version=current))
+
+    print(f'{"family":12} {"metric":10} {"model":6} {"exponent":>9} {"r2":>6} {"max n":>6}')
+    for family, m, f, max_n, why in report:
+        if f is None:
+            print(f'{family:12} {m:10} {"-":6} {"":>9} {"":>6} {max_n:6}  too few sizes to fit')
+        else:
+            print(f'{family:12} {m:10} {f["model"]:6} {f["exponent"]:9.2f} {f["r2"]:6.3f} {max_n:6}' + (f'  REGRESSION: {why}' if why else ''))
+    os.makedirs(os.path.dirname(args.csv), exist_ok=True)
+    pd.concat(frames).to_csv(args.csv, index=False)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Summarize per-statement traces written by `./katch run --trace <file>`.
+
+Rolls the records up by benchmark family (or input file, statement kind, or
+source line) and shows where the time went: ε, δ, SPP operations, GC and the
+rest, next to the exploration sizes and memo cache hit rates.
+
+usage: trace-report.py [--by family|input|stmt|line] [--top N] [--all-runs] [--csv out.csv] trace.jsonl...
+"""
+import argparse
+import csv
+import sys
+
+from katch.trace import KEYS, last_runs, load, rollup
+
+COLUMNS = [
+    ('group', '{}'), ('statements', '{:.0f}'), ('failed', '{:.0f}'),
+    ('wall', '{:.3f}'), ('eps', '{:.3f}'), ('delta', '{:.3f}'), ('spp', '{:.3f}'), ('gc_time', '{:.3f}'), ('other', '{:.3f}'),
+    ('iterations', '{:.0f}'), ('peak_queue', '{:.0f}'), ('states', '{:.0f}'),
+    ('sp_nodes', '{:.0f}'), ('spp_nodes', '{:.0f}'), ('hit_rate', '{:.1%}'),
+]
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('traces', nargs='+', help='trace files')
+    p.add_argument('--by', choices=sorted(KEYS), default='family', help='what to group records by')
+    p.add_argument('--top', type=int, help='only show the N groups with the most wall time')
+    p.add_argument('--all-runs', action='store_true', help='include all warmup runs, not only the last run of each file')
+    p.add_argument('--csv', help='also write the table to this csv file')
+    return p.parse_args()
+
+
+def fmt(value, spec):
+    return '-' if value is None else spec.format(value)
+
+
+def main():
+    args = parse_args()
+    records = [r for path in args.traces for r in load(path)]
+    if not records:
+        print('No trace records found')
+        sys.exit(1)
+    if not args.all_runs:
+        records = last_runs(records)
+    rows = rollup(records, args.by)[:args.top]
+
+    table = [[name for name, _ in COLUMNS]] + [[fmt(row[name], spec) for name, spec in COLUMNS] for row in rows]
+    widths = [max(len(r[i]) for r in table) for i in range(len(COLUMNS))]
+    for r in table:
+        print('  '.join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(r, widths))))
+
+    total = sum(row['wall'] for row in rows)
+    if total:
+        shares = {f: sum(row[f] for row in rows) / total for f in ('eps', 'delta', 'spp', 'other')}
+        print('\nShare of wall time: ' + ', '.join(f'{f} {s:.1%}' for f, s in shares.items()))
+        # GC pauses overlap the phases above, so their share is not part of the split
+        print(f"of which GC pauses: {sum(row['gc_time'] for row in rows) / total:.1%}")
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            w = csv.DictWriter(f, fieldnames=[name for name, _ in COLUMNS])
+            w.writeheader()
+            for row in rows:
+                w.writerow({name: row[name] for name, _ in COLUMNS})
+
+
+if __name__ == '__main__':
+    main()
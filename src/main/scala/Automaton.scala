@@ -0,0 +1,195 @@
+package nkpl
+
+import scala.collection.mutable
+
+/** An explicit symbolic automaton, shared by all queries in a file (`--materialize`).
+  *
+  * States are the derivatives of the expressions that have been queried, numbered densely in the order they are discovered. The outgoing edges of a state are computed from `Bisim.δ` the first time the state is expanded and stored as parallel arrays of target ids and SPP labels, together with the state's ε output and the union of its edge labels. The states reachable from a root, and the reverse edges among them, are indexed once per root.
+  *
+  * Since the states of `@sw=i ⋅ net` are, apart from the initial one, derivatives of `net`, thousands of forward queries over one `net` share a single construction of its automaton. `forward`, `backward` and `bisim` compute the same results as their counterparts in `Bisim`, but run over this structure by index. Everything is dropped by `clearCaches`.
+  */
+object Automaton {
+
+  private val ids = mutable.HashMap.empty[NK, Int]
+  private val states = mutable.ArrayBuffer.empty[NK]
+  private val εOut = mutable.ArrayBuffer.empty[SPP]
+  private val targets = mutable.ArrayBuffer.empty[Array[Int]]
+  private val labels = mutable.ArrayBuffer.empty[Array[SPP]]
+  private val allOut = mutable.ArrayBuffer.empty[SPP]
+
+  /** The reachable states of a root, and the reverse edges among them: `preds(i)` and `predLabels(i)` are the edges into `reachable(i)`. */
+  class Reverse(val reachable: Array[Int], val index: mutable.HashMap[Int, Int], val preds: Array[Array[Int]], val predLabels: Array[Array[SPP]])
+
+  private val reverses = mutable.HashMap.empty[Int, Reverse]
+
+  def clear(): Unit =
+    ids.clear(); states.clear(); εOut.clear(); targets.clear(); labels.clear(); allOut.clear()
+    reverses.clear()
+
+  clearCachesFns = (() => clear()) :: clearCachesFns
+  Collector.rootFns = (() => List(states, εOut, labels, allOut, reverses.values.map(_.predLabels))) :: Collector.rootFns
+
+  /** The number of states materialized so far. */
+  def size: Int = states.length
+
+  /** Returns the id of state `e`, adding it (unexpanded) if it is new. */
+  def id(e: NK): Int =
+    ids.getOrElseUpdate(
+      e, {
+        states += e
+        εOut += null
+        targets += null
+        labels += null
+        allOut += null
+        states.length - 1
+      }
+    )
+
+  /** Computes the ε output and outgoing edges of state `s`, if that hasn't been done yet. */
+  def expand(s: Int): Unit =
+    if targets(s) == null then
+      val e = states(s)
+      val d = Bisim.δ(e).toArray
+      εOut(s) = Bisim.ε(e)
+      val ts = d.map((e2, _) => id(e2))
+      val ls = d.map((_, spp) => spp)
+      labels(s) = ls
+      allOut(s) = Bisim.benchmark("spp", Bisim.bigUnion(ls, 0, ls.length))
+      targets(s) = ts
+
+  def ε(s: Int): SPP = { expand(s); εOut(s) }
+  def succ(s: Int): Array[Int] = { expand(s); targets(s) }
+  def succLabels(s: Int): Array[SPP] = { expand(s); labels(s) }
+  def succUnion(s: Int): SPP = { expand(s); allOut(s) }
+
+  /** Returns the reachable states of `root` and their reverse edges, building them on first use. */
+  def reverse(root: Int): Reverse =
+    reverses.getOrElseUpdate(
+      root, {
+        val seen = mutable.LinkedHashSet(root)
+        val todo = mutable.Queue(root)
+        while todo.nonEmpty do
+          for t <- succ(todo.dequeue()) do if seen.add(t) then todo.enqueue(t)
+        val reachable = seen.toArray
+        val index = mutable.HashMap.from(reachable.zipWithIndex)
+        val preds = Array.fill(reachable.length)(mutable.ArrayBuffer.empty[Int])
+        val predLabels = Array.fill(reachable.length)(mutable.ArrayBuffer.empty[SPP])
+        for s <- reachable do
+          val ts = succ(s)
+          val ls = succLabels(s)
+          for k <- ts.indices do
+            val i = index(ts(k))
+            preds(i) += s
+            predLabels(i) += ls(k)
+        new Reverse(reachable, index, preds.map(_.toArray), predLabels.map(_.toArray))
+      }
+    )
+
+  /** A work list of states (or packed pairs of states) with pending SPs. A key is queued at most once, and SPs that are added while it waits are merged. */
+  private class WorkList[K] {
+    val pending = mutable.HashMap.empty[K, SP]
+    val queue = mutable.Queue.empty[K]
+    var peak = 0
+    def add(k: K, sp: SP): Unit =
+      if sp eq SP.False then return
+      pending.get(k) match {
+        case Some(sp0) => pending(k) = Bisim.benchmark("spp", SP.union(sp0, sp))
+        case None =>
+          pending(k) = sp
+          queue.enqueue(k)
+          peak = peak max queue.size
+      }
+    def nonEmpty: Boolean = queue.nonEmpty
+    def next(): (K, SP) =
+      val k = queue.dequeue()
+      (k, pending.remove(k).get)
+  }
+
+  /** Determines the possible output packets of `e`, like `Bisim.forward`. */
+  def forward(e: NK): SP =
+    val work = new WorkList[Int]
+    work.add(id(e), SP.True)
+    val done = mutable.HashMap.empty[Int, SP]
+    var i = 0
+    // The same iteration limit as `Bisim.forwardPrim`
+    val limit = 100000
+    Collector.enter()
+    while work.nonEmpty && i < limit do
+      Collector.safepoint(List(work.pending, done))
+      i += 1
+      val (s, sp) = work.next()
+      val done1 = done.getOrElse(s, SP.False)
+      val spRest = Bisim.benchmark("spp", SP.difference(sp, done1))
+      if !(spRest eq SP.False) then
+        done(s) = Bisim.benchmark("spp", SP.union(done1, spRest))
+        val ts = succ(s)
+        val ls = succLabels(s)
+        for k <- ts.indices do work.add(ts(k), Bisim.benchmark("spp", SPP.run(spRest, ls(k))))
+    if Trace.enabled then Trace.explored(i, work.peak, done.size)
+    Bisim.benchmark("spp", SP.unionN(done.map { (s, sp) => SPP.run(sp, ε(s)) }))
+
+  /** Determines the set of input packets that aren't dropped by `e`, like `Bisim.backward`. */
+  def backward(e: NK): SP =
+    val root = id(e)
+    val rev = reverse(root)
+    val n = rev.reachable.length
+    val done = Array.fill[SP](n)(SP.False)
+    val work = new WorkList[Int]
+    for i <- 0 until n do work.add(i, Bisim.benchmark("spp", SPP.pull(ε(rev.reachable(i)), SP.True)))
+    var iters = 0
+    // The same iteration limit as `Bisim.backwardPrim`
+    val limit = 100000
+    Collector.enter()
+    while work.nonEmpty && iters < limit do
+      Collector.safepoint(List(work.pending, done))
+      iters += 1
+      val (i, sp) = work.next()
+      val spRest = Bisim.benchmark("spp", SP.difference(sp, done(i)))
+      if !(spRest eq SP.False) then
+        done(i) = Bisim.benchmark("spp", SP.union(done(i), spRest))
+        val ps = rev.preds(i)
+        val ls = rev.predLabels(i)
+        for k <- ps.indices do work.add(rev.index(ps(k)), Bisim.benchmark("spp", SPP.pull(ls(k), spRest)))
+    if Trace.enabled then Trace.explored(iters, work.peak, n)
+    done(0)
+
+  /** Checks if two NK expressions are bisimilar, like `Bisim.bisimPrim`, or like `Bisim.bisimUF` if `upToEquivalence` is set. */
+  def bisim(e1: NK, e2: NK, upToEquivalence: Boolean): Boolean =
+    def pair(a: Int, b: Int): Long = (a.toLong << 32) | (b.toLong & 0xffffffffL)
+    val zero = id(Zero)
+    val classes = new Bisim.UnionFind
+    val work = new WorkList[Long]
+    work.add(pair(id(e1), id(e2)), SP.True)
+    val done = mutable.HashMap.empty[Long, SP]
+    def doneAt(a: Int, b: Int): SP =
+      val x = done.getOrElse(pair(a, b), SP.False)
+      if upToEquivalence then Bisim.benchmark("spp", SP.union(x, done.getOrElse(pair(b, a), SP.False))) else x
+    var i = 0
+    val limit = 100000
+    Collector.enter()
+    while work.nonEmpty && i < limit do
+      Collector.safepoint(List(work.pending, done))
+      i += 1
+      val (p, sp) = work.next()
+      val a = (p >>> 32).toInt
+      val b = p.toInt
+      if !(upToEquivalence && classes.find(states(a)) == classes.find(states(b))) then
+        val done12 = doneAt(a, b)
+        val spRest = Bisim.benchmark("spp", SP.difference(sp, done12))
+        if !(spRest eq SP.False) then
+          val done12New = Bisim.benchmark("spp", SP.union(done12, spRest))
+          done(p) = done12New
+          if upToEquivalence && (done12New eq SP.True) then classes.union(states(a), states(b))
+          if !Bisim.benchmark("spp", SPP.equivAt(spRest, ε(a), ε(b))) then
+            if Trace.enabled then Trace.explored(i, work.peak, done.size)
+            return false
+          val ta = succ(a); val la = succLabels(a)
+          val tb = succ(b); val lb = succLabels(b)
+          for ka <- ta.indices; kb <- tb.indices do
+            work.add(pair(ta(ka), tb(kb)), Bisim.benchmark("spp", SPP.run(spRest, SPP.intersection(la(ka), lb(kb)))))
+          for ka <- ta.indices do work.add(pair(ta(ka), zero), Bisim.benchmark("spp", SPP.run(spRest, SPP.difference(la(ka), succUnion(b)))))
+          for kb <- tb.indices do work.add(pair(zero, tb(kb)), Bisim.benchmark("spp", SPP.run(spRest, SPP.difference(lb(kb), succUnion(a)))))
+    if Trace.enabled then Trace.explored(i, work.peak, done.size)
+    if i == limit then throw new Throwable("Limit exceeded")
+    true
+}
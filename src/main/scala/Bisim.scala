@@ -209,7 +209,7 @@ object Bisim {
     }
   }
 
-  /** A utility method for benchmarking the execution time of a function.
+  /** A utility method for benchmarking the execution time of a function. When tracing is enabled, the time is added to the category `msg` of the current statement (see `Trace`).
     *
     * @param msg
     *   The message to display when benchmarking.
@@ -222,9 +222,16 @@ object Bisim {
     val start = System.nanoTime()
     val y = f
     val end = System.nanoTime()
+    if Trace.enabled then Trace.add(msg, end - start)
     y
   }
 
+  /** Benchmarks an SP/SPP operation of the exploration loops below. */
+  private def spp[T](f: => T): T = benchmark("spp", f)
+
+  /** The union of all the SPPs of an SMap. */
+  private def unionAll(x: SMap): SPP = spp { x.map { (e, sp) => sp }.foldLeft(SPP.False: SPP)(SPP.union(_, _)) }
+
   /** Applies the δ function to the given NK expression and benchmarks the execution time.
     *
     * @param e
@@ -246,71 +253,6 @@ object Bisim {
   def ε(e: NK): SPP =
     benchmark(s"ε", { ε0(e) })
 
-  /** Array containing the names of frenetic variables. This is needed because Frenetic only supports a limited set of variables. When converting NKPL expressions to Frenentic, we choose variables from this set.
-    */
-  val freneticVars = Array("switch", "port", "vswitch", "vport", "vfabric", "ethSrc", "ethDst", "vlanId", "vlanPcp", "ethTyp", "ipProto", "ip4Src", "ip4Dst", "tcpSrcPort", "tcpDstPort")
-
-  /** Converts a NetKAT expression to Frenetic.
-    *
-    * @param e
-    *   The NetKAT expression to be converted.
-    * @param s
-    *   The StringBuilder to store the converted expression.
-    */
-  def toKatPrim(e: NK, s: StringBuilder): Unit =
-    def getVar(n: Int): String =
-      if n < freneticVars.length then freneticVars(n)
-      else throw new Throwable(s"Unsupported variable $n")
-    def getVal(n: Int): Int =
-      if n < 0 then 1000 + n
-      else n
-    s.append("(")
-    e match
-      case Seq(es) =>
-        if es.isEmpty then s.append("id")
-        else
-          var first = true;
-          for e <- es do
-            if !first then s.append(";")
-            first = false
-            toKatPrim(e, s)
-      case Sum(es) =>
-        if es.isEmpty then s.append("drop")
-        else
-          var first = true
-          for e <- es do
-            if !first then s.append("+")
-            first = false
-            toKatPrim(e, s)
-      case Test(x, v) => s.append(s"filter ${getVar(x)} = ${getVal(v)}")
-      case TestNE(x, v) => s.append(s"filter (not ${getVar(x)} = ${getVal(v)})")
-      case Mut(x, v) => s.append(s"${getVar(x)} := ${getVal(v)}")
-      case Dup => s.append("dup")
-      case Star(e) =>
-        toKatPrim(e, s)
-        s.append("*")
-      case Difference(e1, e2) => throw new Throwable("Difference not supported")
-      case Intersection(e1, e2) => throw new Throwable("Intersection not supported")
-      case XOR(e1, e2) => throw new Throwable("XOR not supported")
-      case TestSP(sp) => throw new Throwable("TestSP not supported")
-      // case Forward(e) => throw new Throwable("Forward not supported")
-      // case Backward(e) => throw new Throwable("Backward not supported")
-      case VarName(x) => throw new Throwable("VarName not supported")
-      case _ => throw new Throwable(s"Unsupported expression: $e")
-    s.append(")")
-
-  /** Converts an NK expression to a Frenetic KAT representation.
-    *
-    * @param e
-    *   the NK expression to convert
-    * @return
-    *   the KAT string representation of the expression
-    */
-  def toKat(e: NK): String =
-    val s = new StringBuilder()
-    toKatPrim(e, s)
-    s.toString()
-
   /** Determines if two NK expressions are bisimilar. This also converts the expressions to KAT and writes them to files if the `convertToKat` option is set. The same goal can be achieved using forward/backward, but this can be more efficient, as it avoids the need to compute the forward/backward sets, and can do early stopping.
     *
     * @param e1
@@ -321,25 +263,29 @@ object Bisim {
     *   `true` if the expressions are bisimilar, `false` otherwise.
     */
   def bisim(e1: NK, e2: NK): Boolean =
-    val result = bisimPrim(e1, e2)
-    if !Options.convertToKat then return result
-    val dir = "kat"
-    var files = List[String]()
-    // write e1 and e2 to files
-    for e <- List(e1, e2) do
-      val kat = toKat(e)
-      // val filename = kat.hashCode().toHexString
-      // use sha instead
-      val filename = java.security.MessageDigest.getInstance("SHA-256").digest(kat.getBytes("UTF-8")).map("%02x".format(_)).mkString
-      val f = new java.io.FileWriter(s"$dir/${filename}.kat")
-      f.write(kat)
-      f.close()
-      files = files :+ filename
-    val fw = new java.io.FileWriter(Options.katIndex(), true) // true to append
-    fw.write(s"${files(0)}.kat ${files(1)}.kat $result\n")
-    fw.close()
+    // With --quotient, the check runs on the packets of the quotient (see `Quotient`), and with --decompose, each part is a pair of expressions to check on the packets of a slice (see `Slicing`)
+    val (q1, packets, q2) = if Options.quotient then Quotient.check(e1, e2) else (e1, SP.True, e2)
+    val parts =
+      if Options.decompose then Slicing.split(q1, q2).map((a, sp, b) => (a, SP.intersection(sp, packets), b))
+      else List((q1, packets, q2))
+    val result = Options.bisimAlgorithm match {
+      case _ if Options.materialize => parts.forall((a, sp, b) => Automaton.bisim(Slicing.guard(sp, a), Slicing.guard(sp, b), Options.bisimAlgorithm == "uf"))
+      case "uf" => parts.forall((a, sp, b) => bisimUF(Slicing.guard(sp, a), Slicing.guard(sp, b)))
+      case _ if Parallel.enabled => bisimPar(parts)
+      case _ => bisimPrim(parts)
+    }
+    if Options.convertToKat then KatExport.exportCheck(e1, e2, result)
     result
 
+  /** The pairs of states that the packets `spRest` reach from the pair `(e1, e2)` after one dup, in the order in which the bisimulation loops enqueue them. A packet that only one side can take is paired with `Zero` on the other side. */
+  private def successors(e1: NK, spRest: SP, e2: NK): List[((NK, NK), SP)] =
+    val both = for (a, spp1) <- δ(e1).toList; (b, spp2) <- δ(e2).toList yield ((a, b), spp { SPP.run(spRest, SPP.intersection(spp1, spp2)) })
+    val all1 = unionAll(δ(e1))
+    val all2 = unionAll(δ(e2))
+    val left = for (a, spp1) <- δ(e1).toList yield ((a, Zero), spp { SPP.run(spRest, SPP.difference(spp1, all2)) })
+    val right = for (b, spp2) <- δ(e2).toList yield ((Zero, b), spp { SPP.run(spRest, SPP.difference(spp2, all1)) })
+    both ++ left ++ right
+
   /** Checks if two given NK expressions are bisimilar.
     *
     * @param e1
@@ -349,9 +295,60 @@ object Bisim {
     * @return
     *   `true` if the expressions are bisimilar, `false` otherwise.
     */
-  def bisimPrim(e1: NK, e2: NK): Boolean = {
+  def bisimPrim(e1: NK, e2: NK): Boolean = bisimPrim(List((e1, SP.True, e2)))
+
+  /** Checks if the expressions of every start `(e1, sp, e2)` are bisimilar on the packets `sp`. The starts are explored together, in a single worklist. */
+  def bisimPrim(starts: List[(NK, SP, NK)]): Boolean = bisimLoop(starts, new Pairs)
+
+  /** The pairs of states that a bisimulation loop has related so far, and for which packets. `bisimLoop` is parameterized by it: `Pairs` for `bisimPrim`, and `PairsUpTo` for `bisimUF`. */
+  trait Relation {
+
+    /** Determines whether the pair `(a, b)` follows for all packets from the pairs related so far, so that it doesn't need to be explored. */
+    def covers(a: NK, b: NK): Boolean
+
+    /** The packets for which the pair `(a, b)` is related so far. */
+    def apply(a: NK, b: NK): SP
+
+    /** Relates the pair `(a, b)` for the packets `sp`, which include those it was related for before. */
+    def update(a: NK, b: NK, sp: SP): Unit
+
+    /** The number of pairs related so far. */
+    def size: Int
+
+    /** The SPs of the relation, which `Collector` must keep. */
+    def roots: Iterable[Any]
+  }
+
+  /** The relation of `bisimPrim`: a table with the packets of every ordered pair. */
+  class Pairs extends Relation {
+    protected var done: Map[(NK, NK), SP] = Map()
+    def covers(a: NK, b: NK): Boolean = false
+    def apply(a: NK, b: NK): SP = done.getOrElse((a, b), SP.False)
+    def update(a: NK, b: NK, sp: SP): Unit = done = done.updated((a, b), sp)
+    def size: Int = done.size
+    def roots: Iterable[Any] = done
+  }
+
+  /** The relation of `bisimUF`: pairs are looked up in both orientations, and once a pair is related for all packets (`SP.True`), its states are merged in a union-find structure, so that any later pair whose states are in the same class follows by symmetry and transitivity, including pairs of identical states. As in Hopcroft and Karp's algorithm, a pair is assumed related while its successors are checked. */
+  class PairsUpTo extends Pairs {
+    private val classes = new UnionFind
+    override def covers(a: NK, b: NK): Boolean = classes.find(a) == classes.find(b)
+    override def apply(a: NK, b: NK): SP =
+      (done.get((a, b)), done.get((b, a))) match {
+        case (Some(x), Some(y)) => SP.union(x, y)
+        case (Some(x), None) => x
+        case (None, Some(y)) => y
+        case (None, None) => SP.False
+      }
+    override def update(a: NK, b: NK, sp: SP): Unit =
+      super.update(a, b, sp)
+      if sp eq SP.True then classes.union(a, b)
+  }
+
+  /** The worklist loop of `bisimPrim` and `bisimUF`: explores the pairs of states reachable from the starts, with the packets that reach them, and checks that both states of every pair accept the same packets. `related` holds the pairs explored so far. */
+  private def bisimLoop(starts: List[(NK, SP, NK)], related: Relation): Boolean = {
     import scala.collection.mutable.Queue
-    var todo: Queue[(NK, SP, NK)] = Queue((e1, SP.True, e2))
+    var todo: Queue[(NK, SP, NK)] = Queue(starts.filterNot(_._2 eq SP.False): _*)
     def enq(a: NK, sp: SP, b: NK): Unit =
       if sp eq SP.False then return
       todo.enqueue((a, sp, b))
@@ -360,44 +357,69 @@ object Bisim {
       val rest = todo.filter { (a2, sp2, b2) => a == a2 && b == b2 }
       todo = todo.filterNot { (a2, sp2, b2) => a == a2 && b == b2 }
       (a, SP.unionN(rest.map(_._2)), b)
-    var done: Map[(NK, NK), SP] = Map()
     var i = 0
+    var peak = 1
     val limit = 100000
+    Collector.enter()
     while (todo.nonEmpty && i < limit) {
-      if (!Options.suppressOutput && false) println(s"\u001B[34mIteration $i \u001B[0m")
+      Collector.safepoint(List(todo, related.roots))
       i += 1
       val (e1, sp, e2) = deq()
-      // println(s"Testing equivalence of ($e1, $sp, $e2)")
-      val done12 = done.getOrElse((e1, e2), SP.False)
-      val spRest = SP.difference(sp, done12)
-      if !(spRest eq SP.False) then
-        done = done.updated((e1, e2), SP.union(done12, spRest))
-        // println(s"done: $done")
-        // Check for ε equivalence
-        val εe1 = ε(e1)
-        val εe2 = ε(e2)
-        val cmp = SPP.equivAt(spRest, εe1, εe2)
-        // println(s"SPP.equivAt($spRest, $εe1, $εe2) = $cmp")
-        if !cmp then return false
-
-        // println(s"Enqueued ($a, $sp, $b)")
-        // Add all pairs to the queue
-        // println("Adding all pairs to the queue")
-        // for (e1, spp1) <- δ(e1) do for (e2, spp2) <- δ(e2) do enq(e1, SP.intersection(SPP.run(spRest, spp1), SPP.run(spRest, spp2)), e2)
-        for (e1, spp1) <- δ(e1) do for (e2, spp2) <- δ(e2) do enq(e1, SPP.run(spRest, SPP.intersection(spp1, spp2)), e2)
-        val all1 = δ(e1).map { (e, sp) => sp }.foldLeft(SPP.False: SPP)(SPP.union(_, _))
-        val all2 = δ(e2).map { (e, sp) => sp }.foldLeft(SPP.False: SPP)(SPP.union(_, _))
-        // println(s"all1: $all1, all2: $all2, sp2: $sp2")
-        // println(s"δe1: $δe1, δe2: $δe2")
-        // println("Adding right zeroes")
-        for (e1, spp1) <- δ(e1) do enq(e1, SPP.run(spRest, SPP.difference(spp1, all2)), Zero)
-        // println("Adding left zeroes")
-        for (e2, spp2) <- δ(e2) do enq(Zero, SPP.run(spRest, SPP.difference(spp2, all1)), e2)
+      if !related.covers(e1, e2) then
+        val done12 = related(e1, e2)
+        val spRest = spp { SP.difference(sp, done12) }
+        if !(spRest eq SP.False) then
+          related(e1, e2) = spp { SP.union(done12, spRest) }
+          // Check for ε equivalence
+          val εe1 = ε(e1)
+          val εe2 = ε(e2)
+          val cmp = spp { SPP.equivAt(spRest, εe1, εe2) }
+          if !cmp then
+            if Trace.enabled then Trace.explored(i, peak, related.size)
+            return false
+          // Add all pairs to the queue
+          for ((e1, e2), sp) <- successors(e1, spRest, e2) do enq(e1, sp, e2)
+          peak = peak max todo.size
     }
+    if Trace.enabled then Trace.explored(i, peak, related.size)
     if i == limit then throw new Throwable("Limit exceeded")
     true
   }
 
+  /** A union-find structure over automaton states, used by `PairsUpTo` and `Automaton.bisim`. */
+  class UnionFind {
+    private val parent = scala.collection.mutable.HashMap.empty[NK, NK]
+
+    /** Returns the representative of the class of `e`, compressing the path to it. */
+    def find(e: NK): NK =
+      parent.get(e) match {
+        case None => e
+        case Some(p) =>
+          val r = find(p)
+          if !(r eq p) then parent(e) = r
+          r
+      }
+
+    /** Merges the classes of `a` and `b`. */
+    def union(a: NK, b: NK): Unit =
+      val ra = find(a)
+      val rb = find(b)
+      if ra != rb then parent(ra) = rb
+  }
+
+  /** Checks if two given NK expressions are bisimilar, using Hopcroft and Karp's algorithm up to equivalence.
+    *
+    * This explores the same pairs as `bisimPrim`, except that pairs that are already known to be related are skipped (see `PairsUpTo`). Pairs that are related for only some packets are also looked up in both orientations.
+    *
+    * @param e1
+    *   The first NK expression.
+    * @param e2
+    *   The second NK expression.
+    * @return
+    *   `true` if the expressions are bisimilar, `false` otherwise.
+    */
+  def bisimUF(e1: NK, e2: NK): Boolean = bisimLoop(List((e1, SP.True, e2)), new PairsUpTo)
+
   /** Determines the possible output packets that a NK expression can produce.
     *
     * @param e
@@ -406,6 +428,16 @@ object Bisim {
     *   the set of possible output packets
     */
   def forward(e: NK): SP =
+    if Options.quotient then Quotient.query(e)(forwardOf) else forwardOf(e)
+
+  /** Determines the possible output packets of `e` with the algorithm that the options select. */
+  private def forwardOf(e: NK): SP =
+    if Options.materialize then Automaton.forward(e)
+    else if Parallel.enabled then forwardPar(e)
+    else forwardPrim(e)
+
+  /** Determines the possible output packets that a NK expression can produce, by exploring its derivatives directly. */
+  def forwardPrim(e: NK): SP =
     import scala.collection.mutable.Queue
     var todo: Queue[(NK, SP)] = Queue((e, SP.True))
     def enq(a: NK, sp: SP): Unit =
@@ -418,21 +450,26 @@ object Bisim {
       (a, SP.unionN(rest.map(_._2)))
     var done: Map[NK, SP] = Map()
     var i = 0
+    var peak = 1
     val limit = 100000
+    Collector.enter()
     while (todo.nonEmpty && i < limit) {
+      Collector.safepoint(List(todo, done))
       if (!Options.suppressOutput && false) println(s"\u001B[34mIteration $i \u001B[0m")
       // benchmark(
       // s"Iteration $i time", {
       i += 1
       val (e, sp) = deq()
       val done1 = done.getOrElse(e, SP.False)
-      val spRest = SP.difference(sp, done1)
-      if !(spRest eq SP.False) then done = done.updated(e, SP.union(done1, spRest))
-      for (e, spp) <- δ(e) do enq(e, SPP.run(spRest, spp))
+      val spRest = benchmark("spp", SP.difference(sp, done1))
+      if !(spRest eq SP.False) then done = done.updated(e, benchmark("spp", SP.union(done1, spRest)))
+      for (e, spp) <- δ(e) do enq(e, benchmark("spp", SPP.run(spRest, spp)))
+      peak = peak max todo.size
       // }
       // )
     }
-    SP.unionN(done.map { (e, sp) => SPP.run(sp, ε(e)) })
+    if Trace.enabled then Trace.explored(i, peak, done.size)
+    SP.unionN(done.map { (e, sp) => val εe = ε(e); benchmark("spp", SPP.run(sp, εe)) })
 
   /** Produces reverse transitions of an automaton.
     *
@@ -465,6 +502,16 @@ object Bisim {
     *   The set of input packets that aren't dropped.
     */
   def backward(e: NK): SP =
+    if Options.quotient then Quotient.query(e)(backwardOf) else backwardOf(e)
+
+  /** Determines the input packets that `e` doesn't drop with the algorithm that the options select. */
+  private def backwardOf(e: NK): SP =
+    if Options.materialize then Automaton.backward(e)
+    else if Parallel.enabled then backwardPar(e)
+    else backwardPrim(e)
+
+  /** Determines the set of input packets that aren't dropped by the NK expression, by exploring its derivatives directly. */
+  def backwardPrim(e: NK): SP =
     import scala.collection.mutable.Queue
     // first, we find all the reverse transitions in the automaton
     val T = revTrans(e)
@@ -479,16 +526,85 @@ object Bisim {
       (a, SP.unionN(rest.map(_._2)))
     var done: Map[NK, SP] = Map()
     var i = 0
+    var peak = todo.size
     val limit = 100000
+    Collector.enter()
     while (todo.nonEmpty && i < limit) {
+      Collector.safepoint(List(todo, done))
       if (!Options.suppressOutput && false) println(s"\u001B[34mIteration $i \u001B[0m")
       i += 1
       val (e, sp) = deq()
       val done1 = done.getOrElse(e, SP.False)
-      val spRest = SP.difference(sp, done1)
+      val spRest = benchmark("spp", SP.difference(sp, done1))
       if !(spRest eq SP.False) then
-        done = done.updated(e, SP.union(done1, spRest))
-        for (e2, spp) <- T.getOrElse(e, Map()) do enq(e2, SPP.pull(spp, spRest))
+        done = done.updated(e, benchmark("spp", SP.union(done1, spRest)))
+        for (e2, spp) <- T.getOrElse(e, Map()) do enq(e2, benchmark("spp", SPP.pull(spp, spRest)))
+      peak = peak max todo.size
     }
+    if Trace.enabled then Trace.explored(i, peak, done.size)
+    done.getOrElse(e, SP.False)
+
+  /** Explores the states reachable from `start` in frontier batches, on `Options.threads` threads (see `Parallel`), and returns the packets that reach each state. `step(k, sp)` returns the successors of the new packets `sp` at state `k`, or `None` if they show a counterexample, which makes the search return `None` after the current batch. The frontier holds every waiting state once, with the union of its packets, and the states of a batch are processed independently against the `done` table of the previous batch. Like the loops above, the search stops after `limit` iterations, which is an error if `strict` (as in `bisimPrim`).
+    */
+  def frontierSearch[K](start: Iterable[(K, SP)], strict: Boolean = false)(step: (K, SP) => Option[Iterable[(K, SP)]]): Option[Map[K, SP]] =
+    var frontier = merge(Vector(start))
+    var done: Map[K, SP] = Map()
+    var failed = false
+    var i = 0
+    var peak = frontier.size
+    val limit = 100000
+    Collector.enter()
+    while frontier.nonEmpty && !failed && i < limit do
+      Collector.safepoint(List(frontier, done))
+      // Like the sequential loops, process at most `limit` states in total
+      val (batch, rest) = frontier.splitAt(limit - i)
+      i += batch.size
+      val results = Parallel.map(batch) { (k, sp) =>
+        val done1 = done.getOrElse(k, SP.False)
+        val spRest = spp { SP.difference(sp, done1) }
+        if spRest eq SP.False then None
+        else Some((k, spp { SP.union(done1, spRest) }, step(k, spRest)))
+      }
+      for case Some((k, sp, _)) <- results do done = done.updated(k, sp)
+      failed = results.exists { case Some((_, _, None)) => true; case _ => false }
+      frontier = merge(rest +: results.collect { case Some((_, _, Some(succs))) => succs })
+      peak = peak max frontier.size
+    if Trace.enabled then Trace.explored(i, peak, done.size)
+    if strict && frontier.nonEmpty && !failed then throw new Throwable("Limit exceeded")
+    if failed then None else Some(done)
+
+  /** Merges the successors of a batch into the next frontier: one entry per state, in order of first occurrence, with the union of its packets. */
+  private def merge[K](succs: IndexedSeq[Iterable[(K, SP)]]): Vector[(K, SP)] =
+    val grouped = scala.collection.mutable.LinkedHashMap.empty[K, List[SP]]
+    for xs <- succs; (k, sp) <- xs if !(sp eq SP.False) do grouped(k) = sp :: grouped.getOrElse(k, Nil)
+    val states = grouped.keys.toVector
+    states.zip(Parallel.map(states)(k => spp { SP.unionN(grouped(k)) }))
+
+  /** Checks if two given NK expressions are bisimilar, like `bisimPrim`, exploring the pairs of states in frontier batches on several threads. */
+  def bisimPar(e1: NK, e2: NK): Boolean = bisimPar(List((e1, SP.True, e2)))
+
+  /** Checks if the expressions of every start `(e1, sp, e2)` are bisimilar on the packets `sp`, like `bisimPrim`, exploring all starts together in frontier batches on several threads. */
+  def bisimPar(starts: List[(NK, SP, NK)]): Boolean =
+    frontierSearch(starts.map((e1, sp, e2) => ((e1, e2), sp)), strict = true) { case ((e1, e2), spRest) =>
+      val εe1 = ε(e1)
+      val εe2 = ε(e2)
+      if spp { SPP.equivAt(spRest, εe1, εe2) } then Some(successors(e1, spRest, e2)) else None
+    }.isDefined
+
+  /** Determines the possible output packets that a NK expression can produce, like `forwardPrim`, exploring the derivatives in frontier batches on several threads. */
+  def forwardPar(e: NK): SP =
+    val done = frontierSearch(List((e, SP.True))) { (e, spRest) =>
+      Some(δ(e).map((e2, spp1) => (e2, spp { SPP.run(spRest, spp1) })))
+    }.get
+    SP.unionN(Parallel.map(done.toVector) { (e, sp) => val εe = ε(e); spp { SPP.run(sp, εe) } })
+
+  /** Determines the set of input packets that aren't dropped by the NK expression, like `backwardPrim`, exploring the reverse transitions in frontier batches on several threads. */
+  def backwardPar(e: NK): SP =
+    val T = revTrans(e)
+    val states = (T.keys ++ Set(e)).toVector
+    val start = states.zip(Parallel.map(states)(e => spp { SPP.pull(ε(e), SP.True) }))
+    val done = frontierSearch(start) { (e, spRest) =>
+      Some(T.getOrElse(e, Map()).map((e2, spp1) => (e2, spp { SPP.pull(spp1, spRest) })))
+    }.get
     done.getOrElse(e, SP.False)
 }
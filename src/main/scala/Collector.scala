@@ -0,0 +1,151 @@
+package nkpl
+
+import java.util.{Collections, IdentityHashMap}
+import scala.collection.mutable
+
+/** Collection of dead SP and SPP nodes and memo entries while a file runs (`--gc <nodes>`).
+  *
+  * Without it, the unique tables (`SP.Test.cache`, `SPP.TestMut.cache`) and the memo tables only shrink when `clearCaches` runs between files, so a file that runs thousands of checks keeps every intermediate node alive until it ends. With `--gc`, a collection runs at the next safe point once the unique tables hold more than the given number of nodes, or once the heap is nearly full after a JVM garbage collection (see `Memory`). Safe points are the boundaries between the statements of a file and between the iterations of a `for` loop in `Runner`, and the iterations of the exploration loops of `Bisim` and `Automaton`, so that a single large check collects too.
+  *
+  * A collection marks the nodes that are reachable from the roots: the environment of the running file, the materialized automaton, and the memo entries whose arguments are NetKAT expressions only (such as the derivatives computed by `Bisim.ε` and `Bisim.δ`, which later statements are likely to need again). It then removes the unmarked nodes from the unique tables, and the memo entries whose arguments or result contain an unmarked node. Hash-consing relies on there being a single copy of every node, so a removed node must not be used again. Between statements, every SP and SPP that later statements can reach is in the environment. Inside an exploration loop, the code that runs the loop may also hold nodes on the stack, such as the operands of a check or the result of an earlier query of the same statement, which are not roots. So every node records the `epoch` in which it was created (`born`), every loop starts a new epoch (`enter`), and a collection inside a loop only removes nodes of the current epoch that are not reachable from the worklists of the loop, which it passes as roots: the nodes created before the loop started are kept. Afterwards the threshold grows to twice the number of live nodes, so that the time spent collecting stays proportional to the work done in between.
+  */
+object Collector {
+
+  /** The number of collections in the current file, the number of nodes they reclaimed, and the time they took (in seconds). */
+  var collections = 0
+  var reclaimed = 0L
+  var time = 0.0
+
+  /** Set when the heap is nearly full after a JVM garbage collection; the next safe point then collects. */
+  @volatile var pressure = false
+
+  private var nextCollection = 0L
+
+  /** The epoch of the running exploration loop, recorded by the SP and SPP nodes that it creates. */
+  var epoch = 0
+
+  /** Set during a collection inside a loop, which keeps the nodes of earlier epochs. */
+  private var youngOnly = false
+
+  /** The environment of the running file, updated by `Runner` after every statement. */
+  var env: Runner.Env = Map()
+
+  /** Functions that return additional roots, such as the states and edges of the materialized automaton. */
+  var rootFns = List[() => Iterable[Any]]()
+
+  /** A memo table, registered by `memoize`. */
+  private class Table[A, B](cache: mutable.HashMap[A, B]) {
+    def markPermanent(): Unit = for (a, b) <- cache if permanent(a) do { mark(a); mark(b) }
+    def sweep(): Unit = cache.filterInPlace((a, b) => live(a) && live(b))
+  }
+
+  private var tables = List[Table[?, ?]]()
+
+  def register[A, B](cache: mutable.HashMap[A, B]): Unit =
+    tables = new Table(cache) :: tables
+
+  /** Starts a new file. */
+  def reset(): Unit =
+    collections = 0
+    reclaimed = 0
+    time = 0.0
+    pressure = false
+    nextCollection = Options.gcThreshold
+    env = Map()
+
+  /** The number of nodes in the unique tables. */
+  def nodes: Long = SP.Test.cache.size.toLong + SPP.TestMut.cache.size
+
+  /** Collects if a collection is due. Must only be called between statements, when `env` holds everything that the rest of the file can reach. */
+  def safepoint(): Unit =
+    if Options.gcThreshold > 0 && (pressure || nodes > nextCollection) then collect(Nil, false)
+
+  /** Starts an exploration loop, and with it a new epoch: the nodes created so far, which the code that runs the loop may hold, are kept by the collections inside the loop. A loop that runs inside an iteration of another loop starts a new epoch too, so the outer loop's nodes are kept while it runs. */
+  def enter(): Unit =
+    epoch += 1
+
+  /** Collects if a collection is due, at the start of an iteration of an exploration loop. `roots` are the worklists of the loop: the nodes created since the loop started that they don't reach are removed. Must only be called where the loop holds no other nodes of its own, and not while other threads run. */
+  def safepoint(roots: => Iterable[Any]): Unit =
+    if Options.gcThreshold > 0 && (pressure || nodes > nextCollection) then collect(roots, true)
+
+  /** Determines whether the collection keeps `t` regardless of marking, as it is older than the running loop. */
+  private def old(t: SP.Test | SPP.TestMut): Boolean =
+    youngOnly && (t match { case t: SP.Test => t.born; case t: SPP.TestMut => t.born }) < epoch
+
+  private val marked = Collections.newSetFromMap(new IdentityHashMap[AnyRef, java.lang.Boolean]())
+
+  private def mark(x: Any): Unit =
+    x match {
+      case t: SP.Test =>
+        // The children of a node are at least as old as the node
+        if !old(t) && marked.add(t) then
+          t.ys.values.foreach(mark)
+          mark(t.default)
+      case t: SPP.TestMut =>
+        if !old(t) && marked.add(t) then
+          t.branches.values.foreach(_.values.foreach(mark))
+          t.other.values.foreach(mark)
+          mark(t.id)
+      case e: NK =>
+        if marked.add(e) then
+          e match {
+            case TestSP(sp) => mark(sp)
+            case Seq(es) => es.foreach(mark)
+            case Sum(es) => es.foreach(mark)
+            case Star(e) => mark(e)
+            case Difference(e1, e2) => mark(e1); mark(e2)
+            case Intersection(e1, e2) => mark(e1); mark(e2)
+            case XOR(e1, e2) => mark(e1); mark(e2)
+            case _ => ()
+          }
+      case m: collection.Map[?, ?] => m.foreach((k, v) => { mark(k); mark(v) })
+      case xs: Iterable[?] => xs.foreach(mark)
+      case xs: Array[?] => xs.foreach(mark)
+      case p: Product => p.productIterator.foreach(mark)
+      case _ => ()
+    }
+
+  /** Determines whether `x` refers to no SP or SPP nodes, except through NetKAT expressions. Memo entries with such arguments are roots. */
+  private def permanent(x: Any): Boolean =
+    x match {
+      case _: SP.Test | _: SPP.TestMut => false
+      case _: NK => true
+      case p: Product => p.productIterator.forall(permanent)
+      case _ => true
+    }
+
+  /** Determines whether all SP and SPP nodes in `x` are marked. */
+  private def live(x: Any): Boolean =
+    x match {
+      case t: SP.Test => old(t) || marked.contains(t)
+      case t: SPP.TestMut => old(t) || marked.contains(t)
+      case _: NK => true // marked as part of a permanent memo entry or a root
+      case m: collection.Map[?, ?] => m.forall((k, v) => live(k) && live(v))
+      case xs: Iterable[?] => xs.forall(live)
+      case p: Product => p.productIterator.forall(live)
+      case _ => true
+    }
+
+  /** Removes the nodes and memo entries that are not reachable from `roots`, the environment, the registered roots or permanent memo entries. If `young`, only nodes of the current epoch are removed. */
+  def collect(roots: Iterable[Any], young: Boolean): Unit =
+    val start = System.nanoTime()
+    val before = nodes
+    youngOnly = young
+    mark(env)
+    roots.foreach(mark)
+    for f <- rootFns do f().foreach(mark)
+    for t <- tables do t.markPermanent()
+    for t <- tables do t.sweep()
+    SP.Test.cache.filterInPlace((t, _) => live(t))
+    SPP.TestMut.cache.filterInPlace((t, _) => live(t))
+    marked.clear()
+    youngOnly = false
+    collections += 1
+    reclaimed += before - nodes
+    nextCollection = Options.gcThreshold.toLong max (2 * nodes)
+    pressure = false
+    time += (System.nanoTime() - start) / 1_000_000_000.0
+
+  def printStats(): Unit =
+    println(f"Collector: $collections collections, $reclaimed nodes reclaimed in $time%.2f s, $nodes nodes live")
+}
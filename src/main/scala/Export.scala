@@ -0,0 +1,174 @@
+package nkpl
+
+import java.io.{BufferedOutputStream, BufferedWriter, FileOutputStream, OutputStreamWriter, Writer}
+import java.nio.charset.StandardCharsets.UTF_8
+import java.nio.file.{Files, Paths, StandardCopyOption}
+import java.security.MessageDigest
+import java.util.zip.GZIPOutputStream
+
+/** Exports checks to Frenetic's KAT format, for comparison with Frenetic (`katch convert`).
+  *
+  * Each operand is written to `kat/<sha256>.kat`, named by `digest`, a SHA-256 hash of its structure that determines its text, and each check appends a line `<lhs>.kat <rhs>.kat <result>` to the index file of the input file (see `Options.katIndex`), flushed line by line. Since the name is known before the text, operands whose file exists already (from an earlier check or run) are not rendered at all. Other operands are streamed straight to disk; the text of compound subterms of up to `memoLength` characters is memoized, so shared subterms such as the networks of a topology are rendered once, while the text of large subterms and of whole operands is never held in memory.
+  */
+object KatExport {
+
+  /** Array containing the names of frenetic variables. This is needed because Frenetic only supports a limited set of variables. When converting NKPL expressions to Frenentic, we choose variables from this set.
+    */
+  val freneticVars = Array("switch", "port", "vswitch", "vport", "vfabric", "ethSrc", "ethDst", "vlanId", "vlanPcp", "ethTyp", "ipProto", "ip4Src", "ip4Dst", "tcpSrcPort", "tcpDstPort")
+
+  /** The length of the longest subterm text that `render` memoizes. */
+  val memoLength = 1 << 16
+
+  /** Rendered text of compound subterms of at most `memoLength` characters. NK nodes are hash-consed, so this is keyed by node identity in practice, and weak so that it doesn't keep dead networks alive. */
+  private val rendered = scala.collection.mutable.WeakHashMap.empty[NK, String]
+
+  /** The open index file, and the input file it belongs to. */
+  private var index: Writer = null
+  private var indexFile = ""
+
+  val dir = "kat"
+
+  def getVar(n: Int): String =
+    if n < freneticVars.length then freneticVars(n)
+    else throw new Throwable(s"Unsupported variable $n")
+
+  def getVal(n: Int): Int =
+    if n < 0 then 1000 + n
+    else n
+
+  private def sha(parts: String*): String =
+    val md = MessageDigest.getInstance("SHA-256")
+    for p <- parts do
+      md.update(p.getBytes(UTF_8))
+      md.update(0: Byte)
+    md.digest().map("%02x".format(_)).mkString
+
+  /** A hash of the KAT text of `e`, computed from its structure without rendering it: equal hashes mean equal text. Like the key of `VerdictCache.digest`, but with the Frenetic names of fields and values, and in the order of the text. */
+  lazy val digest: NK => String = memoize { e =>
+    e match {
+      case Seq(es) => sha("seq" :: es.map(digest): _*)
+      case Sum(es) => sha("sum" :: es.toList.map(digest): _*)
+      case Test(x, v) => sha("test", getVar(x), getVal(v).toString)
+      case TestNE(x, v) => sha("testne", getVar(x), getVal(v).toString)
+      case Mut(x, v) => sha("mut", getVar(x), getVal(v).toString)
+      case Dup => sha("dup")
+      case Star(e) => sha("star", digest(e))
+      case _ => sha("other", toKat(e)) // toKat throws for the expressions that Frenetic doesn't support
+    }
+  }
+
+  /** The length of the KAT text of `e`, computed without rendering it. */
+  lazy val length: NK => Long = memoize { e =>
+    e match {
+      case Seq(es) => 2 + (if es.isEmpty then 2 else es.map(length).sum + es.size - 1)
+      case Sum(es) => 2 + (if es.isEmpty then 4 else es.toList.map(length).sum + es.size - 1)
+      case Star(e) => 3 + length(e)
+      case _ => toKat(e).length
+    }
+  }
+
+  /** Writes the KAT text of `e` to `out`, reusing the memoized text of compound subterms. */
+  def render(e: NK, out: Appendable): Unit =
+    e match
+      case Seq(_) | Sum(_) | Star(_) if length(e) <= memoLength =>
+        rendered.get(e) match
+          case Some(s) => out.append(s)
+          case None =>
+            val sb = new java.lang.StringBuilder
+            renderPrim(e, sb)
+            val s = sb.toString
+            rendered(e) = s
+            out.append(s)
+      case _ => renderPrim(e, out)
+
+  /** Converts a NetKAT expression to Frenetic.
+    *
+    * @param e
+    *   The NetKAT expression to be converted.
+    * @param s
+    *   Where to write the converted expression.
+    */
+  def renderPrim(e: NK, s: Appendable): Unit =
+    s.append("(")
+    e match
+      case Seq(es) =>
+        if es.isEmpty then s.append("id")
+        else
+          var first = true;
+          for e <- es do
+            if !first then s.append(";")
+            first = false
+            render(e, s)
+      case Sum(es) =>
+        if es.isEmpty then s.append("drop")
+        else
+          var first = true
+          for e <- es do
+            if !first then s.append("+")
+            first = false
+            render(e, s)
+      case Test(x, v) => s.append(s"filter ${getVar(x)} = ${getVal(v)}")
+      case TestNE(x, v) => s.append(s"filter (not ${getVar(x)} = ${getVal(v)})")
+      case Mut(x, v) => s.append(s"${getVar(x)} := ${getVal(v)}")
+      case Dup => s.append("dup")
+      case Star(e) =>
+        render(e, s)
+        s.append("*")
+      case Difference(e1, e2) => throw new Throwable("Difference not supported")
+      case Intersection(e1, e2) => throw new Throwable("Intersection not supported")
+      case XOR(e1, e2) => throw new Throwable("XOR not supported")
+      case TestSP(sp) => throw new Throwable("TestSP not supported")
+      case VarName(x) => throw new Throwable("VarName not supported")
+      case _ => throw new Throwable(s"Unsupported expression: $e")
+    s.append(")")
+
+  /** Converts an NK expression to a Frenetic KAT representation.
+    *
+    * @param e
+    *   the NK expression to convert
+    * @return
+    *   the KAT string representation of the expression
+    */
+  def toKat(e: NK): String =
+    val s = new java.lang.StringBuilder
+    renderPrim(e, s)
+    s.toString
+
+  /** Writes `e` to `kat/<digest>.kat` (or `.kat.gz` if `Options.katCompress` is set) unless that file exists already, and returns the file name. The text is streamed to a temporary file, which is then moved into place.
+    */
+  def exportNK(e: NK): String =
+    val name = if Options.katCompress then s"${digest(e)}.kat.gz" else s"${digest(e)}.kat"
+    val target = Paths.get(dir, name)
+    if !Files.exists(target) then
+      val tmp = Files.createTempFile(Paths.get(dir), "export", ".tmp")
+      val file = new BufferedOutputStream(new FileOutputStream(tmp.toFile), 1 << 16)
+      val sink = if Options.katCompress then new GZIPOutputStream(file, 1 << 16) else file
+      val out = new BufferedWriter(new OutputStreamWriter(sink, UTF_8), 1 << 16)
+      try
+        try render(e, out)
+        finally out.close()
+      catch
+        case ex: Throwable =>
+          Files.deleteIfExists(tmp)
+          throw ex
+      Files.move(tmp, target, StandardCopyOption.REPLACE_EXISTING)
+    name
+
+  /** Exports both operands of a check and appends it to the index file of the current input file. */
+  def exportCheck(e1: NK, e2: NK, result: Boolean): Unit =
+    val file1 = exportNK(e1)
+    val file2 = exportNK(e2)
+    if index == null || indexFile != Options.katIndex() then
+      finish()
+      indexFile = Options.katIndex()
+      index = new BufferedWriter(new java.io.FileWriter(indexFile, true)) // true to append
+    index.write(s"$file1 $file2 $result\n")
+    // Flushed line by line, so that the pairs exported before a failing check are kept
+    index.flush()
+
+  /** Flushes and closes the index file. Called at the end of every input file. */
+  def finish(): Unit =
+    if index != null then
+      index.close()
+      index = null
+}
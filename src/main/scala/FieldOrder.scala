@@ -0,0 +1,220 @@
+package nkpl
+
+import scala.collection.mutable
+
+/** The order in which SPs and SPPs test fields (`--order` and `--reorder`).
+  *
+  * Diagrams test fields in increasing order of their rank. By default the rank of a field is its `VarMap` index, i.e., the order in which fields are first seen, but the size of the diagrams of a network can depend a lot on this order. Before a file is run, a static heuristic can choose the order from how the file uses its fields:
+  *
+  *   - `first-seen`: the `VarMap` order (the default).
+  *   - `frequency`: fields that occur more often in tests and mutations come first.
+  *   - `tests-first`: fields that are only tested come before fields that are mutated, then by frequency.
+  *   - `reverse`: the reverse of `first-seen`, as a baseline for comparisons.
+  *
+  * With `--reorder <nodes>`, the order is also improved while a file runs: once the SP and SPP unique tables hold more than the given number of nodes after a statement, each field is sifted through all positions, keeping the position where the diagrams of the bound expressions are smallest. Reordering clears all caches and rebuilds the SPs in the environment, and the threshold doubles after every reordering.
+  */
+object FieldOrder {
+
+  /** The names of the static heuristics. */
+  val heuristics = List("first-seen", "frequency", "tests-first", "reverse")
+
+  /** `ranks(x)` is the rank of field `x`. */
+  private var ranks = Array.tabulate(16)(i => i)
+  private var registered = 0
+
+  /** The number of dynamic reorderings so far, and the next node count that triggers one. */
+  var reorderings = 0
+  private var nextReorder = 0L
+
+  /** Gives the new field `x` the highest rank. Called by `VarMap` for every new field. */
+  def register(x: Var): Unit =
+    if x >= ranks.length then ranks = java.util.Arrays.copyOf(ranks, 2 * (x + 1))
+    ranks(x) = registered
+    registered += 1
+
+  inline def rank(x: Var): Int = ranks(x)
+
+  /** Determines whether field `x` is tested before field `y`. */
+  inline def lt(x: Var, y: Var): Boolean = ranks(x) < ranks(y)
+
+  /** The fields in their current order. */
+  def fields: List[Var] = (0 until registered).toList.sortBy(rank)
+
+  /** Puts the fields of `order` first, in that order, followed by the other fields in their current order. The caller is responsible for clearing the caches: diagrams built with another order are invalid. */
+  def set(order: List[Var]): Unit =
+    val rest = fields.filterNot(order.contains)
+    for (x, i) <- (order ++ rest).zipWithIndex do ranks(x) = i
+
+  /** Resets the order to `first-seen`. */
+  def reset(): Unit =
+    for x <- 0 until registered do ranks(x) = x
+    reorderings = 0
+    nextReorder = Options.reorderThreshold
+
+  /** How often each field is tested and mutated in a program. */
+  class Usage {
+    val tests = mutable.Map[Var, Int]().withDefaultValue(0)
+    val muts = mutable.Map[Var, Int]().withDefaultValue(0)
+    def total(x: Var): Int = tests(x) + muts(x)
+    def fields: List[Var] = (tests.keySet ++ muts.keySet).toList.sorted
+  }
+
+  /** Counts the uses of fields in the NKPL file at `path`, including the files it imports. */
+  def usage(path: String): Usage =
+    val u = new Usage
+    val visited = mutable.Set[String]()
+    def nk(e: Parser.NK): Unit =
+      e match {
+        case Parser.Test(x, _) => u.tests(x) += 1
+        case Parser.TestNE(x, _) => u.tests(x) += 1
+        case Parser.Mut(x, _) => u.muts(x) += 1
+        case Parser.Seq(es) => es.foreach(nk)
+        case Parser.Sum(es) => es.foreach(nk)
+        case Parser.Difference(e1, e2) => nk(e1); nk(e2)
+        case Parser.Intersection(e1, e2) => nk(e1); nk(e2)
+        case Parser.XOR(e1, e2) => nk(e1); nk(e2)
+        case Parser.Star(e) => nk(e)
+        case Parser.Forward(e, _) => nk(e)
+        case Parser.Backward(e, _) => nk(e)
+        case Parser.Exists(x, e) => u.tests(x) += 1; nk(e)
+        case Parser.Forall(x, e) => u.tests(x) += 1; nk(e)
+        case _ => ()
+      }
+    def expr(e: Parser.Expr): Unit =
+      e match {
+        case Parser.Expr.NKExpr(e) => nk(e)
+        case Parser.Expr.ValExpr(_) => ()
+      }
+    def stmt(s: Parser.Stmt, path: String): Unit =
+      s match {
+        case Parser.Stmt.Check(_, e1, e2) => expr(e1); expr(e2)
+        case Parser.Stmt.Graphviz(_, e) => expr(e)
+        case Parser.Stmt.Print(e) => expr(e)
+        case Parser.Stmt.Run(_, e) => expr(e)
+        case Parser.Stmt.Let(_, e) => expr(e)
+        case Parser.Stmt.Import(path2) => file(path.split("/").dropRight(1).mkString("/") + "/" + path2)
+        // The body is counted once, like the expressions it binds
+        case Parser.Stmt.For(_, _, _, s) => stmt(s, path)
+      }
+    def file(path: String): Unit =
+      if visited.add(path) then
+        val input = scala.io.Source.fromFile(path).mkString
+        for line <- Runner.splitStatements(input) do
+          Parser.parseStmt(line) match {
+            case Left((s, _)) => stmt(s, path)
+            case Right(_) => () // reported when the file runs
+          }
+    file(path)
+    u
+
+  /** The order that `heuristic` chooses for the fields of `u`. */
+  def choose(heuristic: String, u: Usage): List[Var] =
+    heuristic match {
+      case "first-seen" => u.fields
+      case "frequency" => u.fields.sortBy(x => -u.total(x))
+      case "tests-first" => u.fields.sortBy(x => (u.muts(x) > 0, -u.total(x)))
+      case "reverse" => u.fields.reverse
+      case _ => throw new Throwable(s"Unknown field order $heuristic, expected one of ${heuristics.mkString(", ")}")
+    }
+
+  /** Chooses the order for the file at `path` with the heuristic of `Options.fieldOrder`. Called by `runTopLevel` before the caches are cleared. */
+  def prepare(path: String): Unit =
+    reset()
+    if Options.fieldOrder != "first-seen" then set(choose(Options.fieldOrder, usage(path)))
+
+  /** Returns the number of nodes at each field in the diagrams reachable from `roots`. */
+  def levelSizes(roots: Iterable[SPP]): Map[Var, Int] =
+    val seen = mutable.HashSet.empty[AnyRef]
+    val sizes = mutable.Map[Var, Int]().withDefaultValue(0)
+    def sp(x: SP): Unit =
+      x match {
+        case t @ SP.Test(x, ys, default) if seen.add(t) =>
+          sizes(x) += 1
+          ys.values.foreach(sp); sp(default)
+        case _ => ()
+      }
+    def spp(x: SPP): Unit =
+      x match {
+        case t @ SPP.TestMut(x, branches, other, id) if seen.add(t) =>
+          sizes(x) += 1
+          branches.values.foreach(_.values.foreach(spp)); other.values.foreach(spp); spp(id)
+        case _ => ()
+      }
+    roots.foreach(spp)
+    sizes.toMap
+
+  /** Formats node counts per field in the current order, e.g. `sw: 12, pt: 40, dst: 3`. */
+  def describe(sizes: Map[Var, Int]): String =
+    fields.filter(sizes.contains).map(x => s"${VarMap(x)}: ${sizes(x)}").mkString(", ")
+
+  /** Rebuilds an SP that was built with another order, with the current order. */
+  def rebuild(sp: SP, memo: mutable.HashMap[SP, SP]): SP =
+    sp match {
+      case SP.Test(x, ys, default) =>
+        memo.getOrElseUpdate(
+          sp, {
+            // Tests on a single field are valid in any order
+            val others = SP.Test(x, ys.map((v, _) => v -> (SP.False: SP)), SP.True)
+            ys.foldLeft(SP.intersection(others, rebuild(default, memo))) { case (acc, (v, a)) =>
+              SP.union(acc, SP.intersection(SP.test(x, v), rebuild(a, memo)))
+            }
+          }
+        )
+      case _ => sp
+    }
+
+  /** Rebuilds the SPs in `e` with the current order. */
+  def rebuild(e: NK, memo: mutable.HashMap[SP, SP], nkMemo: mutable.HashMap[NK, NK]): NK =
+    nkMemo.getOrElseUpdate(
+      e,
+      e match {
+        case TestSP(sp) => TestSP(rebuild(sp, memo))
+        case Seq(es) => Seq(es.map(rebuild(_, memo, nkMemo)))
+        case Sum(es) => Sum(es.map(rebuild(_, memo, nkMemo)))
+        case Star(e) => Star(rebuild(e, memo, nkMemo))
+        case Difference(e1, e2) => Difference(rebuild(e1, memo, nkMemo), rebuild(e2, memo, nkMemo))
+        case Intersection(e1, e2) => Intersection(rebuild(e1, memo, nkMemo), rebuild(e2, memo, nkMemo))
+        case XOR(e1, e2) => XOR(rebuild(e1, memo, nkMemo), rebuild(e2, memo, nkMemo))
+        case _ => e
+      }
+    )
+
+  /** The total size of the dup-free parts (`Bisim.ε`) of the expressions bound in `env`, with the current order. Clears the caches first. */
+  private def measure(env: Runner.Env): (Int, Map[Var, Int]) =
+    clearCaches()
+    val memo = mutable.HashMap.empty[SP, SP]
+    val nkMemo = mutable.HashMap.empty[NK, NK]
+    val sizes = levelSizes(env.values.collect { case Left(e) => Bisim.ε(rebuild(e, memo, nkMemo)) })
+    (sizes.values.sum, sizes)
+
+  /** Reorders the fields by sifting if the unique tables have grown past the threshold, and returns the environment with its SPs rebuilt. Called between the statements of a file. */
+  def maybeReorder(env: Runner.Env): Runner.Env =
+    if Options.reorderThreshold <= 0 || SP.Test.cache.size + SPP.TestMut.cache.size <= nextReorder then return env
+    val before = SP.Test.cache.size + SPP.TestMut.cache.size
+    var order = fields
+    val (size0, sizes) = measure(env)
+    var best = size0
+    // Sift the fields with the most nodes first
+    for x <- order.sortBy(x => -sizes.getOrElse(x, 0)) do
+      val without = order.filterNot(_ == x)
+      for i <- 0 to without.length do
+        val candidate = without.take(i) ++ (x :: without.drop(i))
+        if candidate != order then
+          set(candidate)
+          val (size, _) = measure(env)
+          if size < best then
+            best = size
+            order = candidate
+      set(order)
+    clearCaches()
+    reorderings += 1
+    val memo = mutable.HashMap.empty[SP, SP]
+    val nkMemo = mutable.HashMap.empty[NK, NK]
+    val env2 = env.map {
+      case (k, Left(e)) => k -> Left(rebuild(e, memo, nkMemo))
+      case (k, v) => k -> v
+    }
+    nextReorder *= 2
+    if !Options.suppressOutput then println(s"Reordered fields at $before nodes: ${fields.map(VarMap(_)).mkString(" < ")} ($best nodes bound)")
+    env2
+}
@@ -106,6 +106,93 @@ def prepCheckFreneticScript() =
   val katDir = Paths.get("kat")
   if Files.notExists(katDir) then Files.createDirectory(katDir)
 
+/** Applies the options that are accepted by every command, and returns the remaining arguments.
+  *
+  *   - `--trace <file>` appends a JSON record for every statement to `<file>` (see `Trace`).
+  *   - `--bisim classic|uf` selects the bisimulation algorithm (see `Options.bisimAlgorithm`).
+  *   - `--optimize all|<rewrite>,...` enables rewrites of the query optimizer (see `Optimizer`).
+  *   - `--materialize` runs queries over a shared, explicit automaton (see `Automaton`).
+  *   - `--quotient` runs queries on one value per class of header values that the policies handle identically (see `Quotient`).
+  *   - `--decompose` splits checks into parts over slices of the policies that handle disjoint packets (see `Slicing`).
+  *   - `--gc <nodes>` collects dead SP and SPP nodes once there are more than `<nodes>` of them (see `Collector`).
+  *   - `--threads <n>` explores the frontier of each bisimulation, forward and backward query on `<n>` threads (see `Parallel`).
+  *   - `--viz-depth <n>`, `--viz-nodes <n>` and `--viz-collapse <n>` bound the graphs of `graphviz` statements, and `--viz-jobs <n>` renders them on `<n>` background threads (see `GV`).
+  *   - `--no-cache` makes `run` check every statement instead of answering unchanged checks from the verdict cache, `--cache <file>` selects the cache database, and `--cache-size <entries>` bounds it (see `VerdictCache`).
+  *   - `--order <heuristic>` chooses the order of fields in SPs and SPPs, and `--reorder <nodes>` reorders them when the diagrams grow (see `FieldOrder`).
+  */
+def parseGlobalOptions(args: List[String]): List[String] =
+  args match {
+    case "--trace" :: path :: rest =>
+      Options.traceFile = path
+      Trace.start(path)
+      parseGlobalOptions(rest)
+    case "--trace" :: Nil => error("Missing file name after --trace")
+    case "--bisim" :: alg :: rest if alg == "classic" || alg == "uf" =>
+      Options.bisimAlgorithm = alg
+      parseGlobalOptions(rest)
+    case "--bisim" :: _ => error("Usage: --bisim classic|uf")
+    case "--optimize" :: rewrites :: rest =>
+      val selected = if rewrites == "all" then Optimizer.rewrites else rewrites.split(",").toList
+      for r <- selected if !Optimizer.rewrites.contains(r) do error(s"Unknown rewrite $r, expected one of ${Optimizer.rewrites.mkString(", ")}")
+      Options.optimizations = selected.toSet
+      parseGlobalOptions(rest)
+    case "--optimize" :: Nil => error("Usage: --optimize all|<rewrite>,...")
+    case "--materialize" :: rest =>
+      Options.materialize = true
+      parseGlobalOptions(rest)
+    case "--quotient" :: rest =>
+      Options.quotient = true
+      parseGlobalOptions(rest)
+    case "--decompose" :: rest =>
+      Options.decompose = true
+      parseGlobalOptions(rest)
+    case "--no-cache" :: rest =>
+      Options.useCache = false
+      parseGlobalOptions(rest)
+    case "--cache" :: path :: rest =>
+      Options.cacheFile = path
+      parseGlobalOptions(rest)
+    case "--cache" :: Nil => error("Missing file name after --cache")
+    case "--cache-size" :: n :: rest if n.toIntOption.exists(_ > 0) =>
+      Options.cacheSize = n.toInt
+      parseGlobalOptions(rest)
+    case "--cache-size" :: _ => error("Usage: --cache-size <entries>")
+    case "--order" :: heuristic :: rest if FieldOrder.heuristics.contains(heuristic) =>
+      Options.fieldOrder = heuristic
+      parseGlobalOptions(rest)
+    case "--order" :: _ => error(s"Usage: --order ${FieldOrder.heuristics.mkString("|")}")
+    case "--reorder" :: nodes :: rest if nodes.toIntOption.exists(_ > 0) =>
+      Options.reorderThreshold = nodes.toInt
+      parseGlobalOptions(rest)
+    case "--reorder" :: _ => error("Usage: --reorder <nodes>")
+    case "--gc" :: nodes :: rest if nodes.toIntOption.exists(_ > 0) =>
+      Options.gcThreshold = nodes.toInt
+      parseGlobalOptions(rest)
+    case "--gc" :: _ => error("Usage: --gc <nodes>")
+    case "--threads" :: n :: rest if n.toIntOption.exists(_ > 0) =>
+      Options.threads = n.toInt
+      parseGlobalOptions(rest)
+    case "--threads" :: _ => error("Usage: --threads <n>")
+    case "--viz-depth" :: n :: rest if n.toIntOption.exists(_ > 0) =>
+      Options.vizDepth = n.toInt
+      parseGlobalOptions(rest)
+    case "--viz-depth" :: _ => error("Usage: --viz-depth <transitions>")
+    case "--viz-nodes" :: n :: rest if n.toIntOption.exists(_ > 0) =>
+      Options.vizNodes = n.toInt
+      parseGlobalOptions(rest)
+    case "--viz-nodes" :: _ => error("Usage: --viz-nodes <states>")
+    case "--viz-collapse" :: n :: rest if n.toIntOption.exists(_ > 0) =>
+      Options.vizCollapse = n.toInt
+      parseGlobalOptions(rest)
+    case "--viz-collapse" :: _ => error("Usage: --viz-collapse <nodes>")
+    case "--viz-jobs" :: n :: rest if n.toIntOption.exists(_ >= 0) =>
+      Options.vizJobs = n.toInt
+      parseGlobalOptions(rest)
+    case "--viz-jobs" :: _ => error("Usage: --viz-jobs <threads>")
+    case arg :: rest => arg :: parseGlobalOptions(rest)
+    case Nil => Nil
+  }
+
 def init() =
   VarMap("sw")
   VarMap("pt")
@@ -120,12 +207,15 @@ def init() =
   init()
   if cmd.isEmpty then error("No command specified")
   val command = cmd(0)
-  var inputs = cmd.tail
+  var inputs = parseGlobalOptions(cmd.tail.toList)
   command match {
     case "convert" =>
       println("Converting to KAT:")
       prepCheckFreneticScript()
       Options.convertToKat = true
+      if inputs.headOption == Some("--gzip") then
+        Options.katCompress = true
+        inputs = inputs.tail
       runFilesAndDirs(inputs.toList)
     case "compare" =>
       println("Comparing NKPL and KAT:")
@@ -140,6 +230,7 @@ def init() =
     case "run" =>
       println("Running NKPL:")
       Options.convertToKat = false
+      if Options.useCache && Options.traceFile.isEmpty then VerdictCache.open()
       runFilesAndDirs(inputs.toList)
     case "run+warmup" =>
       println("Running NKPL:")
@@ -147,6 +238,17 @@ def init() =
       Options.convertToKat = false
       Options.warmup = true
       runFilesAndDirs(inputs.toList)
+    case "serve" =>
+      // Sessions share the unique tables, so reordering or collecting for one would invalidate the others
+      if Options.fieldOrder != "first-seen" || Options.reorderThreshold > 0 || Options.gcThreshold > 0 then
+        error("--order, --reorder and --gc are not supported by serve")
+      Options.suppressOutput = true
+      inputs.toList match {
+        case List() => Server.serveTCP(Server.defaultPort)
+        case List("--port", port) => Server.serveTCP(port.toInt)
+        case List("--stdio") => Server.serveStdio()
+        case _ => error("Usage: katch serve [--port <port> | --stdio]")
+      }
     case "bench" =>
       println("Benchmarking:")
       for (i <- 0 to 10) runFilesAndDirs(List("nkpl/misc/scratch/bench.nkpl"))
@@ -187,3 +289,5 @@ def init() =
       fw.close()
     case _ => error(s"Invalid command $command")
   }
+  VerdictCache.close()
+  GV.awaitRenders()
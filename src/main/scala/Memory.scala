@@ -0,0 +1,117 @@
+package nkpl
+
+import java.io.FileWriter
+import java.lang.management.ManagementFactory
+import java.util.concurrent.atomic.AtomicLong
+import javax.management.{Notification, NotificationEmitter, NotificationListener}
+import javax.management.openmbean.CompositeData
+import com.sun.management.GarbageCollectionNotificationInfo
+import scala.jdk.CollectionConverters.*
+
+/** Measures the memory use of running an NKPL file, from the JVM's management beans.
+  *
+  * For every file, `runTopLevel` appends a line to `Options.outputMemoryCSV`:
+  *
+  * {{{
+  * system,file,peak heap after GC (bytes),allocated (bytes),allocation rate (bytes/s),GC time (s),GC count,SP nodes,SPP nodes
+  * }}}
+  *
+  * The peak heap after GC is the largest heap occupancy that a garbage collection left behind, which approximates the live data that the query needed. If no collection happened during the run, the heap occupancy at the end of the run is reported instead (an upper bound, including garbage). The node counts are the sizes of the SP and SPP unique tables at the end of the run. In warmup mode, the peak and node counts are maxima, and the other columns are averages, over the measured runs.
+  */
+object Memory {
+
+  private val peakAfterGC = new AtomicLong(0)
+
+  private val threads = ManagementFactory.getThreadMXBean.asInstanceOf[com.sun.management.ThreadMXBean]
+
+  private var listening = false
+
+  /** The fraction of the maximum heap that, if still in use after a garbage collection, makes `Collector` collect at its next safe point. */
+  val pressureFraction = 0.8
+
+  /** Starts listening for the end of every garbage collection, to record the heap occupancy that it left. */
+  private def listen(): Unit =
+    if listening then return
+    listening = true
+    val listener = new NotificationListener {
+      def handleNotification(n: Notification, handback: Any): Unit =
+        if n.getType == GarbageCollectionNotificationInfo.GARBAGE_COLLECTION_NOTIFICATION then
+          val info = GarbageCollectionNotificationInfo.from(n.getUserData.asInstanceOf[CompositeData])
+          val used = info.getGcInfo.getMemoryUsageAfterGc.asScala.collect {
+            case (pool, usage) if isHeap(pool) => usage.getUsed
+          }.sum
+          peakAfterGC.accumulateAndGet(used, (a, b) => a max b)
+          if Options.gcThreshold > 0 && used > pressureFraction * Runtime.getRuntime.maxMemory then Collector.pressure = true
+    }
+    // Native images (scripts/native-image.sh) don't send notifications; the heap at the end of each run is reported instead
+    for case gc: NotificationEmitter <- ManagementFactory.getGarbageCollectorMXBeans.asScala do
+      gc.addNotificationListener(listener, null, null)
+
+  private lazy val heapPools =
+    ManagementFactory.getMemoryPoolMXBeans.asScala.filter(_.getType == java.lang.management.MemoryType.HEAP).map(_.getName).toSet
+
+  private def isHeap(pool: String): Boolean = heapPools.contains(pool)
+
+  private var runs = 0
+  private var allocated = 0L
+  private var gcTime = 0L
+  private var gcCount = 0L
+  private var heapAtEnd = 0L
+  private var spNodes = 0
+  private var sppNodes = 0
+
+  // Values at the start of the current run
+  private var allocated0 = 0L
+  private var gcTime0 = 0L
+  private var gcCount0 = 0L
+
+  private def gcTotals(): (Long, Long) =
+    val gcs = ManagementFactory.getGarbageCollectorMXBeans.asScala
+    (gcs.map(_.getCollectionTime).filter(_ >= 0).sum, gcs.map(_.getCollectionCount).filter(_ >= 0).sum)
+
+  /** The bytes allocated so far by the live threads, including the worker threads of `Parallel`. A thread that ends during a run, such as a fork-join worker that was idle for a minute, takes its allocations with it, so those can be missing from the count. */
+  private def allocatedBytes(): Long =
+    threads.getThreadAllocatedBytes(threads.getAllThreadIds).filter(_ >= 0).sum
+
+  /** Starts measuring a new input file. */
+  def reset(): Unit =
+    listen()
+    peakAfterGC.set(0)
+    runs = 0; allocated = 0; gcTime = 0; gcCount = 0
+    heapAtEnd = 0; spNodes = 0; sppNodes = 0
+
+  /** Called before every measured run of the file. */
+  def startRun(): Unit =
+    allocated0 = allocatedBytes()
+    val (t, c) = gcTotals()
+    gcTime0 = t; gcCount0 = c
+
+  /** Called after every measured run of the file, before the caches are cleared. */
+  def endRun(): Unit =
+    runs += 1
+    allocated += allocatedBytes() - allocated0
+    val (t, c) = gcTotals()
+    gcTime += t - gcTime0
+    gcCount += c - gcCount0
+    heapAtEnd = heapAtEnd max ManagementFactory.getMemoryMXBean.getHeapMemoryUsage.getUsed
+    spNodes = spNodes max SP.Test.cache.size
+    sppNodes = sppNodes max SPP.TestMut.cache.size
+
+  /** Appends the measurements for `path` to `Options.outputMemoryCSV`.
+    *
+    * @param path
+    *   The input file.
+    * @param time
+    *   The total running time of the measured runs, in seconds.
+    */
+  def write(path: String, time: Double): Unit =
+    val n = runs max 1
+    val peak = if gcCount > 0 then peakAfterGC.get else heapAtEnd
+    val rate = if time > 0 then allocated / time else 0.0
+    val fw = new FileWriter(Options.outputMemoryCSV, true) // true to append
+    try {
+      fw.write(f"katch,$path,$peak,${allocated / n},$rate%.0f,${gcTime / 1000.0 / n}%.3f,${gcCount.toDouble / n}%.1f,$spNodes,$sppNodes\n")
+    } finally {
+      fw.close()
+    }
+}
@@ -0,0 +1,157 @@
+package nkpl
+
+import scala.collection.mutable
+import scala.util.Random
+
+/** Counting and sampling the packets of an SP (or the input-output pairs of an SPP) over finite field domains.
+  *
+  * SPs and SPPs test fields in a fixed order (see `FieldOrder`), so every node has a level: the position of its field among the fields that have a domain. The number of packets in an SP is computed bottom-up, with one count per node: the number of assignments to the fields at the node's level and below. Fields that a node skips are unconstrained and multiply the count by the size of their domain. Counts are `BigInt`s and memoized per `Counter`, so counting takes time linear in the number of nodes, however many packets the SP contains. Sampling walks down from the root once, choosing branches in proportion to their counts, which makes it uniform.
+  */
+object Models {
+
+  /** Finite domains for packet fields, given as the values of every field. A packet assigns one of these values to every field. */
+  class Domains(domains: Map[Var, Iterable[Val]]) {
+    val fields: Array[Var] = domains.keys.toArray.sortBy(FieldOrder.rank)
+    val values: Array[Array[Val]] = fields.map(x => domains(x).toArray.distinct.sorted)
+    private val index = fields.zipWithIndex.toMap
+
+    /** The number of fields. */
+    def size: Int = fields.length
+
+    /** The position of `x` in `fields`. */
+    def level(x: Var): Int =
+      index.getOrElse(x, throw new Throwable(s"Field ${VarMap(x)} has no domain"))
+
+    def contains(level: Int, v: Val): Boolean = java.util.Arrays.binarySearch(values(level), v) >= 0
+
+    // gaps(i + 1)(j) is the product of the domain sizes of the fields strictly between levels i and j
+    private val gaps = Array.tabulate(size + 1, size + 1) { (i, j) =>
+      (i until j).foldLeft(BigInt(1))((acc, l) => acc * values(l).length)
+    }
+
+    /** The number of assignments to the fields strictly between levels `i` and `j`, where level -1 is above all fields and level `size` is below them. */
+    def gap(i: Int, j: Int): BigInt = gaps(i + 1)(j)
+  }
+
+  /** Counts packets in SPs and packet pairs in SPPs over `domains`, memoizing the counts of shared nodes. Values outside the domains are ignored. */
+  class Counter(val domains: Domains) {
+    private val spCounts = mutable.HashMap.empty[SP, BigInt]
+    private val sppCounts = mutable.HashMap.empty[SPP, BigInt]
+
+    def level(sp: SP): Int =
+      sp match {
+        case SP.Test(x, _, _) => domains.level(x)
+        case _ => domains.size
+      }
+
+    def level(spp: SPP): Int =
+      spp match {
+        case SPP.TestMut(x, _, _, _) => domains.level(x)
+        case _ => domains.size
+      }
+
+    /** The number of assignments to the fields at the level of `sp` and below that are in `sp`. */
+    def countFrom(sp: SP): BigInt =
+      sp match {
+        case SP.True => 1
+        case SP.False => 0
+        case t @ SP.Test(x, ys, default) =>
+          spCounts.getOrElseUpdate(
+            t, {
+              val i = domains.level(x)
+              var total = BigInt(0)
+              var hit = 0
+              for (v, a) <- ys if domains.contains(i, v) do
+                total += below(i, a)
+                hit += 1
+              total + BigInt(domains.values(i).length - hit) * below(i, default)
+            }
+          )
+      }
+
+    /** The number of packets in `sp` for the fields below level `i`. */
+    def below(i: Int, sp: SP): BigInt = domains.gap(i, level(sp)) * countFrom(sp)
+
+    /** The number of packets in `sp`. */
+    def count(sp: SP): BigInt = below(-1, sp)
+
+    /** The number of pairs of assignments to the fields at the level of `spp` and below that are related by `spp`. A field that an SPP skips is left unchanged, which gives one pair for every value in its domain. */
+    def countFrom(spp: SPP): BigInt =
+      spp match {
+        case SPP.Diag => 1
+        case SPP.False => 0
+        case t @ SPP.TestMut(x, branches, other, id) =>
+          sppCounts.getOrElseUpdate(
+            t, {
+              val i = domains.level(x)
+              def muts(m: collection.Map[Val, SPP]): BigInt =
+                m.foldLeft(BigInt(0)) { case (acc, (v, a)) => if domains.contains(i, v) then acc + below(i, a) else acc }
+              var total = BigInt(0)
+              var hit = 0
+              for (v, m) <- branches if domains.contains(i, v) do
+                total += muts(m)
+                hit += 1
+              // Values without a branch are mutated by `other`, and those that `other` doesn't mention also continue to `id`
+              val mentioned = hit + other.keys.count(v => domains.contains(i, v) && !branches.contains(v))
+              val n = domains.values(i).length
+              total + BigInt(n - hit) * muts(other) + BigInt(n - mentioned) * below(i, id)
+            }
+          )
+      }
+
+    /** The number of packet pairs in `spp` for the fields below level `i`. */
+    def below(i: Int, spp: SPP): BigInt = domains.gap(i, level(spp)) * countFrom(spp)
+
+    /** The number of pairs of input and output packets in `spp`. */
+    def count(spp: SPP): BigInt = below(-1, spp)
+
+    /** Draws a packet uniformly at random from `sp`, or returns `None` if `sp` has no packets in the domains. */
+    def sample(sp: SP, rng: Random): Option[Map[Var, Val]] =
+      if count(sp) == 0 then return None
+      var packet = Map.empty[Var, Val]
+      var i = -1
+      var node = sp
+      while true do
+        val j = level(node)
+        for l <- i + 1 until j do packet += domains.fields(l) -> domains.values(l)(rng.nextInt(domains.values(l).length))
+        node match {
+          case SP.Test(x, ys, default) =>
+            var r = randomBelow(countFrom(node), rng)
+            var chosen: Option[(Val, SP)] = None
+            for (v, a) <- ys if chosen.isEmpty && domains.contains(j, v) do
+              val w = below(j, a)
+              if r < w then chosen = Some((v, a)) else r -= w
+            val (v, next) = chosen.getOrElse((randomExcept(domains.values(j), ys.keySet, rng), default))
+            packet += x -> v
+            node = next
+            i = j
+          case _ => return Some(packet)
+        }
+      None
+  }
+
+  /** A uniformly random `BigInt` in `[0, n)`. */
+  private def randomBelow(n: BigInt, rng: Random): BigInt =
+    var r = BigInt(n.bitLength, rng)
+    while r >= n do r = BigInt(n.bitLength, rng)
+    r
+
+  /** A uniformly random element of `values` that is not in `except`, of which there must be at least one. Rejection sampling is fast if most values are allowed; otherwise enumerating them takes time linear in `except`. */
+  private def randomExcept(values: Array[Val], except: collection.Set[Val], rng: Random): Val =
+    if except.size * 2 <= values.length then
+      var v = values(rng.nextInt(values.length))
+      while except.contains(v) do v = values(rng.nextInt(values.length))
+      v
+    else
+      val allowed = values.filterNot(except.contains)
+      allowed(rng.nextInt(allowed.length))
+
+  /** The number of packets in `sp` over `domains`. */
+  def count(sp: SP, domains: Domains): BigInt = new Counter(domains).count(sp)
+
+  /** Draws `n` packets uniformly at random (with replacement) from `sp`; empty if `sp` has no packets in `domains`. */
+  def sample(sp: SP, domains: Domains, n: Int, rng: Random = new Random()): List[Map[Var, Val]] =
+    val counter = new Counter(domains)
+    if counter.count(sp) == 0 then List()
+    else List.fill(n)(counter.sample(sp, rng).get)
+}
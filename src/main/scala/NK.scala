@@ -128,49 +128,49 @@ object Test {
   private val cache = scala.collection.mutable.WeakHashMap.empty[Test, Test]
   def apply(x: Var, v: Val): NK =
     val w = new Test(x, v)
-    cache.getOrElseUpdate(w, w)
+    guarded(cache) { cache.getOrElseUpdate(w, w) }
 }
 
 object TestNE {
   private val cache = scala.collection.mutable.WeakHashMap.empty[TestNE, TestNE]
   def apply(x: Var, v: Val): NK =
     val w = new TestNE(x, v)
-    cache.getOrElseUpdate(w, w)
+    guarded(cache) { cache.getOrElseUpdate(w, w) }
 }
 
 object TestSP {
   private val cache = scala.collection.mutable.WeakHashMap.empty[TestSP, TestSP]
   def apply(e: SP): NK =
     val w = new TestSP(e)
-    cache.getOrElseUpdate(w, w)
+    guarded(cache) { cache.getOrElseUpdate(w, w) }
 }
 
 object Intersection {
   private val cache = scala.collection.mutable.WeakHashMap.empty[Intersection, Intersection]
   def apply(e1: NK, e2: NK): NK =
     val w = new Intersection(e1, e2)
-    cache.getOrElseUpdate(w, w)
+    guarded(cache) { cache.getOrElseUpdate(w, w) }
 }
 
 object XOR {
   private val cache = scala.collection.mutable.WeakHashMap.empty[XOR, XOR]
   def apply(e1: NK, e2: NK): NK =
     val w = new XOR(e1, e2)
-    cache.getOrElseUpdate(w, w)
+    guarded(cache) { cache.getOrElseUpdate(w, w) }
 }
 
 object Difference {
   private val cache = scala.collection.mutable.WeakHashMap.empty[Difference, Difference]
   def apply(e1: NK, e2: NK): NK =
     val w = new Difference(e1, e2)
-    cache.getOrElseUpdate(w, w)
+    guarded(cache) { cache.getOrElseUpdate(w, w) }
 }
 
 object Mut {
   private val cache = scala.collection.mutable.WeakHashMap.empty[Mut, Mut]
   def apply(x: Var, v: Val): NK =
     val w = new Mut(x, v)
-    cache.getOrElseUpdate(w, w)
+    guarded(cache) { cache.getOrElseUpdate(w, w) }
 }
 
 object Seq {
@@ -180,7 +180,7 @@ object Seq {
     if es2.length == 1 then return es2.head
     if es2.contains(Zero) then return Zero
     val w = new Seq(es2)
-    cache.getOrElseUpdate(w, w)
+    guarded(cache) { cache.getOrElseUpdate(w, w) }
 }
 
 object Sum {
@@ -189,7 +189,7 @@ object Sum {
     val es2 = es.flatMap { case Sum(es) => es; case e => Set(e) }
     if es2.size == 1 then return es2.head
     val w = new Sum(es2)
-    cache.getOrElseUpdate(w, w)
+    guarded(cache) { cache.getOrElseUpdate(w, w) }
 }
 
 object Star {
@@ -201,7 +201,7 @@ object Star {
       case Star(_) => e
       case _ =>
         val w = new Star(e)
-        cache.getOrElseUpdate(w, w)
+        guarded(cache) { cache.getOrElseUpdate(w, w) }
     }
 }
 
@@ -231,8 +231,22 @@ def clearCaches(): Unit =
   */
 def memoize[A, B](f: A => B): A => B =
   val cache = scala.collection.mutable.HashMap.empty[A, B]
-  clearCachesFns = (() => cache.clear()) :: clearCachesFns
-  (a: A) => cache.getOrElseUpdate(a, f(a))
+  // Memo tables are created when an operation is first used, which can be on a worker thread (see `Parallel`)
+  Parallel.synchronized {
+    clearCachesFns = (() => cache.clear()) :: clearCachesFns
+    Collector.register(cache)
+  }
+  (a: A) =>
+    if Trace.enabled then Trace.memoCalls.increment()
+    if Parallel.enabled then
+      cache.synchronized { cache.get(a) } match {
+        case Some(b) => b
+        case None =>
+          if Trace.enabled then Trace.memoMisses.increment()
+          val b = f(a)
+          cache.synchronized { cache.getOrElseUpdate(a, b) }
+      }
+    else cache.getOrElseUpdate(a, { if Trace.enabled then Trace.memoMisses.increment(); f(a) })
 
 /** Memoizes a function that takes two arguments by caching its results.
   *
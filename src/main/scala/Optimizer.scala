@@ -0,0 +1,189 @@
+package nkpl
+
+/** Algebraic rewrites of NetKAT expressions, applied before ε/δ evaluation (`--optimize`).
+  *
+  * Each rewrite can be enabled separately (see `Options.optimizations`), so that its effect on the number of δ states and SPP nodes can be measured with `scripts/ab-trace.py`:
+  *
+  *   - `factor`: factors common prefixes and suffixes out of sums of sequences, e.g. `a⋅b ∪ a⋅c` to `a⋅(b ∪ c)` and `@dst=1⋅@pt←0 ∪ @dst=2⋅@pt←0` to `(@dst=1 ∪ @dst=2)⋅@pt←0`.
+  *   - `merge`: merges consecutive tests and mutations of the same field in a sequence, e.g. `@x←1⋅@x=2` to `∅` and `@x←1⋅@x←2` to `@x←2`.
+  *   - `quantifiers`: pushes `exists`/`forall` inward, over unions and conjunctions of tests, and drops them over tests that don't mention the field.
+  *   - `star`: simplifies star bodies, e.g. `t⋆` to `ε` for tests `t`, `(t ∪ a)⋆` to `a⋆` and `(a⋆ ∪ b)⋆` to `(a ∪ b)⋆`.
+  */
+object Optimizer {
+
+  /** The names of all rewrites. */
+  val rewrites = List("factor", "merge", "quantifiers", "star")
+
+  def enabled(rewrite: String): Boolean = Options.optimizations.contains(rewrite)
+
+  /** Number of times each rewrite changed an expression, since the last `printStats`. */
+  val applied = scala.collection.mutable.Map[String, Int]().withDefaultValue(0)
+
+  /** Total sizes (number of distinct subterms) of the expressions given to `apply`, before and after optimization. */
+  private var sizeBefore = 0L
+  private var sizeAfter = 0L
+
+  /** Optimizes `e` with the enabled rewrites, or returns it unchanged if optimization is off. */
+  def apply(e: NK): NK =
+    if Options.optimizations.isEmpty then e
+    else
+      val e2 = optimize(e)
+      sizeBefore += size(e)
+      sizeAfter += size(e2)
+      e2
+
+  /** Returns the number of distinct subterms of `e`. */
+  def size(e: NK): Int =
+    val seen = scala.collection.mutable.HashSet.empty[NK]
+    def go(e: NK): Unit =
+      if seen.add(e) then
+        e match {
+          case Seq(es) => es.foreach(go)
+          case Sum(es) => es.foreach(go)
+          case Star(e) => go(e)
+          case Difference(e1, e2) => go(e1); go(e2)
+          case Intersection(e1, e2) => go(e1); go(e2)
+          case XOR(e1, e2) => go(e1); go(e2)
+          case _ => ()
+        }
+    go(e)
+    seen.size
+
+  def printStats(): Unit =
+    println(s"Optimizer: size $sizeBefore → $sizeAfter, rewrites ${rewrites.map(r => s"$r: ${applied(r)}").mkString(", ")}")
+    applied.clear()
+    sizeBefore = 0
+    sizeAfter = 0
+
+  private def count(rewrite: String, before: NK, after: NK): NK =
+    if !(after eq before) then applied(rewrite) += 1
+    after
+
+  /** Optimizes an expression bottom-up. */
+  lazy val optimize: NK => NK = memoize { e =>
+    e match {
+      case Seq(es) =>
+        val es2 = es.map(optimize)
+        if enabled("merge") then count("merge", Seq(es2), mergeSeq(es2)) else Seq(es2)
+      case Sum(es) =>
+        val es2 = es.map(optimize)
+        if enabled("factor") then count("factor", Sum(es2), factor(es2)) else Sum(es2)
+      case Star(e) =>
+        val e2 = optimize(e)
+        if enabled("star") then count("star", Star(e2), simplifyStar(e2)) else Star(e2)
+      case Difference(e1, e2) => Difference(optimize(e1), optimize(e2))
+      case Intersection(e1, e2) => Intersection(optimize(e1), optimize(e2))
+      case XOR(e1, e2) => XOR(optimize(e1), optimize(e2))
+      case _ => e
+    }
+  }
+
+  /** Merges two consecutive elements of a sequence into one, if they are tests or mutations of the same field. */
+  def merge(a: NK, b: NK): Option[NK] =
+    (a, b) match {
+      case (Test(x, v), Test(y, w)) if x == y => Some(if v == w then a else Zero)
+      case (Test(x, v), TestNE(y, w)) if x == y => Some(if v == w then Zero else a)
+      case (TestNE(x, v), Test(y, w)) if x == y => Some(if v == w then Zero else b)
+      case (TestNE(x, v), TestNE(y, w)) if x == y && v == w => Some(a)
+      case (Test(x, v), Mut(y, w)) if x == y && v == w => Some(a)
+      case (Mut(x, v), Mut(y, w)) if x == y => Some(b)
+      case (Mut(x, v), Test(y, w)) if x == y => Some(if v == w then a else Zero)
+      case (Mut(x, v), TestNE(y, w)) if x == y => Some(if v == w then Zero else a)
+      case _ => None
+    }
+
+  def mergeSeq(es: List[NK]): NK =
+    val merged = es.foldLeft(List[NK]()) { (acc, e) =>
+      acc match {
+        case prev :: rest =>
+          merge(prev, e) match {
+            case Some(m) => m :: rest
+            case None => e :: acc
+          }
+        case Nil => List(e)
+      }
+    }
+    Seq(merged.reverse)
+
+  private def elems(e: NK): List[NK] =
+    e match {
+      case Seq(es) => es
+      case _ => List(e)
+    }
+
+  /** Factors common prefixes, and then common suffixes, out of the elements of a sum. */
+  def factor(es: Set[NK]): NK =
+    if es.size < 2 then return Sum(es)
+    val byHead = es.groupBy(e => elems(e).headOption)
+    val prefixed: Set[NK] = byHead.flatMap {
+      case (Some(h), group) if group.size > 1 => Set(Seq(List(h, factor(group.map(e => Seq(elems(e).tail))))))
+      case (_, group) => group
+    }.toSet
+    if prefixed.size < 2 then return Sum(prefixed)
+    val byLast = prefixed.groupBy(e => elems(e).lastOption)
+    Sum(byLast.flatMap {
+      case (Some(l), group) if group.size > 1 => Set(Seq(List(factor(group.map(e => Seq(elems(e).init))), l)))
+      case (_, group) => group
+    }.toSet)
+
+  /** Determines whether `e` is a test, i.e., whether it never modifies the packet or its history. */
+  def isTest(e: NK): Boolean =
+    e match {
+      case Test(_, _) | TestNE(_, _) | TestSP(_) => true
+      case Seq(es) => es.forall(isTest)
+      case Sum(es) => es.forall(isTest)
+      case _ => false
+    }
+
+  /** Simplifies the body of a star, and returns the resulting star. */
+  def simplifyStar(e: NK): NK =
+    if isTest(e) then One
+    else
+      e match {
+        case Sum(es) if es.exists(e => isTest(e) || e.isInstanceOf[Star]) =>
+          simplifyStar(Sum(es.filterNot(isTest).map { case Star(a) => a; case a => a }))
+        case _ => Star(e)
+      }
+
+  /** Determines whether the test `e` is independent of field `x`. Variables and forward/backward queries are conservatively assumed to depend on every field. */
+  def independent(e: Parser.NK, x: Var): Boolean =
+    e match {
+      case Parser.Test(y, _) => y != x
+      case Parser.TestNE(y, _) => y != x
+      case Parser.Exists(y, b) => y == x || independent(b, x)
+      case Parser.Forall(y, b) => y == x || independent(b, x)
+      case Parser.Seq(es) => es.forall(independent(_, x))
+      case Parser.Sum(es) => es.forall(independent(_, x))
+      case _ => false
+    }
+
+  /** Pushes the quantifier at the root of `e` (if any) inward. Quantifiers end up directly around the parts of their body that depend on the field. */
+  def pushQuantifiers(e: Parser.NK): Parser.NK =
+    e match {
+      case Parser.Exists(x, body) => pushExists(x, pushQuantifiers(body))
+      case Parser.Forall(x, body) => pushForall(x, pushQuantifiers(body))
+      case _ => e
+    }
+
+  // ∃x. (a ∪ b) = ∃x. a ∪ ∃x. b, and ∃x. (a ⋅ b) = a ⋅ ∃x. b if a is independent of x
+  private def pushExists(x: Var, body: Parser.NK): Parser.NK =
+    body match {
+      case _ if independent(body, x) => body
+      case Parser.Sum(es) => Parser.Sum(es.map(pushExists(x, _)))
+      case Parser.Seq(es) if es.exists(independent(_, x)) =>
+        val (free, bound) = es.partition(independent(_, x))
+        Parser.Seq(free :+ pushExists(x, Parser.Seq(bound)))
+      case _ => Parser.Exists(x, body)
+    }
+
+  // ∀x. (a ⋅ b) = ∀x. a ⋅ ∀x. b, and ∀x. (a ∪ b) = a ∪ ∀x. b if a is independent of x
+  private def pushForall(x: Var, body: Parser.NK): Parser.NK =
+    body match {
+      case _ if independent(body, x) => body
+      case Parser.Seq(es) => Parser.Seq(es.map(pushForall(x, _)))
+      case Parser.Sum(es) if es.exists(independent(_, x)) =>
+        val (free, bound) = es.partition(independent(_, x))
+        Parser.Sum(free + pushForall(x, Parser.Sum(bound)))
+      case _ => Parser.Forall(x, body)
+    }
+}
@@ -16,6 +16,93 @@ object Options {
     */
   var convertToKat = false
 
+  /** Indicates whether exported KAT files should be gzip-compressed.
+    */
+  var katCompress = false
+
+  /** The bisimulation algorithm used for checks: `classic` (`Bisim.bisimPrim`) or `uf` (`Bisim.bisimUF`).
+    */
+  var bisimAlgorithm = "classic"
+
+  /** Indicates whether queries run over a materialized automaton that is shared between queries (see `Automaton`).
+    */
+  var materialize = false
+
+  /** The static heuristic that orders the fields of SPs and SPPs (see `FieldOrder`).
+    */
+  var fieldOrder = "first-seen"
+
+  /** The number of SP and SPP nodes above which fields are reordered while a file runs, or 0 to disable dynamic reordering (see `FieldOrder`).
+    */
+  var reorderThreshold = 0
+
+  /** The number of SP and SPP nodes above which dead nodes and memo entries are collected while a file runs, or 0 to disable collection (see `Collector`).
+    */
+  var gcThreshold = 0
+
+  /** Indicates whether queries run on the quotient of the values of unassigned fields by the classes of values that behave the same (see `Quotient`).
+    */
+  var quotient = false
+
+  /** Indicates whether checks are split into independent parts over disjoint slices of the header space (see `Slicing`).
+    */
+  var decompose = false
+
+  /** The number of threads on which a single query explores its frontier, or 1 to explore sequentially (see `Parallel`).
+    */
+  var threads = 1
+
+  /** The rewrites of `Optimizer` that are applied to expressions before they are checked. Empty if optimization is disabled.
+    */
+  var optimizations = Set[String]()
+
+  /** The number of transitions from the start state up to which `graphviz` statements draw the automaton (see `GV`).
+    */
+  var vizDepth = Int.MaxValue
+
+  /** The number of automaton states that `graphviz` statements draw; the states beyond are drawn as summary nodes (see `GV`).
+    */
+  var vizNodes = Int.MaxValue
+
+  /** The number of nodes of an SP or SPP that `graphviz` statements draw; the nodes beyond are collapsed into summary nodes (see `GV`).
+    */
+  var vizCollapse = Int.MaxValue
+
+  /** The number of background threads that render graphs with `dot`, or 0 to render them before the statement returns (see `GV`).
+    */
+  var vizJobs = 2
+
+  /** Indicates whether `run` answers checks whose operands are unchanged from the verdict cache (see `VerdictCache`).
+    */
+  var useCache = true
+
+  /** The path of the verdict cache database (see `VerdictCache`).
+    */
+  var cacheFile = "results/verdicts.db"
+
+  /** The number of most recently used verdicts that the verdict cache keeps (see `VerdictCache`).
+    */
+  var cacheSize = 100000
+
+  /** The options that select how checks are run, as a canonical string: the verdict cache only answers checks that ran with the same options (see `VerdictCache`).
+    */
+  def engine: String =
+    List(
+      s"bisim=$bisimAlgorithm",
+      s"materialize=$materialize",
+      s"order=$fieldOrder",
+      s"reorder=$reorderThreshold",
+      s"gc=$gcThreshold",
+      s"quotient=$quotient",
+      s"decompose=$decompose",
+      s"threads=$threads",
+      s"optimize=${optimizations.toList.sorted.mkString(",")}"
+    ).mkString(" ")
+
+  /** The path of the per-statement trace file (see `Trace`), or empty if tracing is disabled.
+    */
+  var traceFile = ""
+
   /** The path of the input file.
     */
   var inputFile = ""
@@ -34,6 +121,13 @@ object Options {
     */
   def outputCSV = if (warmup) "results/hotcomparison.csv" else "results/comparison.csv"
 
+  /** Returns the output CSV file path for memory measurements (see `Memory`). If warmup is enabled, the output file is named `hotmemory.csv`.
+    *
+    * @return
+    *   The memory CSV file path.
+    */
+  def outputMemoryCSV = if (warmup) "results/hotmemory.csv" else "results/memory.csv"
+
   /** The timeout value for Frenetic.
     */
   var freneticTimeout = "86400s" // 24h
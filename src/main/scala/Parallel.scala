@@ -0,0 +1,34 @@
+package nkpl
+
+import java.util.concurrent.{Callable, ExecutionException, ForkJoinPool}
+import scala.jdk.CollectionConverters.*
+
+/** Parallel exploration of a single query (`--threads <n>`).
+  *
+  * The exploration loops of `Bisim` normally take one state at a time off their worklist. With more than one thread, `Bisim.frontierSearch` instead takes the whole frontier (all states that are waiting, each with the union of its packets) and processes its states on a fork-join pool: the difference with the `done` table, the derivatives and the SPP applications of different states are independent. The successors are merged into the next frontier on the calling thread, in the order of the frontier, so that the exploration does the same work in the same order whatever the number of threads.
+  *
+  * While a batch runs, the unique tables, the `NK` hash-consing tables and the memo tables are accessed under a lock (see `guarded` and `memoize`). Memo misses are computed outside the lock, so two threads may compute the same entry; they get the same canonical node. Safe points of the `Collector` are only reached between batches, on the calling thread.
+  */
+object Parallel {
+
+  /** Whether queries explore their frontiers on several threads. */
+  inline def enabled: Boolean = Options.threads > 1
+
+  private var pool: ForkJoinPool = null
+
+  private def getPool: ForkJoinPool =
+    if pool == null || pool.getParallelism != Options.threads then pool = new ForkJoinPool(Options.threads)
+    pool
+
+  /** Applies `f` to the elements of `xs` on the pool and returns the results in the order of `xs`. The elements are split into a few chunks per thread, so that uneven work is balanced without scheduling every element separately. Runs sequentially if parallelism is disabled or `xs` is small. */
+  def map[A, B](xs: IndexedSeq[A])(f: A => B): IndexedSeq[B] =
+    if !enabled || xs.length <= 1 then return xs.map(f)
+    val chunk = (xs.length + 4 * Options.threads - 1) / (4 * Options.threads)
+    val tasks = xs.grouped(chunk).map(part => (() => part.map(f)): Callable[IndexedSeq[B]]).toList
+    try getPool.invokeAll(tasks.asJava).asScala.toIndexedSeq.flatMap(_.get)
+    catch { case e: ExecutionException => throw e.getCause }
+}
+
+/** Evaluates `f` while holding the lock of `table` if queries run on several threads, so that concurrent hash-consing in `table` stays canonical. */
+inline def guarded[T](table: AnyRef)(inline f: T): T =
+  if Parallel.enabled then table.synchronized { f } else f
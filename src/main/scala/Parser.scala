@@ -16,7 +16,7 @@ object VarMap {
     *   The integer representation of the string.
     */
   def apply(x: String): Int =
-    varMap.getOrElseUpdate(x, { n += 1; revMap(n) = x; n })
+    varMap.getOrElseUpdate(x, { n += 1; revMap(n) = x; FieldOrder.register(n); n })
 
   /** Retrieves the string representation of an integer.
     * @param i
@@ -0,0 +1,147 @@
+package nkpl
+
+import scala.collection.immutable.HashMap
+import scala.collection.mutable
+
+/** Atomic-predicate mode: queries on the quotient of the header space (`--quotient`).
+  *
+  * Forwarding policies test a field such as `@dst` against every value at every switch, although many values are often handled identically by all rules. Like the atomic predicates of APKeep, `classes` partitions the values of each field that the queried expressions test but never assign into classes of values that behave the same: values `v` and `w` are in the same class if every SPP of the automaton (the ε and δ of every state reachable by derivatives) takes the same branch for `@x=v` and `@x=w`, i.e. tests on `x` lead to the same sub-SPP for both. Values that behave like the values the policy never mentions form a class of their own, handled by the default branches.
+  *
+  * Each class is then represented by one of its values, and the query runs on the quotient: its packets are restricted to the representatives and the unmentioned values (see `guard`), and the tests on the other values, which no such packet can pass, are removed from the expressions (see `restrict`), so the SPs and SPPs only branch on one value per class. Since the field is never assigned, a packet keeps its class along every run, and every value of a class produces the same outputs as its representative, up to the value of the field itself. A check therefore holds iff it holds on the quotient, and the result of a forward or backward query is mapped back by giving every value the packets of its representative (see `expand`).
+  */
+object Quotient {
+
+  /** A partition of the values of field `x`: `reps` maps each representative to the other values of its class, and `merged` holds the mentioned values that behave like unmentioned ones. */
+  case class Classes(x: Var, reps: Map[Val, Set[Val]], merged: Set[Val]) {
+
+    /** The values that are not in the quotient. */
+    val hidden: Set[Val] = reps.values.flatten.toSet ++ merged
+
+    override def toString: String = s"${VarMap(x)}: ${reps.size} classes for ${reps.size + hidden.size} values"
+  }
+
+  /** The SPPs of the states that are reachable from `roots` by derivatives. */
+  private def automatonSPPs(roots: List[NK]): List[SPP] =
+    val seen = mutable.HashSet.empty[NK]
+    val todo = mutable.Queue.from(roots)
+    val spps = mutable.ListBuffer.empty[SPP]
+    while todo.nonEmpty do
+      val e = todo.dequeue()
+      if seen.add(e) then
+        spps += Bisim.ε(e)
+        for (e2, spp) <- Bisim.δ(e) do
+          spps += spp
+          todo.enqueue(e2)
+    spps.toList
+
+  /** The nodes of `spps` that test a field, each once. */
+  private def testNodes(spps: List[SPP]): List[SPP.TestMut] =
+    val seen = mutable.HashSet.empty[SPP]
+    val nodes = mutable.ListBuffer.empty[SPP.TestMut]
+    def go(spp: SPP): Unit =
+      if seen.add(spp) then
+        spp match {
+          case t @ SPP.TestMut(x, branches, other, id) =>
+            nodes += t
+            branches.values.foreach(_.values.foreach(go))
+            other.values.foreach(go)
+            go(id)
+          case _ => ()
+        }
+    spps.foreach(go)
+    nodes.toList
+
+  /** Determines whether node `t` assigns its field. */
+  private def assigns(t: SPP.TestMut): Boolean =
+    t.other.nonEmpty || t.branches.exists((v, muts) => muts.keys.exists(_ != v))
+
+  /** The branch that node `t` takes for packets with `@x=v`, if it doesn't assign `x`. `v = None` stands for the values that `t` doesn't mention. */
+  private def branch(t: SPP.TestMut, v: Option[Val]): SPP =
+    v.flatMap(t.branches.get) match {
+      case Some(muts) => muts.getOrElse(v.get, SPP.False)
+      case None => t.id
+    }
+
+  /** Partitions the values of `x` that `nodes` (the nodes that test `x`) mention, or returns `None` if one of them assigns `x`. */
+  private def partition(x: Var, nodes: List[SPP.TestMut]): Option[Classes] =
+    if nodes.exists(assigns) then return None
+    val values: List[Option[Val]] = None :: nodes.flatMap(_.branches.keys).distinct.map(Some(_))
+    var classOf = values.map(_ -> 0).toMap
+    for t <- nodes do
+      // Split every class by the branch that t takes
+      val ids = mutable.HashMap.empty[(Int, SPP), Int]
+      classOf = values.map(v => v -> ids.getOrElseUpdate((classOf(v), branch(t, v)), ids.size)).toMap
+    val groups = values.groupBy(classOf).values.toList
+    val merged = groups.find(_.contains(None)).get.flatten.toSet
+    val reps = groups.filterNot(_.contains(None)).map(g => g.flatten.min -> (g.flatten.toSet - g.flatten.min)).toMap
+    if merged.isEmpty && reps.values.forall(_.isEmpty) then None else Some(Classes(x, reps, merged))
+
+  /** The classes of the fields that `roots` test but never assign, for the fields where some values are equivalent. */
+  lazy val classes: List[NK] => List[Classes] = memoize { roots =>
+    val assigned = roots.flatMap(Slicing.assigned).toSet
+    testNodes(automatonSPPs(roots)).groupBy(_.x).toList.sortBy(_._1).flatMap { (x, nodes) =>
+      if assigned.contains(x) then None else partition(x, nodes)
+    }
+  }
+
+  /** The packets of the quotient: those whose fields have a representative or an unmentioned value. */
+  def guard(cs: List[Classes]): SP =
+    cs.foldLeft(SP.True: SP) { (sp, c) => SP.intersection(sp, SP.Test(c.x, HashMap.from(c.hidden.map(_ -> SP.False)), SP.True)) }
+
+  /** Removes the tests on values that are not in the quotient from `e`: packets of the quotient never pass them. */
+  def restrict(e: NK, cs: List[Classes]): NK =
+    val hidden = cs.map(c => c.x -> c.hidden).toMap.withDefaultValue(Set())
+    val sps = mutable.HashMap.empty[SP, SP]
+    def restrictSP(sp: SP): SP =
+      sps.getOrElseUpdate(
+        sp,
+        sp match {
+          case SP.Test(x, ys, default) => SP.Test(x, ys.filterNot((v, _) => hidden(x)(v)).map((v, sp) => v -> restrictSP(sp)), restrictSP(default))
+          case _ => sp
+        }
+      )
+    val cache = mutable.HashMap.empty[NK, NK]
+    def go(e: NK): NK =
+      cache.getOrElseUpdate(
+        e,
+        e match {
+          case Test(x, v) if hidden(x)(v) => Zero
+          case TestNE(x, v) if hidden(x)(v) => One
+          case TestSP(sp) => TestSP(restrictSP(sp))
+          case Seq(es) => Seq(es.map(go))
+          case Sum(es) => Sum(es.map(go))
+          case Star(e) => Star(go(e))
+          case Difference(e1, e2) => Difference(go(e1), go(e2))
+          case Intersection(e1, e2) => Intersection(go(e1), go(e2))
+          case XOR(e1, e2) => XOR(go(e1), go(e2))
+          case _ => e
+        }
+      )
+    go(e)
+
+  /** Maps an SP over the quotient back to all values: a packet is in the result iff the packet with the representative of its class is, and packets with merged values iff those with unmentioned values are.
+    *
+    * This works on the packet sets, not on the shape of `sp`, so it doesn't matter which paths of `sp` test the field: the part of `sp` for each representative (or for the unmentioned values) is cut out with `SP.exists`, and put back for every value of its class.
+    */
+  def expand(sp: SP, cs: List[Classes]): SP =
+    cs.foldLeft(sp) { (sp, c) =>
+      def only(vs: Iterable[Val]): SP = SP.Test(c.x, HashMap.from(vs.map(_ -> SP.True)), SP.False)
+      def except(vs: Iterable[Val]): SP = SP.Test(c.x, HashMap.from(vs.map(_ -> SP.False)), SP.True)
+      // The packets of sp with the given values of x, for every value of x
+      def part(values: SP): SP = SP.exists(c.x, SP.intersection(sp, values))
+      val classes = c.reps.toList.map((r, vs) => SP.intersection(only(vs + r), part(only(List(r)))))
+      val mentioned = c.reps.keySet ++ c.reps.values.flatten
+      val rest = SP.intersection(except(mentioned), part(except(mentioned ++ c.merged)))
+      SP.unionN(rest :: classes)
+    }
+
+  /** Runs the query `f` (such as `Bisim.forward`) on the quotient of `e`, and maps its result back. */
+  def query(e: NK)(f: NK => SP): SP =
+    val cs = classes(List(e))
+    if cs.isEmpty then f(e) else expand(f(Seq(List(TestSP(guard(cs)), restrict(e, cs)))), cs)
+
+  /** The check `e1 ≡ e2` on the quotient, as expressions to compare on the packets of the quotient. */
+  def check(e1: NK, e2: NK): (NK, SP, NK) =
+    val cs = classes(List(e1, e2))
+    if cs.isEmpty then (e1, SP.True, e2) else (restrict(e1, cs), guard(cs), restrict(e2, cs))
+}
@@ -26,8 +26,14 @@ object Runner {
       case Parser.Difference(e1, e2) => Difference(evalNK(env, e1), evalNK(env, e2))
       case Parser.XOR(e1, e2) => XOR(evalNK(env, e1), evalNK(env, e2))
       case Parser.Star(e) => Star(evalNK(env, e))
-      case Parser.Forward(e, negate) => val sp = Bisim.forward(evalNK(env, e)); TestSP(if negate then SP.negate(sp) else sp)
-      case Parser.Backward(e, negate) => val sp = Bisim.backward(evalNK(env, e)); TestSP(if negate then SP.negate(sp) else sp)
+      case Parser.Forward(e, negate) => val sp = Bisim.forward(Optimizer(evalNK(env, e))); TestSP(if negate then SP.negate(sp) else sp)
+      case Parser.Backward(e, negate) => val sp = Bisim.backward(Optimizer(evalNK(env, e))); TestSP(if negate then SP.negate(sp) else sp)
+      case Parser.Exists(_, _) | Parser.Forall(_, _) if Optimizer.enabled("quantifiers") =>
+        Optimizer.pushQuantifiers(v) match {
+          case Parser.Exists(x, e) => TestSP(SP.exists(x, toSP(evalNK(env, e))))
+          case Parser.Forall(x, e) => TestSP(SP.forall(x, toSP(evalNK(env, e))))
+          case pushed => evalNK(env, pushed)
+        }
       case Parser.Exists(x, e) => TestSP(SP.exists(x, toSP(evalNK(env, e))))
       case Parser.Forall(x, e) => TestSP(SP.forall(x, toSP(evalNK(env, e))))
       case Parser.VarName(x) =>
@@ -65,23 +71,47 @@ object Runner {
       case Parser.Expr.ValExpr(v) => Right(evalVal(env, v))
     }
 
-  /** Evaluate a statement in NKPL. */
+  /** Evaluate an expression that must denote a NetKAT expression. */
+  def evalExprNK(env: Env, e: Parser.Expr): NK =
+    e match {
+      case Parser.Expr.NKExpr(e) => evalNK(env, e)
+      case Parser.Expr.ValExpr(v) => throw new Throwable(s"Expected a netkat expression, but got a value: $v\n")
+    }
+
+  /** Evaluate a statement in NKPL, recording it in the trace if tracing is enabled. Loops and imports are not recorded themselves, as the statements they run are. */
   def runStmt(env: Env, stmt: Parser.Stmt, path: String, line: Int): Env =
-    def assertNK(e: Parser.Expr): NK =
-      e match {
-        case Parser.Expr.NKExpr(e) => evalNK(env, e)
-        case Parser.Expr.ValExpr(v) => throw new Throwable(s"Expected a netkat expression, but got a value: $v\n")
-      }
+    stmt match {
+      case Stmt.For(_, _, _, _) | Stmt.Import(_) => runStmtPrim(env, stmt, path, line)
+      case _ if Trace.enabled => Trace.record(path, line, stmtKind(stmt)) { runStmtPrim(env, stmt, path, line) }
+      case _ => runStmtPrim(env, stmt, path, line)
+    }
+
+  /** The kind of a statement, as reported in the trace. */
+  def stmtKind(stmt: Parser.Stmt): String =
+    stmt match {
+      case Stmt.Check(_, _, _) => "check"
+      case Stmt.Graphviz(_, _) => "graphviz"
+      case Stmt.Run(method, _) => method
+      case Stmt.Let(_, _) => "let"
+      case Stmt.Import(_) => "import"
+      case Stmt.Print(_) => "print"
+      case Stmt.For(_, _, _, _) => "for"
+    }
+
+  /** Evaluate a statement in NKPL. */
+  def runStmtPrim(env: Env, stmt: Parser.Stmt, path: String, line: Int): Env =
+    def assertNK(e: Parser.Expr): NK = Optimizer(evalExprNK(env, e))
     stmt match {
       case Stmt.Check(op, e1, e2) => {
         val v1 = assertNK(e1)
         val v2 = assertNK(e2)
-        val result = Bisim.bisim(v1, v2)
+        val (result, cached) = VerdictCache(v1, v2) { Bisim.bisim(v1, v2) }
+        val note = if cached then " (cached)" else ""
         assert(op == "≡" || op == "≢")
         if result == (op == "≡") then {
-          if (!Options.suppressOutput) println(s"\u001b[32mCheck passed in $path:${line + 1}\u001b[0m")
+          if (!Options.suppressOutput) println(s"\u001b[32mCheck passed in $path:${line + 1}$note\u001b[0m")
         } else {
-          throw new Throwable(s"\u001b[31m!!! Check failed in $path:${line + 1} !!!\u001b[0m" ++ s"\nOperands were ${summarize(v1.toString)} and ${summarize(v2.toString)}\n")
+          throw new Throwable(s"\u001b[31m!!! Check failed in $path:${line + 1}$note !!!\u001b[0m" ++ s"\nOperands were ${summarize(v1.toString)} and ${summarize(v2.toString)}\n")
         }
         env
       }
@@ -116,6 +146,8 @@ object Runner {
         var env2 = env
         for (i <- i0 to i1) {
           env2 = runStmt(env2 + (x -> Right(i)), stmt, path, line)
+          Collector.env = env2
+          Collector.safepoint()
         }
         env2
     }
@@ -126,71 +158,93 @@ object Runner {
    * @throws Throwable
    * in the event of parsing errors.
    */
-  def runFile(env: Env, path: String): Env =
-    var env2 = env
+  def runFile(env: Env, path: String, from: Int = 0, until: Int = Int.MaxValue): Env =
     try {
       val input = scala.io.Source.fromFile(path).mkString
-      val statements = input.split("\n").foldLeft(List[String]()) { (acc, line) =>
-        if (line.trim.isEmpty || line.trim.startsWith("--")) {
-          acc
-        } else if (line.startsWith(" ") || line.startsWith("\t")) {
-          acc.init :+ (acc.last + "\n" + line)
-        } else {
-          acc :+ line
-        }
-      }
-      // Iterate over each line
-      for (i <- statements.indices) {
-        val line = statements(i)
-        if line.startsWith("--") || line.trim.isEmpty then ()
-        else
-          // Parse the line
-          Parser.parseStmt(line) match {
-            case Left(stmt, n) =>
-              // Check if everything was parsed
-              if n == line.length then {
-                // Run the statement
-                // try {
-                env2 = runStmt(env2, stmt, path, i)
-                // } catch {
-                // case e: Throwable =>
-                // println(s"Error in $path:${i + 1}: ${e.getMessage}\n")
-                // }
-              } else {
-                // First split the input at the point where we stopped parsing
-                val (left, right) = line.splitAt(n)
-                throw new Throwable(s"Could not parse $path:${i + 1}: $left[!!!]$right\n")
-              }
-            case Right(msg) => throw new Throwable(s"Could not parse line $path:${i + 1}: ${msg}\n")
-          }
-      }
+      runSource(env, input, path, from, until)
     } catch {
       case e: java.io.FileNotFoundException =>
         throw new Throwable(s"File $path not found\n")
       // case e: Throwable =>
       // print(e)
     }
+
+  /** Split NKPL source text into statements. Blank lines and comments are dropped, and indented lines continue the previous statement. */
+  def splitStatements(input: String): List[String] =
+    input.split("\n").foldLeft(List[String]()) { (acc, line) =>
+      if (line.trim.isEmpty || line.trim.startsWith("--")) {
+        acc
+      } else if (line.startsWith(" ") || line.startsWith("\t")) {
+        acc.init :+ (acc.last + "\n" + line)
+      } else {
+        acc :+ line
+      }
+    }
+
+  /** Parse and evaluate NKPL source text. The `path` is used for error messages and to resolve relative imports. Only the statements with indices from `from` until `until` are run, so that a file can be run in parts (see the server's `load` op). */
+  def runSource(env: Env, input: String, path: String, from: Int = 0, until: Int = Int.MaxValue): Env =
+    var env2 = env
+    val statements = splitStatements(input)
+    // Iterate over each line
+    for (i <- statements.indices if i >= from && i < until) {
+      val line = statements(i)
+      if line.startsWith("--") || line.trim.isEmpty then ()
+      else
+        // Parse the line
+        Parser.parseStmt(line) match {
+          case Left(stmt, n) =>
+            // Check if everything was parsed
+            if n == line.length then {
+              // Run the statement
+              // try {
+              env2 = runStmt(env2, stmt, path, i)
+              env2 = FieldOrder.maybeReorder(env2)
+              Collector.env = env2
+              Collector.safepoint()
+              // } catch {
+              // case e: Throwable =>
+              // println(s"Error in $path:${i + 1}: ${e.getMessage}\n")
+              // }
+            } else {
+              // First split the input at the point where we stopped parsing
+              val (left, right) = line.splitAt(n)
+              throw new Throwable(s"Could not parse $path:${i + 1}: $left[!!!]$right\n")
+            }
+          case Right(msg) => throw new Throwable(s"Could not parse line $path:${i + 1}: ${msg}\n")
+        }
+    }
     env2
 
   import java.io.FileWriter
 
   /** Run and measure the running time for an NKPL file. */
   def runTopLevel(path: String) =
+    FieldOrder.prepare(path)
+    Collector.reset()
     clearCaches()
     println("Running " + path)
     if Options.convertToKat then Files.deleteIfExists(Paths.get(Options.katIndex()))
     if Options.warmup then for (i <- 0 to 10) { runFile(Map(), path); clearCaches() }
     val reps = if Options.warmup then 100 else 0
     var time = 0.0
+    Memory.reset()
     for (i <- 0 to reps) {
+      Trace.run = i
+      Collector.reset()
+      Memory.startRun()
       val startTime = System.nanoTime()
       runFile(Map(), path)
       val endTime = System.nanoTime()
       time += (endTime - startTime) / 1_000_000_000.0
+      Memory.endRun()
       SP.Test.printStats()
       SPP.TestMut.printStats()
+      if Options.optimizations.nonEmpty then Optimizer.printStats()
+      if Collector.collections > 0 then Collector.printStats()
       clearCaches()
     }
+    if Options.convertToKat then KatExport.finish()
+    Trace.flush()
     val duration = time / (if Options.warmup then (0 to reps).length else 1)
     val filename = path.split("/").last
     val msg = f"Execution time of $filename: ${duration}%.2f s \n"
@@ -215,6 +269,7 @@ object Runner {
       } finally {
         fw.close()
       }
+      Memory.write(path, time)
 
   /** Run and measure, for comparison purposes, a query using `frenetic`. The implementation assumes we have already computed a query in frenetic's format.
     */
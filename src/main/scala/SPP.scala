@@ -27,6 +27,8 @@ object SP {
   case class Test(x: Var, ys: HashMap[Val, SP], default: SP) extends SP {
     // Cache the hashcode
     override val hashCode = x.hashCode + ys.hashCode + default.hashCode
+    // The collection epoch in which the node was created (see `Collector`); not part of equality
+    val born = Collector.epoch
   }
 
   /** Smart constructors for the Test class.
@@ -42,6 +44,7 @@ object SP {
       println(s"Number with default=Test: ${cache.values.count(_.default.isInstanceOf[Test])}")
       println(s"Number with ys empty: ${cache.values.count(_.ys.isEmpty)}")
       println(s"Number with ys non-empty: ${cache.values.count(_.ys.nonEmpty)}")
+      println(s"Nodes per field: ${FieldOrder.describe(cache.values.groupBy(_.x).map((x, ts) => x -> ts.size))}")
 
     /** Creates a new Test instance with the given parameters. If the given ys map contains any entries with the value equal to default, those entries are filtered out. If the resulting ys2 map is empty, the default value is returned. Otherwise, a new Test instance is created with the filtered ys2 map and the default value, and it is either retrieved from the cache or added to the cache.
       */
@@ -50,7 +53,7 @@ object SP {
       if ys2.isEmpty then default
       else {
         val sp = new Test(x, ys2, default)
-        cache.getOrElseUpdate(sp, sp)
+        guarded(cache) { cache.getOrElseUpdate(sp, sp) }
       }
     }
 
@@ -60,7 +63,7 @@ object SP {
       if ys.isEmpty then default
       else {
         val sp = new Test(x, ys, default)
-        cache.getOrElseUpdate(sp, sp)
+        guarded(cache) { cache.getOrElseUpdate(sp, sp) }
       }
     }
   }
@@ -121,7 +124,7 @@ object SP {
             val keys = ysL.keySet ++ ysR.keySet
             val ys = keys.map { v => v -> union(ysL.getOrElse(v, defaultL), ysR.getOrElse(v, defaultR)) }.to(HashMap)
             Test(xL, ys, union(defaultL, defaultR))
-        else if xL < xR then Test(xL, ysL.map { (v, a) => v -> union(a, y) }, union(defaultL, y))
+        else if FieldOrder.lt(xL, xR) then Test(xL, ysL.map { (v, a) => v -> union(a, y) }, union(defaultL, y))
         else union(y, x)
       case _ => union(y, x)
     }
@@ -180,7 +183,7 @@ object SP {
           val keys = ysL.keySet ++ ysR.keySet
           val ys = keys.map { v => v -> difference(ysL.getOrElse(v, defaultL), ysR.getOrElse(v, defaultR)) }.to(HashMap)
           Test(xL, ys, difference(defaultL, defaultR))
-        else if xL < xR then Test(xL, ysL.map { (v, a) => v -> difference(a, y) }, difference(defaultL, y))
+        else if FieldOrder.lt(xL, xR) then Test(xL, ysL.map { (v, a) => v -> difference(a, y) }, difference(defaultL, y))
         else Test(xR, ysR.map { (v, a) => v -> difference(x, a) }, difference(x, defaultR))
     }
 
@@ -203,7 +206,7 @@ object SP {
           val keys = ysL.keySet ++ ysR.keySet
           val ys = keys.map { v => v -> intersection(ysL.getOrElse(v, defaultL), ysR.getOrElse(v, defaultR)) }.to(HashMap)
           Test(xL, ys, intersection(defaultL, defaultR))
-        else if xL < xR then Test(xL, ysL.map { (v, a) => v -> intersection(a, y) }, intersection(defaultL, y))
+        else if FieldOrder.lt(xL, xR) then Test(xL, ysL.map { (v, a) => v -> intersection(a, y) }, intersection(defaultL, y))
         else intersection(y, x)
       case _ => intersection(y, x)
     }
@@ -342,6 +345,8 @@ object SPP {
       // println(s"${branches.size} ${other.size}");
       x.hashCode + branches.hashCode + other.hashCode + id.hashCode
     }
+    // The collection epoch in which the node was created (see `Collector`); not part of equality
+    val born = Collector.epoch
   }
   object TestMut {
     val cache = scala.collection.mutable.HashMap.empty[TestMut, TestMut]
@@ -353,6 +358,8 @@ object SPP {
       println(s"Number with id=TestMut: ${cache.values.count(_.id.isInstanceOf[TestMut])}")
       println(s"Number with other empty: ${cache.values.count(_.other.isEmpty)}")
       println(s"Number with branches empty: ${cache.values.count(_.branches.isEmpty)}")
+      println(s"Nodes per field: ${FieldOrder.describe(cache.values.groupBy(_.x).map((x, ts) => x -> ts.size))}")
+      if FieldOrder.reorderings > 0 then println(s"Reorderings: ${FieldOrder.reorderings}")
       // now count the number of cases where all branches on key k map to a singleton map with key k
       val branchesSingleton = cache.values.count { v =>
         v.branches.forall { (k, m) => m.size == 1 && m.contains(k) } && v.branches.size > 0
@@ -411,13 +418,13 @@ object SPP {
       }
       if branches4.isEmpty && other2.isEmpty then return id
       val v = new TestMut(x, branches4, other2, id)
-      cache.getOrElseUpdate(v, v)
+      guarded(cache) { cache.getOrElseUpdate(v, v) }
 
     /** Creates a new TestMut instance with the given parameters. This skips some of the optimizations in the apply method; the user is responsible for ensuring that the invariant is maintained.
       */
     def mk(x: Var, branches: HashMap[Val, HashMap[Val, SPP]], other: HashMap[Val, SPP], id: SPP): SPP =
       val v = new TestMut(x, branches, other, id)
-      cache.getOrElseUpdate(v, v)
+      guarded(cache) { cache.getOrElseUpdate(v, v) }
   }
 
   /** Runs a packet through an SPP and returns the resulting packets.
@@ -570,7 +577,7 @@ object SPP {
           // Now we look at other/id
           val branchesC = SP.Test(x, ys.map { (v, _) => v -> SP.False } ++ branches.map { (v, _) => v -> SP.False } ++ other.map { (v, spp) => v -> run(default, spp) }, run(default, id))
           SP.union(branchesA, SP.union(branchesB, branchesC))
-        else if x < x2 then
+        else if FieldOrder.lt(x, x2) then
           // logSummarySP("run/<", sp, spp)
           // Here we need to nest the test for x2 inside the test for x:
           // SP.Test(x, ... SP.Test(x2, ...) ...)
@@ -736,7 +743,7 @@ object SPP {
           val other2 = other.map { (v2, spp) => v2 -> seqSP(default, spp) }
           val id2 = seqSP(default, id)
           TestMut(x, branches2, other2, id2)
-        else if x < x2 then seqSP(sp, new TestMut(x, HashMap.empty, HashMap.empty, spp))
+        else if FieldOrder.lt(x, x2) then seqSP(sp, new TestMut(x, HashMap.empty, HashMap.empty, spp))
         else seqSP(new SP.Test(x2, HashMap.empty, sp), spp)
     }
 
@@ -825,7 +832,7 @@ object SPP {
           val muts = unionMap(mutsL, mutsR)
           val id = union(idL, idR)
           TestMut(xL, branches, muts, id)
-        else if xL < xR then
+        else if FieldOrder.lt(xL, xR) then
           // logSummary("union<", x, y)
           union(x, new TestMut(xL, HashMap.empty, HashMap.empty, y))
           // var branches = branchesL.map { (v, muts) => v -> (muts + (v -> union(muts.getOrElse(v, False), y))) }
@@ -909,7 +916,7 @@ object SPP {
             .to(HashMap)
           val mutsB = mutsR.map { (v2, spp) => v2 -> seq(idL, spp) }
           SPP.TestMut(xL, branches, unionMap(mutsA, mutsB), seq(idL, idR))
-        else if xL < xR then
+        else if FieldOrder.lt(xL, xR) then
           seq(x, new TestMut(xL, HashMap.empty, HashMap.empty, y))
           // if mutsL.isEmpty && (idL eq False) then return SPP.TestMut(xL, branchesL.map { (v, muts) => v -> muts.map { (v2, spp) => v2 -> seq(spp, y) } }, mutsL, idL)
           // val mutsA = mutsL.map { (v2, spp) =>
@@ -967,7 +974,7 @@ object SPP {
           val muts = intersectionMap(mutsL, mutsR)
           val id = intersection(idL, idR)
           TestMut(xL, branches, muts, id)
-        else if xL < xR then
+        else if FieldOrder.lt(xL, xR) then
           intersection(x, new TestMut(xL, HashMap.empty, HashMap.empty, y))
           // val branches = branchesL.map { (v, muts) =>
           //   v -> (if muts.contains(v) then Map(v -> intersection(muts(v), y)) else HashMap.empty)
@@ -1018,7 +1025,7 @@ object SPP {
           val muts = differenceMap(mutsL, mutsR)
           val id = difference(idL, idR)
           TestMut(xL, branches, muts, id)
-        else if xL < xR then difference(x, new TestMut(xL, HashMap.empty, HashMap.empty, y))
+        else if FieldOrder.lt(xL, xR) then difference(x, new TestMut(xL, HashMap.empty, HashMap.empty, y))
         else difference(new TestMut(xR, HashMap.empty, HashMap.empty, x), y)
     }
 
@@ -0,0 +1,287 @@
+package nkpl
+
+import java.io.{BufferedReader, BufferedWriter, InputStream, InputStreamReader, OutputStream, OutputStreamWriter}
+import java.net.{InetAddress, ServerSocket, SocketException}
+import java.util.concurrent.{ConcurrentHashMap, Executors, ThreadFactory}
+import java.util.concurrent.atomic.AtomicLong
+
+/** A long-running KATch process that answers JSON requests, so that loaded networks and memo caches stay warm between queries.
+  *
+  * The protocol is newline-delimited JSON: every request is a JSON object on its own line, and every response is a single line. Requests on one connection are answered in order, so clients may pipeline as many requests as they like. Each request has an `op` field, an optional `id` that is echoed back, and an optional `session` that names the environment to evaluate in (by default each connection gets a private session).
+  *
+  *   - `{"op": "load", "path": "nkpl/fig10/Airtel_slicing.nkpl"}` runs a file and keeps its bindings. With `from` and `until`, only the statements with those indices are run.
+  *   - `{"op": "statements", "path": ...}` lists the kinds of the statements of a file, with the variable, bounds and body kind of `for` loops, and `{"op": "loop", "path": ..., "stmt": 4, "from": 0, "to": 9}` runs some iterations of the loop that is statement 4, stopping at the first failing one. It returns the time and outcome of every iteration, and leaves the session unchanged. `scripts/katch/distribute.py` uses these to spread the iterations of a loop over several servers.
+  *   - `{"op": "run", "stmt": "check net ≡ net"}` runs one or more NKPL statements.
+  *   - `{"op": "check", "lhs": "net", "rhs": "∅"}` returns whether the two expressions are equivalent.
+  *   - `{"op": "forward", "expr": "@sw=0 ⋅ net"}` and `{"op": "backward", "expr": ...}` return the resulting SP.
+  *   - `{"op": "member", "expr": "backward net", "fields": ["sw", "dst"], "columns": [[0, 1], [5, 5]]}` tests concrete packets against a test, and `{"op": "simulate", "expr": "net", ...}` runs them through a policy and returns the output packets and the packet at every hop (see `Simulate`). Instead of `columns`, the packets can be given as a binary `input` file, and the result written to binary files starting with `output`.
+  *   - `{"op": "count", "expr": "forward (@sw=0 ⋅ net)", "domains": {"sw": 16, "dst": [1, 2, 3]}}` counts the packets of a test, or the input-output pairs of a dup-free policy, over the given field domains (a number `n` stands for `0` to `n - 1`). `{"op": "sample", "expr": ..., "domains": ..., "n": 10, "seed": 0}` draws packets from a test uniformly at random (see `Models`).
+  *   - `{"op": "reset"}` drops the bindings of the session and `{"op": "clear"}` drops all memo caches.
+  *   - `{"op": "stats"}` reports cache sizes and latency totals, and `{"op": "shutdown"}` stops the server.
+  *
+  * Every response has `ok`, `time` (seconds spent evaluating) and `wait` (seconds spent queued behind other clients). Failed requests have an `error` message instead of a result.
+  */
+object Server {
+
+  /** Session environments, by name. */
+  val sessions = new ConcurrentHashMap[String, Runner.Env]()
+
+  /** The engine's caches are shared by all sessions, so evaluation is serialized on this lock. */
+  private val engine = new Object
+
+  private val requestCount = new AtomicLong(0)
+  private var busyTime = 0.0
+  private var waitTime = 0.0
+
+  @volatile private var running = true
+
+  /** The TCP port used when `katch serve` is not given one. */
+  val defaultPort = 7117
+
+  /** Path used to resolve relative imports in statements that do not come from a file. */
+  val sourcePath = "./serve"
+
+  /** Parses the expression `src` and evaluates it in `env` to a NetKAT expression. */
+  def parseNK(env: Runner.Env, src: String): NK =
+    Optimizer(Runner.evalExprNK(env, Parser.parseExpr(src)))
+
+  /** Reads the packets of a `member` or `simulate` request: the field names in `fields`, and either one list of values per field in `columns`, or the path of a file with the columns in the format of `Simulate.readColumns` in `input`. */
+  def packets(req: ujson.Value): Simulate.Packets =
+    val fields = req.obj.get("fields").map(_.arr.map(f => VarMap(f.str)).toArray).getOrElse(throw new Throwable("Missing field `fields`"))
+    val columns = (req.obj.get("columns"), req.obj.get("input")) match {
+      case (Some(cs), _) => cs.arr.map(_.arr.map(_.num.toInt).toArray).toArray
+      case (None, Some(ujson.Str(path))) => Simulate.readColumns(path, fields.length)
+      case _ => throw new Throwable("Missing field `columns` or `input`")
+    }
+    if columns.length != fields.length then throw new Throwable(s"Expected ${fields.length} columns, got ${columns.length}")
+    val size = columns.headOption.map(_.length).getOrElse(0)
+    if columns.exists(_.length != size) then throw new Throwable("Columns have different lengths")
+    new Simulate.Packets(fields, columns, size)
+
+  /** Reads the `domains` field of a `count` or `sample` request: an object from field names to either a number of values `n` (meaning `0` to `n - 1`) or a list of values. */
+  def domains(req: ujson.Value): Models.Domains =
+    val ds = req.obj.get("domains").map(_.obj).getOrElse(throw new Throwable("Missing field `domains`"))
+    new Models.Domains(ds.map { (x, d) =>
+      VarMap(x) -> (d match {
+        case ujson.Num(n) => 0 until n.toInt
+        case ujson.Arr(vs) => vs.map(_.num.toInt)
+        case _ => throw new Throwable(s"Expected a number or a list of values as the domain of $x")
+      })
+    }.toMap)
+
+  /** The statements of the file at `path`, indexed as in `Runner.runSource`. */
+  def statements(path: String): List[Parser.Stmt] =
+    Runner.splitStatements(scala.io.Source.fromFile(path).mkString).zipWithIndex.map { (line, i) =>
+      Parser.parseStmt(line) match {
+        case Left((stmt, n)) if n == line.length => stmt
+        case _ => throw new Throwable(s"Could not parse $path:${i + 1}")
+      }
+    }
+
+  private def message(e: Throwable): String = Option(e.getMessage).getOrElse(e.toString).trim
+
+  /** Runs a single request against the named session and returns the result fields of the response. */
+  def eval(op: String, req: ujson.Value, session: String): ujson.Obj =
+    val env = sessions.getOrDefault(session, Map())
+    def field(name: String): String =
+      req.obj.get(name) match {
+        case Some(ujson.Str(s)) => s
+        case _ => throw new Throwable(s"Missing string field `$name` for op `$op`")
+      }
+    def int(name: String): Option[Int] = req.obj.get(name).map(_.num.toInt)
+    op match {
+      case "load" =>
+        val path = field("path")
+        sessions.put(session, Runner.runFile(env, path, int("from").getOrElse(0), int("until").getOrElse(Int.MaxValue)))
+        ujson.Obj("bindings" -> sessions.get(session).size)
+      case "statements" =>
+        val stmts = statements(field("path")).map {
+          case Parser.Stmt.For(x, i0, i1, body) => ujson.Obj("kind" -> "for", "var" -> x, "from" -> i0, "to" -> i1, "body" -> Runner.stmtKind(body))
+          case stmt => ujson.Obj("kind" -> Runner.stmtKind(stmt))
+        }
+        ujson.Obj("statements" -> ujson.Arr.from(stmts))
+      case "loop" =>
+        val path = field("path")
+        val k = int("stmt").getOrElse(throw new Throwable("Missing field `stmt`"))
+        statements(path).lift(k) match {
+          case Some(Parser.Stmt.For(x, i0, i1, body)) =>
+            val iterations = scala.collection.mutable.ArrayBuffer.empty[ujson.Obj]
+            var i = int("from").getOrElse(i0)
+            var failed = false
+            while i <= int("to").getOrElse(i1) && !failed do
+              val result = ujson.Obj("i" -> i)
+              val start = System.nanoTime()
+              try {
+                Runner.runStmt(env + (x -> Right(i)), body, path, k)
+                result("ok") = true
+              } catch {
+                case e: Throwable =>
+                  result("ok") = false
+                  result("error") = message(e)
+                  failed = true
+              }
+              result("time") = (System.nanoTime() - start) / 1_000_000_000.0
+              iterations += result
+              i += 1
+            ujson.Obj("iterations" -> ujson.Arr.from(iterations))
+          case _ => throw new Throwable(s"Statement $k of $path is not a for loop")
+        }
+      case "run" =>
+        sessions.put(session, Runner.runSource(env, field("stmt"), sourcePath))
+        ujson.Obj()
+      case "check" =>
+        ujson.Obj("result" -> Bisim.bisim(parseNK(env, field("lhs")), parseNK(env, field("rhs"))))
+      case "forward" =>
+        ujson.Obj("result" -> SP.pretty(Bisim.forward(parseNK(env, field("expr")))))
+      case "backward" =>
+        ujson.Obj("result" -> SP.pretty(Bisim.backward(parseNK(env, field("expr")))))
+      case "member" =>
+        val sp = Runner.toSP(parseNK(env, field("expr")))
+        val result = Simulate.member(sp, packets(req)).map(if _ then 1 else 0)
+        req.obj.get("output") match {
+          case Some(ujson.Str(out)) =>
+            Simulate.writeColumns(s"$out.member.bin", Array(result))
+            ujson.Obj("rows" -> result.length)
+          case _ => ujson.Obj("result" -> ujson.Arr.from(result.map(_ == 1)))
+        }
+      case "simulate" =>
+        val maxHops = req.obj.get("max_hops").map(_.num.toInt).getOrElse(Int.MaxValue)
+        val sim = Simulate.simulate(parseNK(env, field("expr")), packets(req), maxHops)
+        val outputs = sim.outputs.columns ++ Array(sim.outputSource, sim.outputAt)
+        val trace = sim.trace.columns ++ Array(sim.source, sim.hop, sim.parent)
+        req.obj.get("output") match {
+          case Some(ujson.Str(out)) =>
+            Simulate.writeColumns(s"$out.outputs.bin", outputs)
+            Simulate.writeColumns(s"$out.trace.bin", trace)
+            ujson.Obj("outputs" -> sim.outputs.size, "trace" -> sim.trace.size)
+          case _ =>
+            val names = sim.trace.fields.map(VarMap(_))
+            def table(names: Array[String], columns: Array[Array[Int]]) =
+              ujson.Obj.from(names.zip(columns).map((n, c) => n -> ujson.Arr.from(c)))
+            ujson.Obj(
+              "outputs" -> table(names ++ Array("source", "at"), outputs),
+              "trace" -> table(names ++ Array("source", "hop", "parent"), trace)
+            )
+        }
+      case "count" =>
+        val counter = new Models.Counter(domains(req))
+        val result = parseNK(env, field("expr")) match {
+          case e @ (TestSP(_) | Test(_, _) | TestNE(_, _)) => counter.count(Runner.toSP(e))
+          case e if Bisim.δ(e).isEmpty => counter.count(Bisim.ε(e))
+          case _ => throw new Throwable("Can only count the packets of tests and dup-free policies")
+        }
+        // Counts can be too large for a JSON number
+        ujson.Obj("result" -> result.toString)
+      case "sample" =>
+        val sp = Runner.toSP(parseNK(env, field("expr")))
+        val n = req.obj.get("n").map(_.num.toInt).getOrElse(1)
+        val rng = req.obj.get("seed").map(s => new scala.util.Random(s.num.toLong)).getOrElse(new scala.util.Random())
+        val packets = Models.sample(sp, domains(req), n, rng)
+        ujson.Obj("result" -> ujson.Arr.from(packets.map(p => ujson.Obj.from(p.map((x, v) => VarMap(x) -> ujson.Num(v))))))
+      case "reset" =>
+        sessions.remove(session)
+        ujson.Obj()
+      case "clear" =>
+        clearCaches()
+        ujson.Obj()
+      case "stats" =>
+        ujson.Obj(
+          "requests" -> requestCount.get.toDouble,
+          "busy" -> busyTime,
+          "wait" -> waitTime,
+          "sessions" -> sessions.size,
+          "sp_nodes" -> SP.Test.cache.size,
+          "spp_nodes" -> SPP.TestMut.cache.size,
+          "automaton_states" -> Automaton.size
+        )
+      case "shutdown" =>
+        running = false
+        ujson.Obj()
+      case _ => throw new Throwable(s"Unknown op `$op`")
+    }
+
+  /** Answers one request line. Errors are reported in the response rather than thrown, so that one bad request does not end the connection. */
+  def handle(line: String, defaultSession: String): ujson.Value =
+    val received = System.nanoTime()
+    val response = ujson.Obj()
+    try {
+      val req = ujson.read(line)
+      req.obj.get("id").foreach(id => response("id") = id)
+      val op = req.obj.get("op").map(_.str).getOrElse(throw new Throwable("Missing field `op`"))
+      val session = req.obj.get("session").map(_.str).getOrElse(defaultSession)
+      engine.synchronized {
+        val start = System.nanoTime()
+        val result = eval(op, req, session)
+        val end = System.nanoTime()
+        val time = (end - start) / 1_000_000_000.0
+        val wait = (start - received) / 1_000_000_000.0
+        busyTime += time
+        waitTime += wait
+        for (k, v) <- result.value do response(k) = v
+        response("ok") = true
+        response("time") = time
+        response("wait") = wait
+      }
+    } catch {
+      case e: Throwable =>
+        response("ok") = false
+        response("error") = message(e)
+    }
+    requestCount.incrementAndGet()
+    response
+
+  /** Answers requests read from `in` until the stream ends or the server shuts down. */
+  def serveStream(in: InputStream, out: OutputStream, session: String): Unit =
+    val reader = new BufferedReader(new InputStreamReader(in, "UTF-8"))
+    val writer = new BufferedWriter(new OutputStreamWriter(out, "UTF-8"))
+    var line = reader.readLine()
+    while line != null && running do
+      if line.trim.nonEmpty then
+        writer.write(ujson.write(handle(line, session)))
+        writer.write("\n")
+        // Only flush once the client has no more pipelined requests waiting
+        if !reader.ready() then writer.flush()
+      line = if running then reader.readLine() else null
+    writer.flush()
+
+  /** Serves requests on stdin/stdout. Anything that the statements print is sent to stderr so that it doesn't corrupt the protocol. */
+  def serveStdio(): Unit =
+    val stdout = new java.io.FileOutputStream(java.io.FileDescriptor.out)
+    System.setOut(System.err)
+    Console.withOut(System.err) {
+      serveStream(System.in, stdout, "stdio")
+    }
+
+  /** Serves requests on localhost TCP `port`, with one thread per connection. */
+  def serveTCP(port: Int): Unit =
+    val server = new ServerSocket(port, 50, InetAddress.getLoopbackAddress)
+    val pool = Executors.newCachedThreadPool(new ThreadFactory {
+      def newThread(r: Runnable) =
+        val t = new Thread(r)
+        t.setDaemon(true)
+        t
+    })
+    println(s"Serving on ${server.getInetAddress.getHostAddress}:${server.getLocalPort}")
+    var connections = 0
+    try {
+      while running do
+        val socket = server.accept()
+        connections += 1
+        val session = s"connection$connections"
+        pool.submit(new Runnable {
+          def run() =
+            try serveStream(socket.getInputStream, socket.getOutputStream, session)
+            catch { case e: SocketException => () }
+            finally
+              sessions.remove(session)
+              socket.close()
+              // The shutdown request came in on this connection; wake up the accept loop
+              if !running then server.close()
+        })
+    } catch {
+      case e: SocketException if !running => ()
+    } finally {
+      server.close()
+      pool.shutdownNow()
+    }
+}
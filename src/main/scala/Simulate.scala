@@ -0,0 +1,237 @@
+package nkpl
+
+import java.io.{BufferedOutputStream, FileOutputStream}
+import java.nio.{ByteBuffer, ByteOrder}
+import java.nio.file.{Files, Paths}
+import scala.collection.immutable.ArraySeq
+import scala.collection.mutable
+
+/** Simulation of concrete packets in batches.
+  *
+  * `SP.elemOf` and `SPP.run1` evaluate one packet at a time, and represent it as a `Map[Var, Val]`. Here an SP or SPP is instead compiled once into flat decision tables (`Table`), and a batch of packets is given as one `Int` column per field (`Packets`). Evaluating a packet is then a walk over arrays that allocates nothing but its output. Policies with dups are simulated hop by hop over their automaton (`Bisim.ε` and `Bisim.δ`), which gives the packet at every dup of a `(main⋅top⋅δ)⋆`-style network.
+  *
+  * The server's `member` and `simulate` ops expose this to Python (`scripts/katch/simulate.py`), which passes the columns as NumPy arrays.
+  */
+object Simulate {
+
+  /** A batch of `size` packets, stored by column: `columns(j)(i)` is the value of field `fields(j)` in packet `i`. */
+  class Packets(val fields: Array[Var], val columns: Array[Array[Int]], val size: Int) {
+    def row(i: Int): Array[Int] = Array.tabulate(fields.length)(j => columns(j)(i))
+  }
+
+  /** A growable array of `Int`s, without boxing. */
+  private class IntBuf {
+    var data = new Array[Int](16)
+    var size = 0
+    def +=(x: Int): Unit =
+      if size == data.length then data = java.util.Arrays.copyOf(data, size * 2)
+      data(size) = x
+      size += 1
+    def apply(i: Int): Int = data(i)
+    def result: Array[Int] = java.util.Arrays.copyOf(data, size)
+  }
+
+  /** Collects packets row by row. */
+  private class PacketBuilder(fields: Array[Var]) {
+    val columns = Array.fill(fields.length)(new IntBuf)
+    def size: Int = if columns.isEmpty then rows else columns(0).size
+    private var rows = 0
+    def +=(p: Array[Int]): Unit =
+      for j <- p.indices do columns(j) += p(j)
+      rows += 1
+    def apply(i: Int, j: Int): Int = columns(j)(i)
+    def result: Packets = new Packets(fields, columns.map(_.result), size)
+  }
+
+  /** The leaves of a `Table`. */
+  val Accept = -1
+  val Reject = -2
+
+  /** SPs and SPPs compiled to decision tables over the columns `fields`. Nodes are shared between everything compiled into the same table, and referred to by index.
+    *
+    * Node `n` looks at column `column(n)`. If the packet's value there is `keys(n)(k)`, the packet continues with each value `branchVals(n)(k)(m)` in that column to node `branchNext(n)(k)(m)`. Otherwise it continues with each value `otherVals(n)(m)` to `otherNext(n)(m)` and, if its value is not one of `otherVals(n)`, also unchanged to `idNext(n)`. This mirrors `SPP.TestMut`; an `SP.Test` is compiled to a node whose branches set the value that was tested. All value arrays are sorted, so that lookups are binary searches.
+    */
+  class Table(val fields: Array[Var]) {
+    private val index = fields.zipWithIndex.toMap
+    private val spIds = mutable.HashMap.empty[SP, Int]
+    private val sppIds = mutable.HashMap.empty[SPP, Int]
+
+    private[Simulate] val column = new IntBuf
+    private[Simulate] val keys = mutable.ArrayBuffer.empty[Array[Int]]
+    private[Simulate] val branchVals = mutable.ArrayBuffer.empty[Array[Array[Int]]]
+    private[Simulate] val branchNext = mutable.ArrayBuffer.empty[Array[Array[Int]]]
+    private[Simulate] val otherVals = mutable.ArrayBuffer.empty[Array[Int]]
+    private[Simulate] val otherNext = mutable.ArrayBuffer.empty[Array[Int]]
+    private[Simulate] val idNext = new IntBuf
+
+    /** The number of nodes. */
+    def size: Int = column.size
+
+    private def col(x: Var): Int =
+      index.getOrElse(x, throw new Throwable(s"Field ${VarMap(x)} is used by the policy but is not one of the columns ${fields.map(VarMap(_)).mkString(", ")}"))
+
+    private def node(x: Var, ks: Array[Int], bv: Array[Array[Int]], bn: Array[Array[Int]], ov: Array[Int], on: Array[Int], id: Int): Int =
+      column += col(x)
+      keys += ks; branchVals += bv; branchNext += bn
+      otherVals += ov; otherNext += on
+      idNext += id
+      column.size - 1
+
+    /** Compiles `x` and returns its root. */
+    def sp(x: SP): Int =
+      x match {
+        case SP.True => Accept
+        case SP.False => Reject
+        case t @ SP.Test(x, ys, default) =>
+          spIds.getOrElseUpdate(
+            t, {
+              val ks = ys.keys.toArray.sorted
+              node(x, ks, ks.map(Array(_)), ks.map(k => Array(sp(ys(k)))), Array(), Array(), sp(default))
+            }
+          )
+      }
+
+    /** Compiles `x` and returns its root. */
+    def spp(x: SPP): Int =
+      x match {
+        case SPP.Diag => Accept
+        case SPP.False => Reject
+        case t @ SPP.TestMut(x, branches, other, id) =>
+          sppIds.getOrElseUpdate(
+            t, {
+              val ks = branches.keys.toArray.sorted
+              val bv = ks.map(k => branches(k).keys.toArray.sorted)
+              val bn = ks.indices.map(i => bv(i).map(v => spp(branches(ks(i))(v)))).toArray
+              val ov = other.keys.toArray.sorted
+              node(x, ks, bv, bn, ov, ov.map(v => spp(other(v))), spp(id))
+            }
+          )
+      }
+
+    /** Determines whether packet `p` is in the SP with root `root`. */
+    def member(root: Int, p: Array[Int]): Boolean =
+      var n = root
+      while n >= 0 do
+        val k = java.util.Arrays.binarySearch(keys(n), p(column(n)))
+        n = if k >= 0 then branchNext(n)(k)(0) else idNext(n)
+      n == Accept
+
+    /** Calls `emit` on every output packet of the SPP with root `root` for input packet `p`. The array passed to `emit` is reused, so it must be copied if it is kept. */
+    def run(root: Int, p: Array[Int], emit: Array[Int] => Unit): Unit =
+      if root == Accept then emit(p)
+      else if root >= 0 then
+        val c = column(root)
+        val v = p(c)
+        val k = java.util.Arrays.binarySearch(keys(root), v)
+        if k >= 0 then mutate(c, v, branchVals(root)(k), branchNext(root)(k), p, emit)
+        else
+          val ov = otherVals(root)
+          mutate(c, v, ov, otherNext(root), p, emit)
+          if java.util.Arrays.binarySearch(ov, v) < 0 then run(idNext(root), p, emit)
+
+    private def mutate(c: Int, v: Int, vals: Array[Int], next: Array[Int], p: Array[Int], emit: Array[Int] => Unit): Unit =
+      for m <- vals.indices do
+        p(c) = vals(m)
+        run(next(m), p, emit)
+      p(c) = v
+  }
+
+  /** Returns for every packet whether it is in `sp`. */
+  def member(sp: SP, packets: Packets): Array[Boolean] =
+    val table = new Table(packets.fields)
+    val root = table.sp(sp)
+    val p = new Array[Int](packets.fields.length)
+    Array.tabulate(packets.size) { i =>
+      for j <- p.indices do p(j) = packets.columns(j)(i)
+      table.member(root, p)
+    }
+
+  /** The result of simulating a policy on a batch of packets.
+    *
+    * The trace has a row for every packet at every hop: the input packets themselves are at hop 0, and a packet that has gone through `k` dups is at hop `k`. `parent(r)` is the trace row at the previous hop (or -1 for inputs) and `source(r)` the index of the input packet. Following `parent` back from a row gives the path of the packet through the network.
+    *
+    * The outputs are the packets that leave the policy, with the input packet they came from (`outputSource`) and the trace row of their last hop (`outputAt`). As in `SPP.run1`, the outputs of an input packet form a set; a packet that leaves along several paths is reported once.
+    */
+  class Simulation(
+      val trace: Packets,
+      val source: Array[Int],
+      val hop: Array[Int],
+      val parent: Array[Int],
+      val outputs: Packets,
+      val outputSource: Array[Int],
+      val outputAt: Array[Int]
+  )
+
+  /** Simulates the packets through `e`, which may contain dups, following at most `maxHops` dups per packet. Trace rows with the same input packet, automaton state and packet are only explored once, so that the simulation ends even if packets loop. */
+  def simulate(e: NK, packets: Packets, maxHops: Int = Int.MaxValue): Simulation =
+    val table = new Table(packets.fields)
+    // The states of the automaton of `e` that packets have reached, expanded on first use
+    val states = mutable.HashMap.empty[NK, Int]
+    val exprs = mutable.ArrayBuffer.empty[NK]
+    val εRoot = mutable.ArrayBuffer.empty[Int]
+    val targets = mutable.ArrayBuffer.empty[Array[Int]]
+    val labelRoots = mutable.ArrayBuffer.empty[Array[Int]]
+    def state(e: NK): Int =
+      states.getOrElseUpdate(e, { exprs += e; εRoot += Reject; targets += null; labelRoots += null; exprs.length - 1 })
+    def expand(s: Int): Unit =
+      if targets(s) == null then
+        val d = Bisim.δ(exprs(s)).toArray
+        εRoot(s) = table.spp(Bisim.ε(exprs(s)))
+        labelRoots(s) = d.map((_, spp) => table.spp(spp))
+        targets(s) = d.map((e2, _) => state(e2))
+
+    val trace = new PacketBuilder(packets.fields)
+    val source, hop, parent, at = new IntBuf
+    val seen = mutable.HashSet.empty[ArraySeq[Int]]
+    def visit(p: Array[Int], src: Int, s: Int, h: Int, par: Int): Unit =
+      if seen.add(ArraySeq.unsafeWrapArray(Array(src, s) ++ p)) then
+        trace += p; source += src; at += s; hop += h; parent += par
+
+    val outputs = new PacketBuilder(packets.fields)
+    val outputSource, outputAt = new IntBuf
+    val seenOutputs = mutable.HashSet.empty[ArraySeq[Int]]
+
+    val start = state(e)
+    for i <- 0 until packets.size do visit(packets.row(i), i, start, 0, -1)
+    // Rows are appended in order of their hop, so this is a breadth-first simulation
+    var r = 0
+    val p = new Array[Int](packets.fields.length)
+    while r < trace.size do
+      for j <- p.indices do p(j) = trace(r, j)
+      val s = at(r)
+      expand(s)
+      table.run(
+        εRoot(s),
+        p,
+        q =>
+          if seenOutputs.add(ArraySeq.unsafeWrapArray(source(r) +: q)) then
+            outputs += q; outputSource += source(r); outputAt += r
+      )
+      if hop(r) < maxHops then
+        val ts = targets(s)
+        val ls = labelRoots(s)
+        for k <- ts.indices do table.run(ls(k), p, q => visit(q, source(r), ts(k), hop(r) + 1, r))
+      r += 1
+    new Simulation(trace.result, source.result, hop.result, parent.result, outputs.result, outputSource.result, outputAt.result)
+
+  /** Reads `width` columns of little-endian 32-bit integers, stored one column after the other (the layout of a C-ordered NumPy array of shape `(width, n)`). */
+  def readColumns(path: String, width: Int): Array[Array[Int]] =
+    val bytes = Files.readAllBytes(Paths.get(path))
+    if width == 0 || bytes.length % (4 * width) != 0 then throw new Throwable(s"$path does not contain $width int32 columns")
+    val ints = ByteBuffer.wrap(bytes).order(ByteOrder.LITTLE_ENDIAN).asIntBuffer()
+    val n = ints.remaining / width
+    Array.fill(width) { val c = new Array[Int](n); ints.get(c); c }
+
+  /** Writes columns in the format read by `readColumns`. */
+  def writeColumns(path: String, columns: Array[Array[Int]]): Unit =
+    val out = new BufferedOutputStream(new FileOutputStream(path), 1 << 16)
+    try {
+      val buf = ByteBuffer.allocate(4 * columns.headOption.map(_.length).getOrElse(0)).order(ByteOrder.LITTLE_ENDIAN)
+      for c <- columns do
+        buf.clear()
+        buf.asIntBuffer().put(c)
+        out.write(buf.array, 0, 4 * c.length)
+    } finally {
+      out.close()
+    }
+}
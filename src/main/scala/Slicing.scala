@@ -0,0 +1,130 @@
+package nkpl
+
+import scala.collection.mutable
+
+/** Decomposition of checks into slices over disjoint header spaces (`--decompose`).
+  *
+  * A slicing check such as `((main1∪main2)⋅(top⋅δ))⋆ ≡ (main1⋅(top⋅δ))⋆∪(main2⋅(top⋅δ))⋆` relates policies in which each slice `main1`, `main2`, ... only handles the packets of one tenant, e.g. those with `@dst` in a given range. `split` finds such slices: the summands of a union of dup-free policies whose domains are disjoint when projected onto the invariant fields, i.e., the fields that no part of either expression assigns. The projected domain `d_i` of slice `s_i` is then a guard, and the check is split into one part per slice, `d_i⋅e1 ≡ d_i⋅e2`, plus one part for the packets outside every guard.
+  *
+  * Soundness. The guards and the remainder partition the packets, so `e1 ≡ e2` iff every part holds. A guard only constrains invariant fields, so a packet that satisfies `d_i` on input still satisfies it at every step of every run of `e1` and `e2`. Such a packet is outside the domain of every other slice `s_j` (because `d_j` contains the domain of `s_j` and is disjoint from `d_i`), so at every place where `s_j` occurs it drops the packet, and replacing it by `∅` in part `i` does not change the semantics of either side on the packets of `d_i`. In the remainder, every slice is replaced by `∅`.
+  *
+  * Each part therefore only contains its own slice, and the bisimulation of a part only sees the packets of its slice: its size grows with the size of a slice, not with the product of all slices. `Bisim.bisim` explores all parts from a single worklist (or frontier, with `--threads`), so that parts are checked concurrently and the check stops at the first counterexample in any part.
+  */
+object Slicing {
+
+  /** The distinct subterms of `e`, in pre-order. */
+  private def subterms(e: NK): List[NK] =
+    val seen = mutable.LinkedHashSet.empty[NK]
+    def go(e: NK): Unit =
+      if seen.add(e) then
+        e match {
+          case Seq(es) => es.foreach(go)
+          case Sum(es) => es.foreach(go)
+          case Star(e) => go(e)
+          case Difference(e1, e2) => go(e1); go(e2)
+          case Intersection(e1, e2) => go(e1); go(e2)
+          case XOR(e1, e2) => go(e1); go(e2)
+          case _ => ()
+        }
+    go(e)
+    seen.toList
+
+  /** The fields that are assigned somewhere in `e`. */
+  def assigned(e: NK): Set[Var] =
+    subterms(e).collect { case Mut(x, _) => x }.toSet
+
+  /** The packets that `s` doesn't drop, projected onto the fields other than `fields`. `s` must be dup-free. */
+  def domain(s: NK, fields: Set[Var]): SP =
+    fields.foldLeft(SPP.toSPbackward(Bisim.ε(s))) { (sp, x) => SP.exists(x, sp) }
+
+  /** The candidate unions of `e`: its dup-free sums, without looking inside dup-free terms. */
+  private def candidates(e: NK): List[Set[NK]] =
+    val dups = mutable.HashMap.empty[NK, Boolean]
+    def hasDup(e: NK): Boolean =
+      dups.getOrElseUpdate(
+        e,
+        e match {
+          case Dup => true
+          case Seq(es) => es.exists(hasDup)
+          case Sum(es) => es.exists(hasDup)
+          case Star(e) => hasDup(e)
+          case Difference(e1, e2) => hasDup(e1) || hasDup(e2)
+          case Intersection(e1, e2) => hasDup(e1) || hasDup(e2)
+          case XOR(e1, e2) => hasDup(e1) || hasDup(e2)
+          case _ => false
+        }
+      )
+    val seen = mutable.HashSet.empty[NK]
+    val found = mutable.ListBuffer.empty[Set[NK]]
+    def go(e: NK): Unit =
+      if seen.add(e) then
+        if !hasDup(e) then
+          e match {
+            case Sum(es) => found += es
+            case _ => ()
+          }
+        else
+          e match {
+            case Seq(es) => es.foreach(go)
+            case Sum(es) => es.foreach(go)
+            case Star(e) => go(e)
+            case Difference(e1, e2) => go(e1); go(e2)
+            case Intersection(e1, e2) => go(e1); go(e2)
+            case XOR(e1, e2) => go(e1); go(e2)
+            case _ => ()
+          }
+    go(e)
+    found.toList
+
+  /** The slices of a union and their guards, if at least two summands have pairwise disjoint projected domains. */
+  private def slices(es: Set[NK], fields: Set[Var]): Option[List[(NK, SP)]] =
+    var seen: SP = SP.False
+    val guards = mutable.ListBuffer.empty[(NK, SP)]
+    for s <- es do
+      val d = domain(s, fields)
+      if !(SP.intersection(seen, d) eq SP.False) then return None
+      seen = SP.union(seen, d)
+      guards += ((s, d))
+    if guards.count(!_._2.eq(SP.False)) < 2 then None else Some(guards.toList)
+
+  /** Replaces the subterms of `e` that are keys of `m`. */
+  def replace(e: NK, m: Map[NK, NK]): NK =
+    val cache = mutable.HashMap.empty[NK, NK]
+    def go(e: NK): NK =
+      m.get(e) match {
+        case Some(e2) => e2
+        case None =>
+          cache.getOrElseUpdate(
+            e,
+            e match {
+              case Seq(es) => Seq(es.map(go))
+              case Sum(es) => Sum(es.map(go))
+              case Star(e) => Star(go(e))
+              case Difference(e1, e2) => Difference(go(e1), go(e2))
+              case Intersection(e1, e2) => Intersection(go(e1), go(e2))
+              case XOR(e1, e2) => XOR(go(e1), go(e2))
+              case _ => e
+            }
+          )
+      }
+    go(e)
+
+  /** Restricts `e` to the packets `sp`. */
+  def guard(sp: SP, e: NK): NK =
+    if sp eq SP.True then e else Seq(List(TestSP(sp), e))
+
+  /** Splits the check `e1 ≡ e2` into parts `(a, sp, b)`, such that `e1 ≡ e2` iff `a ≡ b` on the packets `sp` for every part. The first candidate union of `e1` or `e2` (in pre-order) whose summands are slices gives one part per slice and a part for the remaining packets; without such a union, the only part is `(e1, SP.True, e2)`. */
+  def split(e1: NK, e2: NK): List[(NK, SP, NK)] =
+    val fields = assigned(e1) ++ assigned(e2)
+    (candidates(e1) ++ candidates(e2)).iterator.map(slices(_, fields)).collectFirst { case Some(ss) => ss } match {
+      case None => List((e1, SP.True, e2))
+      case Some(ss) =>
+        val parts = for (s, d) <- ss if !(d eq SP.False) yield
+          val m = ss.collect { case (s2, _) if s2 != s => s2 -> Zero }.toMap
+          (replace(e1, m), d, replace(e2, m))
+        val rest = SP.negate(SP.unionN(ss.map(_._2)))
+        val m = ss.map(_._1 -> Zero).toMap
+        if !Options.suppressOutput then println(s"Decomposed check into ${parts.length} slices")
+        if rest eq SP.False then parts else parts :+ (replace(e1, m), rest, replace(e2, m))
+    }
+}
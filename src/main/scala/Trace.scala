@@ -0,0 +1,129 @@
+package nkpl
+
+import java.io.{BufferedWriter, FileWriter}
+import java.lang.management.ManagementFactory
+import java.util.concurrent.atomic.LongAdder
+import scala.jdk.CollectionConverters.*
+
+/** Per-statement performance trace (`katch run --trace <file>`).
+  *
+  * When tracing is enabled, every statement that does work appends one JSON record to the trace file, e.g.
+  *
+  * {{{
+  * {"input":"nkpl/fig10/Airtel_slicing.nkpl","file":"nkpl/fig10/Airtel_slicing.nkpl","line":12,"run":0,"stmt":"check",
+  *  "ok":true,"wall":0.41,"eps":0.02,"delta":0.11,"spp":0.19,"iterations":38,"peak_queue":7,"states":31,
+  *  "sp_nodes":1204,"spp_nodes":5310,"memo_calls":80211,"memo_misses":20417,"gc_time":0.0,"gc_count":0}
+  * }}}
+  *
+  * Times are in seconds. `eps`, `delta` and `spp` are the time spent in ε, δ, and in the SP/SPP operations of the exploration loops of `Bisim`. `iterations`, `peak_queue` and `states` are summed (resp. maximized) over all bisim/forward/backward calls of the statement. `sp_nodes` and `spp_nodes` count the hash-consed nodes that the statement created. `scripts/trace-report.py` rolls the records up by benchmark family.
+  */
+object Trace {
+
+  /** Whether tracing is enabled. Set by `start`. */
+  var enabled = false
+
+  private var out: BufferedWriter = null
+
+  /** Index of the current run of the input file (the file is run many times in warmup mode). */
+  var run = 0
+
+  // Counters for the statement that is currently being traced. `Bisim` adds to these directly.
+  var εTime = 0L
+  var δTime = 0L
+  var sppTime = 0L
+  var iterations = 0L
+  var peakQueue = 0
+  var states = 0L
+
+  /** Calls of memoized functions, and how many of those missed the cache. Only counted while tracing, in adders whose cells are per thread, so that `--threads` neither loses counts nor contends on them. */
+  val memoCalls = new LongAdder
+  val memoMisses = new LongAdder
+
+  /** Starts tracing, appending records to `path`. The trace is also flushed on exit, so that the records of a failing file are not lost. */
+  def start(path: String): Unit =
+    out = new BufferedWriter(new FileWriter(path, true)) // true to append
+    enabled = true
+    Runtime.getRuntime.addShutdownHook(new Thread(() => flush()))
+
+  /** Flushes the trace file. Called at the end of every input file. */
+  def flush(): Unit =
+    if out != null then out.flush()
+
+  /** Adds `nanos` to the time of the given category. Used by `Bisim.benchmark`. With `--threads`, the times of all threads are added up, so they can exceed the time of the statement. */
+  def add(category: String, nanos: Long): Unit = synchronized {
+    category match {
+      case "ε" => εTime += nanos
+      case "δ" => δTime += nanos
+      case "spp" => sppTime += nanos
+      case _ => ()
+    }
+  }
+
+  /** Records the statistics of one exploration (bisim, forward or backward). */
+  def explored(iters: Int, queue: Int, explored: Int): Unit =
+    iterations += iters
+    peakQueue = peakQueue max queue
+    states += explored
+
+  private def gcStats(): (Long, Long) =
+    val gcs = ManagementFactory.getGarbageCollectorMXBeans.asScala
+    (gcs.map(_.getCollectionTime).filter(_ >= 0).sum, gcs.map(_.getCollectionCount).filter(_ >= 0).sum)
+
+  private def seconds(nanos: Long): Double = nanos / 1_000_000_000.0
+
+  /** Runs `f`, the statement of kind `stmt` at `path:line`, and appends its record to the trace. The record is written even if the statement throws.
+    *
+    * @param path
+    *   The file that contains the statement.
+    * @param line
+    *   The (0-based) statement index in the file, as used in messages.
+    * @param stmt
+    *   The kind of statement, e.g. `check` or `forward`.
+    * @param f
+    *   The statement to run.
+    * @return
+    *   The result of `f`.
+    */
+  def record[T](path: String, line: Int, stmt: String)(f: => T): T =
+    εTime = 0; δTime = 0; sppTime = 0
+    iterations = 0; peakQueue = 0; states = 0
+    val calls0 = memoCalls.sum()
+    val misses0 = memoMisses.sum()
+    val sp0 = SP.Test.cache.size
+    val spp0 = SPP.TestMut.cache.size
+    val (gcTime0, gcCount0) = gcStats()
+    val start = System.nanoTime()
+    var ok = false
+    try {
+      val y = f
+      ok = true
+      y
+    } finally {
+      val end = System.nanoTime()
+      val (gcTime1, gcCount1) = gcStats()
+      val record = ujson.Obj(
+        "input" -> Options.inputFile,
+        "file" -> path,
+        "line" -> (line + 1),
+        "run" -> run,
+        "stmt" -> stmt,
+        "ok" -> ok,
+        "wall" -> seconds(end - start),
+        "eps" -> seconds(εTime),
+        "delta" -> seconds(δTime),
+        "spp" -> seconds(sppTime),
+        "iterations" -> iterations.toDouble,
+        "peak_queue" -> peakQueue,
+        "states" -> states.toDouble,
+        // The unique tables only grow within a file, so the difference is the number of nodes created
+        "sp_nodes" -> (SP.Test.cache.size - sp0),
+        "spp_nodes" -> (SPP.TestMut.cache.size - spp0),
+        "memo_calls" -> (memoCalls.sum() - calls0).toDouble,
+        "memo_misses" -> (memoMisses.sum() - misses0).toDouble,
+        "gc_time" -> (gcTime1 - gcTime0) / 1000.0,
+        "gc_count" -> (gcCount1 - gcCount0).toDouble
+      )
+      out.write(ujson.write(record))
+      out.write("\n")
+    }
+}
@@ -0,0 +1,177 @@
+package nkpl
+
+import java.nio.charset.StandardCharsets.UTF_8
+import java.nio.file.{Files, Path, Paths}
+import java.security.MessageDigest
+import java.sql.{Connection, DriverManager, SQLException}
+import scala.collection.mutable
+
+/** Persistent cache of the verdicts of checks (`run`, bypassed with `--no-cache`).
+  *
+  * Checks whose operands evaluate to the same expressions as in an earlier run, with the same build of KATch, are answered from a SQLite database (`Options.cacheFile`) instead of running `Bisim.bisim`. The key of a check is a structural hash of both evaluated operands (see `digest`), which uses field names rather than their numbers and doesn't depend on the order of the summands of a sum, together with `engineVersion`, a hash of the running jar, and `Options.engine`, the options that select the algorithms, so that a check run with `--quotient` or `--bisim uf` never gets the verdict of the plain engine. The database stores the verdict and the time the check took, and keeps the `Options.cacheSize` most recently used entries. Only the check itself is cached: forward and backward queries in the operands are still evaluated.
+  *
+  * The cache is only used by `run`, and not while tracing, so that benchmarks (`compare`, `run+warmup`, `--trace`) always measure the checks. If the database can't be opened or used, a warning is printed and the cache is disabled for the rest of the run.
+  *
+  * The database is in WAL mode, and writes are batched: new verdicts are committed every `batchSize` checks and when the cache is closed, and hits only record their keys, whose last use is updated in the same transactions.
+  */
+object VerdictCache {
+  private var conn: Connection = null
+
+  /** The number of new verdicts after which the pending writes are committed. */
+  val batchSize = 100
+  private var pending = 0
+
+  /** The keys of the hits since the last commit. */
+  private val used = mutable.LinkedHashSet.empty[String]
+
+  /** The number of checks answered from the cache, and the number of checks that ran. */
+  var hits = 0
+  var misses = 0
+
+  def enabled: Boolean = conn != null
+
+  private def hex(bytes: Array[Byte]): String = bytes.map(b => f"$b%02x").mkString
+
+  private def sha(parts: String*): String =
+    val md = MessageDigest.getInstance("SHA-256")
+    for p <- parts do
+      md.update(p.getBytes(UTF_8))
+      md.update(0: Byte)
+    hex(md.digest())
+
+  /** A hash of the code of KATch: of the jar (or the class directory, or the native binary) that runs. */
+  lazy val engineVersion: String =
+    val md = MessageDigest.getInstance("SHA-256")
+    val source = classOf[NK].getProtectionDomain.getCodeSource
+    val path =
+      if source != null then Paths.get(source.getLocation.toURI)
+      else Paths.get(ProcessHandle.current.info.command.orElseThrow(() => new Throwable("Unknown KATch build")))
+    if Files.isRegularFile(path) then md.update(Files.readAllBytes(path))
+    else
+      Files.walk(path).sorted.forEach { (p: Path) =>
+        if Files.isRegularFile(p) then
+          md.update(path.relativize(p).toString.getBytes(UTF_8))
+          md.update(Files.readAllBytes(p))
+      }
+    hex(md.digest())
+
+  /** A structural hash of an expression. */
+  lazy val digest: NK => String = memoize { e =>
+    e match {
+      case Dup => sha("dup")
+      case Test(x, v) => sha("test", VarMap(x), v.toString)
+      case TestNE(x, v) => sha("testne", VarMap(x), v.toString)
+      case Mut(x, v) => sha("mut", VarMap(x), v.toString)
+      case TestSP(sp) => sha("sp", digestSP(sp))
+      case Seq(es) => sha("seq" :: es.map(digest): _*)
+      case Sum(es) => sha("sum" :: es.toList.map(digest).sorted: _*)
+      case Star(e) => sha("star", digest(e))
+      case Difference(e1, e2) => sha("difference", digest(e1), digest(e2))
+      case Intersection(e1, e2) => sha("intersection", digest(e1), digest(e2))
+      case XOR(e1, e2) => sha("xor", digest(e1), digest(e2))
+      case _ => throw new Throwable(s"Cannot hash $e")
+    }
+  }
+
+  /** A structural hash of an SP. */
+  lazy val digestSP: SP => String = memoize { sp =>
+    sp match {
+      case SP.True => sha("true")
+      case SP.False => sha("false")
+      case SP.Test(x, ys, default) =>
+        sha("test" :: VarMap(x) :: ys.toList.sortBy(_._1).flatMap((v, sp) => List(v.toString, digestSP(sp))) ++ List(digestSP(default)): _*)
+    }
+  }
+
+  /** Opens the database at `path`, creating it if needed. */
+  def open(path: String = Options.cacheFile): Unit =
+    try
+      val parent = Paths.get(path).toAbsolutePath.getParent
+      if parent != null then Files.createDirectories(parent)
+      conn = DriverManager.getConnection(s"jdbc:sqlite:$path")
+      val st = conn.createStatement()
+      st.execute("PRAGMA busy_timeout = 10000")
+      st.execute("PRAGMA journal_mode = WAL")
+      st.execute("PRAGMA synchronous = NORMAL")
+      st.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, equivalent INTEGER NOT NULL, seconds REAL NOT NULL, used INTEGER NOT NULL)")
+      st.execute("CREATE INDEX IF NOT EXISTS verdicts_used ON verdicts (used)")
+      st.close()
+      conn.setAutoCommit(false)
+      engineVersion
+    catch { case e: Exception => disable(e) }
+
+  /** Records the last use of the hits since the last commit, and commits the pending writes. */
+  private def commit(): Unit =
+    if used.nonEmpty then
+      val up = conn.prepareStatement("UPDATE verdicts SET used = ? WHERE key = ?")
+      val now = System.currentTimeMillis
+      for key <- used do
+        up.setLong(1, now)
+        up.setString(2, key)
+        up.addBatch()
+      up.executeBatch()
+      up.close()
+      used.clear()
+    conn.commit()
+    pending = 0
+
+  /** Commits the pending writes, evicts the least recently used entries beyond `Options.cacheSize`, and closes the database. */
+  def close(): Unit =
+    if !enabled then return
+    try
+      commit()
+      val st = conn.prepareStatement("DELETE FROM verdicts WHERE key IN (SELECT key FROM verdicts ORDER BY used DESC LIMIT -1 OFFSET ?)")
+      st.setInt(1, Options.cacheSize)
+      st.executeUpdate()
+      st.close()
+      conn.commit()
+      conn.close()
+    catch { case e: SQLException => disable(e) }
+    conn = null
+    if !Options.suppressOutput && hits > 0 then println(s"Verdict cache: $hits of ${hits + misses} checks cached")
+
+  private def disable(e: Exception): Unit =
+    println(s"Verdict cache disabled: ${e.getMessage}")
+    try if conn != null then conn.close()
+    catch { case _: SQLException => () }
+    conn = null
+
+  private def lookup(key: String): Option[Boolean] =
+    val st = conn.prepareStatement("SELECT equivalent FROM verdicts WHERE key = ?")
+    st.setString(1, key)
+    val rs = st.executeQuery()
+    val result = if rs.next() then Some(rs.getInt(1) != 0) else None
+    st.close()
+    if result.isDefined then used += key
+    result
+
+  private def store(key: String, equivalent: Boolean, seconds: Double): Unit =
+    val st = conn.prepareStatement("INSERT OR REPLACE INTO verdicts (key, equivalent, seconds, used) VALUES (?, ?, ?, ?)")
+    st.setString(1, key)
+    st.setInt(2, if equivalent then 1 else 0)
+    st.setDouble(3, seconds)
+    st.setLong(4, System.currentTimeMillis)
+    st.executeUpdate()
+    st.close()
+    pending += 1
+    if pending >= batchSize then commit()
+
+  /** Whether `e1` and `e2` are equivalent: from the cache if it holds the check, and otherwise from `check`, whose verdict is then stored. Also returns whether the verdict came from the cache. */
+  def apply(e1: NK, e2: NK)(check: => Boolean): (Boolean, Boolean) =
+    if !enabled then return (check, false)
+    val key = sha(engineVersion, Options.engine, digest(e1), digest(e2))
+    try
+      lookup(key) match {
+        case Some(result) =>
+          hits += 1
+          return (result, true)
+        case None => ()
+      }
+    catch { case e: SQLException => disable(e); return (check, false) }
+    misses += 1
+    val start = System.nanoTime()
+    val result = check
+    try store(key, result, (System.nanoTime() - start) / 1e9)
+    catch { case e: SQLException => disable(e) }
+    (result, false)
+}
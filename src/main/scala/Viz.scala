@@ -1,6 +1,12 @@
 package nkpl
 
-/** Graphviz object, used for generating visualizations of SPPs and Automata. */
+import java.util.concurrent.{ConcurrentLinkedQueue, ExecutorService, Executors, Future}
+import scala.collection.mutable
+
+/** Graphviz object, used for generating visualizations of SPPs and Automata.
+  *
+  * Graphs are streamed to their `.gv` file as they are generated (see `graph`), and only the nodes of the graph being written are named. Large graphs are cut down: the automaton is explored breadth-first up to `Options.vizDepth` transitions and `Options.vizNodes` states, and an SP or SPP shows its first `Options.vizCollapse` nodes; the nodes beyond are drawn as summary nodes, and a notice says which graphs were cut. There is no bound by default. Rendering with `dot` runs on a pool of `Options.vizJobs` background threads, so a `graphviz` statement only waits for its `.gv` files; `awaitRenders` waits for the rest.
+  */
 object GV {
 
   def genColor2(y: String) = {
@@ -15,26 +21,47 @@ object GV {
     else f"#${r}%02x${g}%02x${b}%02x"
   }
 
-  var syms = scala.collection.mutable.Map[Any, String]()
+  // Names of the nodes of the current graph; the counter keeps names unique across graphs
+  private val syms = mutable.HashMap[Any, String]()
+  private var symCounter = 0
   def gensym(obj: Any) =
-    syms.getOrElseUpdate(obj, s"n${syms.size}")
+    syms.getOrElseUpdate(obj, { symCounter += 1; s"n$symCounter" })
 
   def reset() =
-    val n = syms.size
     syms.clear()
-    for i <- 0 until n do syms(i) = s"dummy$i"
 
   val sb = new StringBuilder
+  private var out: java.io.Writer = null
+  private var outFile = ""
+
   def line(text: String) =
-    sb.append("    " + text + "\n")
+    if out != null then out.write("    " + text + "\n") else sb.append("    " + text + "\n")
+
+  /** Streams the graph that `body` draws to `file.gv`: lines are written as they are generated instead of being kept in memory. The file is closed and the node names are forgotten even if `body` throws; otherwise the graph is then rendered. */
+  def graph(file: String)(body: => Unit) =
+    out = new java.io.BufferedWriter(new java.io.OutputStreamWriter(new java.io.FileOutputStream(s"$file.gv"), "UTF-8"))
+    outFile = file
+    try
+      out.write("\ndigraph G {\n")
+      body
+      out.write("}")
+    finally
+      out.close()
+      out = null
+      reset()
+    render(file)
+
+  /** Tells the user that the graph being written leaves out `what`, and which option bounds it. */
+  private def truncated(what: String, option: String) =
+    if !Options.suppressOutput then println(s"graphviz: $outFile.gv leaves out $what (bounded by $option)")
 
   /** Add a normal test or mutation branch edge for an SPP. */
   def edge(a: Any, b: Any, label: String = "") =
-    line(s"""${gensym(a)} -> ${gensym(b)} [label=" $label ", labelangle=-30, fontsize=12, arrowsize=0.5]""")
+    line(s"""${gensym(a)} -> ${gensym(b)} [label=" $label ", labelangle=-30, fontsize=12, arrowsize=0.5]""")
 
   /** Add an automaton transition. */
   def edgeNK(a: Any, b: Any, label: String = "") =
-    line(s"""${gensym(a)} -> ${gensym(b)} [label=" $label ", labelangle=-30, fontsize=12, arrowsize=0.5]""")
+    line(s"""${gensym(a)} -> ${gensym(b)} [label=" $label ", labelangle=-30, fontsize=12, arrowsize=0.5]""")
 
   /** Add a ``default case'' edge for an SPP. */
   def defaultEdge(a: Any, b: Any, label: String = "") =
@@ -61,31 +88,65 @@ object GV {
   def mutNode(a: Any, label: String) =
     line(s"""${gensym(a)} [label="", shape=diamond, width=0.15, height=0.15, style=filled, fillcolor="${genColor2(label)}"]""")
 
+  /** Build a node that stands for a part of the graph that is not drawn. */
+  def summaryNode(a: Any, label: String) =
+    line(s"""${gensym(a)} [label="$label", shape=box, style="dashed,rounded", fontsize=10, fontcolor=gray40, color=gray60]""")
+
   def sameRank(xs: List[Any]) =
     line(s"""{rank=same; ${xs.map(gensym).mkString("; ")}}""")
 
+  /** Draws the nodes reachable from `root` breadth-first, each once: the first `budget` with `draw`, and the others as summary nodes that give the number of nodes below them. A node that isn't drawn is counted below the first summary node that reaches it, so that counting visits each node once. */
+  private def drawBudgeted[A](root: A, budget: Int)(children: A => Iterable[A])(draw: A => Unit): Unit =
+    val seen = mutable.HashSet(root)
+    val queue = mutable.Queue(root)
+    val summaries = mutable.ArrayBuffer[A]()
+    var drawn = 0
+    while queue.nonEmpty do
+      val a = queue.dequeue()
+      if drawn < budget then
+        drawn += 1
+        draw(a)
+        for b <- children(a) if seen.add(b) do queue.enqueue(b)
+      else summaries += a
+    var total = drawn
+    for a <- summaries do
+      var n = 1
+      val stack = mutable.Stack(a)
+      while stack.nonEmpty do
+        for b <- children(stack.pop()) if seen.add(b) do
+          n += 1
+          stack.push(b)
+      summaryNode(a, s"⋯ $n nodes")
+      total += n
+    if summaries.nonEmpty then truncated(s"${total - drawn} of $total nodes", "--viz-collapse")
+
+  private def spChildren(sp: SP): Iterable[SP] =
+    sp match
+      case SP.Test(_, ys, default) => ys.values ++ List(default)
+      case _ => List()
+
+  private def sppChildren(spp: SPP): Iterable[SPP] =
+    spp match
+      case SPP.TestMut(_, branches, muts, default) => branches.values.flatMap(_.values) ++ muts.values ++ List(default)
+      case _ => List()
+
   /** Build a visualization (pdf) of an SP. */
   def vizSP(sp: SP) =
-    lazy val gv: SP => Unit = memoize { sp =>
+    drawBudgeted(sp, Options.vizCollapse)(spChildren) { sp =>
       sp match
         case SP.True => testNode(sp, "⊤")
         case SP.False => testNode(sp, "⊥")
         case SP.Test(x, ys, default) =>
           val z = VarMap(x)
           testNode(sp, s"$z")
-          ys.foreach { case (v, a) =>
-            edge(sp, a, s"$v")
-            gv(a)
-          }
+          ys.foreach { case (v, a) => edge(sp, a, s"$v") }
           defaultEdge(sp, default, s"≠")
-          gv(default)
     }
-    gv(sp)
 
   /** Build a visualization (pdf) of an SPP. */
   def vizSPP(spp: SPP) =
     var levels = Map[Any, Set[Any]]()
-    lazy val gv: SPP => Unit = memoize { spp =>
+    drawBudgeted(spp, Options.vizCollapse)(sppChildren) { spp =>
       spp match
         case SPP.Diag => testNode(spp, "⊤")
         case SPP.False => testNode(spp, "⊥")
@@ -99,50 +160,49 @@ object GV {
             muts.foreach { case (v2, spp2) =>
               levels = levels.updated(z + "mut", levels.getOrElse(z + "mut", Set()) ++ Set((spp, v)))
               edge((spp, v), spp2, s"$v2")
-              gv(spp2)
             }
           }
           mutNode((spp, "default"), s"$z")
           defaultEdge(spp, (spp, "default"), s"≠")
-          muts.foreach { case (v2, spp2) =>
-            edge((spp, "default"), spp2, s"$v2")
-            gv(spp2)
-          }
+          muts.foreach { case (v2, spp2) => edge((spp, "default"), spp2, s"$v2") }
           defaultEdge((spp, "default"), default, s"≠")
           // Make all muts the same rank
           levels = levels.updated(z + "mut", levels.getOrElse(z + "mut", Set()) ++ Set((spp, "default")))
-          gv(default)
     }
-    gv(spp)
     for (k, xs) <- levels do sameRank(xs.toList)
 
-  /** Builds a graph visualization of the automaton for a NetKAT expression. */
+  /** The name of the `i`th transition SPP: A to Z, then A1 to Z1, and so on. */
+  private def transitionName(i: Int) =
+    (i % 26 + 'A').toChar.toString + (if i >= 26 then (i / 26).toString else "")
+
+  /** Builds a graph visualization of the automaton for a NetKAT expression, breadth-first from `e0`. States more than `Options.vizDepth` transitions from `e0`, and those after the first `Options.vizNodes`, are drawn as summary nodes and not expanded. Each SPP that labels a drawn transition gets its own graph. */
   def vizNK(path: String, e0: NK) =
-    val seen = scala.collection.mutable.Set[NK]()
-    val spps = scala.collection.mutable.Map[SPP, String]()
-    def gensym(spp: SPP) =
-      // create a letter in the alphabet
-      spps.getOrElseUpdate(spp, (spps.size + 'A').toChar.toString)
-    def iter(e: NK): Unit = {
-      if seen.contains(e) then return
-      seen += e
-      GV.automatonNode(e, gensym(Bisim.ε(e)), e == e0)
-      for (e2, spp) <- Bisim.δ(e) do
-        iter(e2)
-        GV.edgeNK(e, e2, gensym(spp))
+    val spps = mutable.LinkedHashMap[SPP, String]()
+    def gensym(spp: SPP) = spps.getOrElseUpdate(spp, transitionName(spps.size))
+    val depth = mutable.HashMap(e0 -> 0)
+    val queue = mutable.Queue(e0)
+    var expanded = 0
+    graph(path + "/automaton") {
+      var summarized = 0
+      while queue.nonEmpty do
+        val e = queue.dequeue()
+        if depth(e) < Options.vizDepth && expanded < Options.vizNodes then
+          expanded += 1
+          GV.automatonNode(e, gensym(Bisim.ε(e)), e == e0)
+          for (e2, spp) <- Bisim.δ(e) do
+            if !depth.contains(e2) then
+              depth(e2) = depth(e) + 1
+              queue.enqueue(e2)
+            GV.edgeNK(e, e2, gensym(spp))
+        else
+          summarized += 1
+          summaryNode(e, "⋯")
+      if summarized > 0 then truncated(s"$summarized reached states and those beyond them", "--viz-depth and --viz-nodes")
     }
-    iter(e0)
-    GV.save(path + "/automaton")
-    GV.reset()
     for (spp, name) <- spps do
-      GV.vizSPP(spp)
-      GV.save(s"$path/transition${name}")
-      GV.reset()
+      graph(s"$path/transition${name}")(GV.vizSPP(spp))
       SPP.toSP(spp) match
-        case Some(sp) =>
-          GV.vizSP(sp)
-          GV.save(s"$path/transition${name}_SP")
-          GV.reset()
+        case Some(sp) => graph(s"$path/transition${name}_SP")(GV.vizSP(sp))
         case None => ()
 
   def output() =
@@ -153,19 +213,39 @@ ${sb.toString()}
     sb.clear()
     text
 
-  /** Run dot to generate a pdf and write the pdf to disk. */
-  def save(file: String) =
-    import java.io.File
-    import java.time.Instant
+  private var renderPool: ExecutorService = null
+  private val renders = new ConcurrentLinkedQueue[Future[?]]()
 
+  /** Runs dot on `file.gv` to generate a pdf (and the laid-out graph, for tikz), on the background pool unless `Options.vizJobs` is 0. */
+  def render(file: String) =
+    val job: Runnable = () => {
+      import sys.process._
+      s"dot -Tpdf $file.gv -o ${file}.pdf".!
+      // output tikz
+      s"dot $file.gv -o ${file}.tikz".!
+    }
+    if Options.vizJobs == 0 then job.run()
+    else
+      synchronized {
+        if renderPool == null then
+          renderPool = Executors.newFixedThreadPool(
+            Options.vizJobs,
+            r => { val t = new Thread(r, "graphviz"); t.setDaemon(true); t }
+          )
+      }
+      renders.add(renderPool.submit(job))
+
+  /** Waits until all graphs that have been handed to `render` are rendered. */
+  def awaitRenders() =
+    while !renders.isEmpty do renders.poll().get()
+
+  /** Write the buffered graph to disk and render it. */
+  def save(file: String) =
     val text = output()
     val pw = new java.io.PrintWriter(s"$file.gv")
     pw.write(text)
     pw.close()
-    import sys.process._
-    s"dot -Tpdf $file.gv -o ${file}.pdf".!
-    // output tikz
-    s"dot $file.gv -o ${file}.tikz".!
+    render(file)
 
   def saveNK(path: String, e: NK) =
     reset()